@@ -1,23 +1,57 @@
-import json
+import asyncio
 import os
 import time
-import ssl
-import smtplib
-import certifi
 import html
 
 from email.message import EmailMessage
 from email.utils import make_msgid
 
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
-from urllib.request import Request, urlopen
 
 from collections import defaultdict
 
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 from rich.progress import Progress, BarColumn, TimeElapsedColumn, TextColumn, TimeRemainingColumn
 from rich.console import Console
 
+from trendyol_baseline_index import PROJECTION, load_baseline, project_product
+from trendyol_images import fetch_images, fetch_thumbnail
+from trendyol_metrics import metrics, observe, scope, scoped, span
+from trendyol_outbox import Outbox
+from trendyol_output import NdjsonWriter, write_json_atomic
+from trendyol_planner import (
+    listing_fingerprint,
+    plan_listing,
+    remember_fingerprint,
+    should_skip,
+    verify_with_client,
+)
+from trendyol_ratelimit import expose_limiter, shared_limiter
+from trendyol_routes import RoutePolicy, install_blocking
+from trendyol_store import HISTORY_RETENTION_DAYS, open_store
+from trendyol_http import (
+    API_EXTRA_PARAMS,
+    BLOCK_RESOURCES,
+    HOME_URL,
+    MAX_MISSING_PAGES,
+    PAGE_RETRIES,
+    RETRY_BASE_S,
+    RETRY_CAP_S,
+    ApiClient,
+    ListingFetchError,
+    accept_cookies,
+    aiter_in_thread,
+    browser_session,
+    discard_storage_state,
+    is_blocked,
+    listing_coverage,
+    load_cookies,
+    load_storage_state,
+    open_session_page,
+    save_storage_state,
+    warm_up_cookies,
+)
+
 
 # ========== CONFIG ==========
 
@@ -32,11 +66,32 @@ MIN_DROP_PERCENT = 25.0
 WELCOME_DISCOUNT_PERCENT = 30.0  
 MIN_PRICE_LINK = 130
 
+# listingurile sunt sortate PRICE_BY_ASC: paginarea se oprește la prima pagină al cărei
+# preț minim depășește plafonul (vezi price_ceiling); SLACK acoperă mici diferențe de sortare
+PRICE_CEILING_PRUNING = True
+PRICE_CEILING_SLACK = 1.10
+
+# același plafon împins în query (prc=<min>-<plafon>), verificat zilnic față de listingul nelimitat
+PRICE_PUSHDOWN = True
+
+# probă pe pagina 1: categoria e sărită dacă (id, preț) din pagina 1 nu s-au schimbat
+# (rulare completă forțată la fiecare FULL_REFRESH_EVERY rulări, vezi trendyol_planner)
+SKIP_UNCHANGED = True
+
 COOLDOWN_HOURS = 1
 COOLDOWN_SECONDS = int(COOLDOWN_HOURS * 3600)
 
 STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
 
+# fereastra istoricului de prețuri (state/trendyol.db) afișată lângă fiecare hit
+HISTORY_DAYS = 30
+
+# "ndjson": price_changes_/missing_{label}.ndjson scrise în flux (un obiect pe linie)
+# "json": fișierele .json indentate, ca înainte (scrise atomic)
+OUTPUT_FORMAT = "ndjson"
+# doar intrările al căror status/preț diferă de rularea anterioară (doar pentru ndjson)
+OUTPUT_DELTA = True
+
 EXCLUDED_KEYWORDS = {
     "șlapi",
     "fălapi",
@@ -61,8 +116,30 @@ EMAIL_USER = "bluegaming764@gmail.com"
 EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD", "")
 EMAIL_FROM = EMAIL_USER
 
+# imaginile inline sunt micșorate la lățimea afișată în email (px)
+INLINE_IMAGE_WIDTH = 150
+
+# la anularea rulării: cât așteptăm mesajul aflat în trimitere (secunde)
+OUTBOX_ABORT_TIMEOUT = 30
+
+# hit-urile din paginile sosite în fereastra asta (secunde) pleacă într-un singur email per categorie
+EMAIL_DEBOUNCE_SECONDS = 3.0
+
 API_BASE = "https://apigw.trendyol.com/discovery-sfint-search-service/api/search/products"
 
+# câte pagini API sunt în zbor simultan; ritmul vine din limiter-ul comun (trendyol_ratelimit)
+PAGE_FETCH_CONCURRENCY = 6
+MAX_API_PAGES = 200
+
+# client HTTP direct (fără Chromium); browserul rămâne doar fallback pe 403/429
+DIRECT_API_MODE = True
+
+# câte categorii rulează în paralel (câte o pagină Playwright fiecare)
+CATEGORY_WORKERS = 3
+
+# sub acest procent de pagini primite categoria e eșec, nu rezultat parțial
+MIN_COVERAGE = 0.75
+
 TRACKED_SIZES = {"41", "41.5", "42", "42.5", "43", "43.5", "44", "44.5", "45"}
 
 
@@ -116,50 +193,10 @@ def extract_image_url(p: dict):
     return None
 
 
-def download_image_bytes(url: str):
-    """
-    Download imaginea ca bytes + content-type, pentru CID inline.
-    """
-    try:
-        req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-        with urlopen(req, timeout=20) as r:
-            data = r.read()
-            ctype = r.headers.get_content_type()  # ex: image/jpeg
-            return data, ctype
-    except Exception:
-        return None, None
-
-
 # ============================================================
 #  BRAND / PRICE HELPERS
 # ============================================================
 
-def _ensure_state_dir():
-    os.makedirs(STATE_DIR, exist_ok=True)
-
-def _cache_path(label: str) -> str:
-    _ensure_state_dir()
-    safe = "".join(c for c in label if c.isalnum() or c in ("_", "-")).strip()
-    return os.path.join(STATE_DIR, f"sent_cache_{safe}.json")
-
-def load_sent_cache(label: str) -> dict:
-    path = _cache_path(label)
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, dict) else {}
-    except FileNotFoundError:
-        return {}
-    except Exception:
-        return {}
-
-def save_sent_cache(label: str, cache: dict) -> None:
-    path = _cache_path(label)
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
-
 def apply_cooldown_filter(hits: list, label: str) -> list:
     """
     Trimite un produs doar dacă:
@@ -170,16 +207,23 @@ def apply_cooldown_filter(hits: list, label: str) -> list:
     if not hits:
         return hits
 
+    with span("cooldown"):
+        return _cooldown_filter(hits, label)
+
+
+def _cooldown_filter(hits: list, label: str) -> list:
     now = int(time.time())
-    cache = load_sent_cache(label)
+    store = open_store(STATE_DIR)
 
-    filtered = []
-    for it in hits:
-        key = str(it.get("model_id") or it.get("url") or it.get("name"))
-        prev = cache.get(key)
+    keyed = [(str(it.get("model_id") or it.get("url") or it.get("name")), it) for it in hits]
+    # doar cheile din hit-uri, pe cheia primară (label, model_id)
+    sent_before = store.get_sent(label, (key for key, _ in keyed))
 
-        last_ts = int(prev.get("ts", 0)) if isinstance(prev, dict) else 0
-        last_price = float(prev.get("new_price", -1)) if isinstance(prev, dict) else -1
+    filtered = []
+    sent_now = {}
+    for key, it in keyed:
+        prev = sent_before.get(key)
+        last_ts, last_price = prev if prev else (0, -1)
 
         price_now = float(it.get("new_price", -1))
 
@@ -191,13 +235,13 @@ def apply_cooldown_filter(hits: list, label: str) -> list:
 
         if should_send:
             filtered.append(it)
-            cache[key] = {"ts": now, "new_price": price_now}
+            sent_now[key] = (key, now, price_now)
+            sent_before[key] = (now, price_now)
 
-    # curățare: șterge intrări foarte vechi (ex: > 14 zile) ca să nu crească la infinit
-    cutoff = now - 14 * 24 * 3600
-    cache = {k: v for k, v in cache.items() if isinstance(v, dict) and int(v.get("ts", 0)) >= cutoff}
+    store.mark_sent(label, sent_now.values())
 
-    save_sent_cache(label, cache)
+    # curățare: șterge intrări foarte vechi (ex: > 14 zile), delete pe indexul de ts
+    store.evict_sent(now - 14 * 24 * 3600)
 
     if len(filtered) != len(hits):
         print(f"🕒 Cooldown: {len(hits) - len(filtered)} item(s) skipped in [{label}]")
@@ -308,13 +352,25 @@ def clean_product_url(url: str):
 #  EMAIL (HTML + CID images)
 # ============================================================
 
-def send_email(hits, label, price_threshold):
-    if not EMAIL_ENABLED or not hits:
-        return
-    if not EMAIL_PASSWORD:
-        print("⚠ EMAIL password missing (set GMAIL_APP_PASSWORD env var)")
-        return
+def history_text(item) -> str:
+    h = item.get("history")
+    if not h:
+        return ""
+    return f"  {h['days']}d LOW: {h['lowest']} Lei | MEDIAN: {h['median']} Lei\n"
+
 
+def history_html(item) -> str:
+    h = item.get("history")
+    if not h:
+        return ""
+    return f"<b>{h['days']}d LOW:</b> {h['lowest']} Lei &nbsp; <b>MEDIAN:</b> {h['median']} Lei<br>"
+
+
+def build_email(hits, label, price_threshold, images=None):
+    """
+    `images` (opțional): url -> (bytes, content-type) deja descărcate,
+    ca să nu mai descărcăm serial aici (vezi send_email_async).
+    """
     subject = f"🟢 Trendyol drops under {price_threshold} Lei [{label}]"
 
     # -------- plain text fallback --------
@@ -333,6 +389,7 @@ def send_email(hits, label, price_threshold):
                 f"- {it['name']}\n"
                 f"  NEW: {it['new_price']} Lei | OLD: {it['old_price']} Lei\n"
                 f"  DROP: {it['drop_amount']} Lei ({it['drop_percent']}%)\n"
+                f"{history_text(it)}"
                 f"  URL: {it['url']}\n"
             )
     plain_text = "\n".join(text_lines)
@@ -356,7 +413,10 @@ def send_email(hits, label, price_threshold):
 
             # încercăm să o includem inline (CID)
             if isinstance(img_url, str) and img_url.startswith("https://"):
-                img_bytes, ctype = download_image_bytes(img_url)
+                if images is not None:
+                    img_bytes, ctype = images.get(img_url) or (None, None)
+                else:
+                    img_bytes, ctype = fetch_thumbnail(img_url, INLINE_IMAGE_WIDTH)
                 if img_bytes and ctype and ctype.startswith("image/"):
                     maintype, subtype = ctype.split("/", 1)
                     cid = make_msgid()  # '<...@...>'
@@ -365,7 +425,7 @@ def send_email(hits, label, price_threshold):
 
                     img_html = (
                         f"<img src=\"cid:{cid_ref}\" "
-                        f"style=\"width:150px;display:block;margin-bottom:6px;\">"
+                        f"style=\"width:{INLINE_IMAGE_WIDTH}px;display:block;margin-bottom:6px;\">"
                     )
 
             name_html = html.escape(item["name"])
@@ -379,6 +439,7 @@ def send_email(hits, label, price_threshold):
                     <b>NEW:</b> {item['new_price']} Lei &nbsp;
                     <b>OLD:</b> {item['old_price']} Lei<br>
                     <b>DROP:</b> {item['drop_amount']} Lei ({item['drop_percent']}%)<br>
+                    {history_html(item)}
                     <a href="{url_html}">Open product</a>
                 </div>
                 """
@@ -390,13 +451,54 @@ def send_email(hits, label, price_threshold):
     for cid, data, maintype, subtype in attachments:
         html_part.add_related(data, maintype=maintype, subtype=subtype, cid=cid)
 
-    ctx = ssl.create_default_context(cafile=certifi.where())
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls(context=ctx)
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
+    return msg
+
 
-    print(f"📧 Email sent for category [{label}] (items={len(hits)})")
+def open_outbox():
+    """
+    Outbox pornit (spool în state/outbox + worker SMTP), sau None dacă emailul e oprit.
+    """
+    if not EMAIL_ENABLED or not EMAIL_PASSWORD:
+        return None
+    return Outbox(SMTP_SERVER, SMTP_PORT, EMAIL_USER, EMAIL_PASSWORD).start()
+
+
+def send_email(hits, label, price_threshold, images=None, outbox=None):
+    """
+    Mesajul intră în outbox-ul durabil; cu `outbox` dat, trimiterea se face
+    în fundal, altfel se folosește un outbox local golit înainte de return.
+    """
+    if not EMAIL_ENABLED or not hits:
+        return
+    if not EMAIL_PASSWORD:
+        print("⚠ EMAIL password missing (set GMAIL_APP_PASSWORD env var)")
+        return
+
+    msg = build_email(hits, label, price_threshold, images)
+
+    if outbox is not None:
+        outbox.submit(msg, label)
+        print(f"📨 Email queued for category [{label}] (items={len(hits)})")
+        return
+
+    with open_outbox() as local_outbox:
+        local_outbox.submit(msg, label)
+
+
+async def send_email_async(hits, label, price_threshold, outbox=None):
+    """
+    Imaginile vin în paralel din cache-ul comun (state/image_cache), apoi mesajul
+    e pus în outbox; SMTP-ul rulează pe worker-ul outbox-ului, nu pe drumul critic.
+    """
+    images = None
+    if EMAIL_ENABLED and hits and EMAIL_PASSWORD:
+        urls = [
+            it["image"] for it in hits
+            if isinstance(it.get("image"), str) and it["image"].startswith("https://")
+        ]
+        images = await asyncio.to_thread(fetch_images, urls, width=INLINE_IMAGE_WIDTH)
+
+    await asyncio.to_thread(send_email, hits, label, price_threshold, images, outbox)
 
 
 # ============================================================
@@ -419,145 +521,482 @@ def extract_query_params(url: str):
     return dict(parse_qsl(parsed.query))
 
 
-def accept_cookies(page):
-    for sel in [
-        "//button[contains(., 'Accept')]",
-        "//button[contains(., 'Acceptați')]",
-        "//button[contains(., 'Accept toate')]",
-        "//button[contains(., 'Accept all')]",
-    ]:
-        try:
-            page.locator(sel).click(timeout=2000)
-            time.sleep(0.2)
-            return
-        except Exception:
-            pass
-
-
 # ============================================================
-#  SUPER-FAST PLAYWRIGHT FETCH (parallel 3×)
+#  SUPER-FAST PLAYWRIGHT FETCH (windowed, parallel pages)
 # ============================================================
 
-def fetch_new_products_via_page_fetch(page, listing_url: str):
-    params_base = extract_query_params(listing_url)
+# Job-ul nu întoarce listingul ci un "stream": paginile sunt emise în ordine,
+# reduse per model, imediat ce prefixul continuu e complet; Python le ia cu drain().
+LISTING_FETCH_JS = r"""
+({ apiBase, baseParams, extraParams, concurrency, maxPages, projection, stopAbove,
+   retries, retryBaseMs, retryCapMs, maxMissing }) => {
+  const paramsBase = new URLSearchParams();
+  Object.entries(baseParams).forEach(([k, v]) => {
+    if (v != null) paramsBase.append(k, v);
+  });
+
+  const sleep = (ms) => new Promise(r => setTimeout(r, ms));
+
+  // limiter-ul comun din Python (trendyol_ratelimit.expose_limiter); lipsă = fără pacing
+  const acquire = globalThis.__tyAcquire || (async () => {});
+  const feedback = globalThis.__tyFeedback || (() => {});
+
+  // proiecție pe câmpurile folosite la diff (PROJECTION din trendyol_baseline_index)
+  function project(p) {
+    const out = {};
+    for (const [key, sub] of Object.entries(projection)) {
+      const v = p[key];
+      if (v == null) continue;
+      if (sub === null) {
+        out[key] = v;
+      } else if (sub === "first") {
+        if (Array.isArray(v) && v.length) out[key] = v.slice(0, 1);
+      } else if (typeof v === "object") {
+        const nested = {};
+        let any = false;
+        for (const k of sub) {
+          if (v[k] != null) { nested[k] = v[k]; any = true; }
+        }
+        if (any) out[key] = nested;
+      }
+    }
+    return out;
+  }
+
+  // port 1:1 al parse_price_value / get_effective_price / get_model_id
+  function parsePrice(v) {
+    if (v == null) return null;
+    if (typeof v === "number") return v;
+    let s = String(v).replace(/Lei/g, "").trim().replace(/ /g, "");
+    if (s.includes(",") && s.includes(".")) {
+      s = s.replace(/\./g, "").replace(/,/g, ".");
+    } else {
+      s = s.replace(/,/g, ".");
+    }
+    if (s === "") return null;
+    const n = Number(s);
+    return Number.isFinite(n) ? n : null;
+  }
+
+  function effectivePrice(p) {
+    const rrp = p.recommendedRetailPrice || {};
+    const pb = p.price || {};
+    const sp = p.singlePrice || {};
+    const bp = p.binaryPrice || {};
+    const candidates = [
+      rrp.discountedPromotionPriceNumerized,
+      pb.discountedPrice,
+      parsePrice(sp.salePriceWihoutCurrency || sp.salePrice),
+      parsePrice(bp.salePriceWihoutCurrency || bp.salePrice),
+      rrp.sellingPriceNumerized,
+      pb.current,
+    ];
+    for (const c of candidates) {
+      if (c == null) continue;
+      const val = parsePrice(c);
+      if (val !== null) return val;
+    }
+    return null;
+  }
+
+  const modelId = (p) => p.contentId || p.id || p.groupId;
+
+  async function fetchPage(pi) {
+    const params = new URLSearchParams(paramsBase);
+    params.set("pi", String(pi));
+    Object.entries(extraParams).forEach(([k, v]) => params.set(k, v));
+
+    const url = apiBase + "?" + params.toString();
+    const started = performance.now();
+
+    let resp;
+    try {
+      resp = await fetch(url, {
+        credentials: "include",
+        headers: {
+          "accept": "application/json, text/plain, */*",
+          "accept-language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
+          "x-country-code": "RO",
+        }
+      });
+    } catch (e) {
+      // aici e cazul tău: Failed to fetch
+      return { products: [], next: false, total: 0, status: -1, error: String(e), ms: performance.now() - started };
+    }
 
-    page.goto(listing_url, timeout=120000, wait_until="domcontentloaded")
-    page.wait_for_timeout(1500)
-    accept_cookies(page)
-    page.wait_for_timeout(800)
+    if (!resp.ok) {
+      let txt = "";
+      try { txt = await resp.text(); } catch (e) {}
+      return {
+        products: [], next: false, total: 0, status: resp.status, error: (txt || "").slice(0, 300),
+        ms: performance.now() - started, bytes: txt.length,
+      };
+    }
 
-    js = r"""
-    async ({ apiBase, baseParams }) => {
-      const paramsBase = new URLSearchParams();
-      Object.entries(baseParams).forEach(([k, v]) => {
-        if (v != null) paramsBase.append(k, v);
-      });
-    
-      async function fetchPage(pi) {
-        const params = new URLSearchParams(paramsBase);
-        params.set("pi", String(pi));
-        params.set("culture", "ro-RO");
-        params.set("storefrontId", "29");
-        params.set("channelId", "1");
-        params.set("pathModel", "sr");
-        params.set("countryCode", "RO");
-        params.set("language", "ro");
-
-        const url = apiBase + "?" + params.toString();
-    
-        let resp;
-        try {
-          resp = await fetch(url, {
-            credentials: "include",
-            headers: {
-              "accept": "application/json, text/plain, */*",
-              "accept-language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
-              "x-country-code": "RO",
-            }
-          });
-        } catch (e) {
-          // aici e cazul tău: Failed to fetch
-          return { products: [], next: false, status: -1, error: String(e) };
-        }
-    
-        if (!resp.ok) {
-          let txt = "";
-          try { txt = await resp.text(); } catch (e) {}
-          return { products: [], next: false, status: resp.status, error: (txt || "").slice(0, 300) };
+    // corpul și parsarea separat: latența paginii și timpul de decodare apar distinct în metrici
+    let txt;
+    try {
+      txt = await resp.text();
+    } catch (e) {
+      return { products: [], next: false, total: 0, status: -1, error: String(e), ms: performance.now() - started };
+    }
+    const ms = performance.now() - started;
+
+    let data, decodeMs;
+    try {
+      const t0 = performance.now();
+      data = JSON.parse(txt);
+      decodeMs = performance.now() - t0;
+    } catch (e) {
+      return { products: [], next: false, total: 0, status: -1, error: String(e), ms, bytes: txt.length };
+    }
+    const arr = data.products || [];
+    const hasNext = !!(data._links && data._links.next);
+    const total = Number(
+      data.totalCount ?? data.total ?? data.productCount ?? (data._meta && data._meta.totalCount) ?? 0
+    ) || 0;
+
+    return { products: arr, next: hasNext, total, status: 200, error: "", ms, bytes: txt.length, decodeMs };
+  }
+
+  const stream = {
+    ready: [], done: false, status: 200, error: "", rawCount: 0, stoppedAt: null, wake: null,
+    pagesOk: 0, missingPages: [], retries: 0, log: [],
+  };
+
+  // în browser nu mai e alt fallback, deci și 429 se reîncearcă
+  const retryable = (s) => s === -1 || s === 408 || s === 429 || s >= 500;
+
+  // retry doar pentru pagina eșuată: backoff exponențial, jumătate fix + jumătate jitter
+  async function fetchPageRetry(pi) {
+    for (let attempt = 0; ; attempt++) {
+      await acquire();
+      const b = await fetchPage(pi);
+      feedback(b.status);
+      // fiecare încercare, pentru metricile din Python (record_page_log)
+      stream.log.push({ status: b.status, ms: b.ms || 0, bytes: b.bytes || 0, decodeMs: b.decodeMs });
+      if (b.status === 200 || attempt >= retries || !retryable(b.status)) return b;
+      stream.retries += 1;
+      const d = Math.min(retryCapMs, retryBaseMs * 2 ** attempt);
+      await sleep(d / 2 + Math.random() * d / 2);
+    }
+  }
+
+  function wakeUp() {
+    if (stream.wake) {
+      const w = stream.wake;
+      stream.wake = null;
+      w();
+    }
+  }
+
+  // așteaptă cel puțin o pagină nouă (sau finalul) și le predă pe toate cele gata
+  stream.drain = async () => {
+    while (!stream.ready.length && !stream.done) {
+      await new Promise(r => { stream.wake = r; });
+    }
+    const out = stream.ready;
+    const log = stream.log;
+    stream.ready = [];
+    stream.log = [];
+    return {
+      pages: out, done: stream.done, status: stream.status, error: stream.error,
+      rawCount: stream.rawCount, stoppedAt: stream.stoppedAt,
+      pagesOk: stream.pagesOk, missingPages: stream.missingPages, retries: stream.retries, log,
+    };
+  };
+
+  // pi -> products; pagini primite în orice ordine, emise doar în ordine
+  const pages = new Map();
+  const nextFlags = new Map();
+  const emitted = new Map();  // modelId -> cel mai mic preț deja trimis
+  let emitCursor = 1;
+  let failed = null;
+
+  function accept(pi, products, hasNext, ok = true) {
+    pages.set(pi, products);
+    nextFlags.set(pi, hasNext);
+    if (ok) stream.pagesOk += 1;
+
+    while (pages.has(emitCursor)) {
+      // cea mai ieftină variantă per model din pagină, trimisă doar dacă bate ce s-a emis deja
+      const best = new Map();
+      let pageMin = null;
+      for (const p of pages.get(emitCursor)) {
+        stream.rawCount += 1;
+        const price = effectivePrice(p);
+        if (price !== null && (pageMin === null || price < pageMin)) pageMin = price;
+        const id = modelId(p);
+        if (!id) continue;
+        if (price === null) continue;
+        const cur = best.get(id);
+        if (!cur || price < cur.price) best.set(id, { p, price });
+      }
+      const batch = [];
+      for (const [id, e] of best) {
+        const prev = emitted.get(id);
+        if (prev === undefined || e.price < prev) {
+          emitted.set(id, e.price);
+          batch.push(project(e.p));
         }
-    
-        const data = await resp.json();
-        const arr = data.products || [];
-        const hasNext = !!(data._links && data._links.next);
-    
-        return { products: arr, next: hasNext, status: 200, error: "" };
       }
-    
-      let all = [];
-      let pageIndex = 1;
-    
-      while (true) {
-        const b = await fetchPage(pageIndex);
-    
+      pages.delete(emitCursor);
+      stream.ready.push(batch);
+      // plafon de preț: nicio pagină nouă după prima care îl depășește
+      if (stopAbove != null && pageMin !== null && pageMin > stopAbove && stream.stoppedAt === null) {
+        stream.stoppedAt = emitCursor;
+      }
+      emitCursor += 1;
+    }
+    wakeUp();
+  }
+
+  // pagină pierdută după retry-uri: trece ca pagină goală, restul listingului continuă.
+  // Peste maxMissing pagini pierdute listingul e eșuat.
+  function skip(pi, b) {
+    if (stream.missingPages.length >= maxMissing) {
+      if (failed === null || pi < failed.pi) failed = { pi, status: b.status, error: b.error || "" };
+      return false;
+    }
+    stream.missingPages.push(pi);
+    accept(pi, [], false, false);
+    return true;
+  }
+
+  async function run() {
+    const first = await fetchPageRetry(1);
+    if (first.status !== 200) {
+      failed = { pi: 1, status: first.status, error: first.error || "" };
+      return;
+    }
+    accept(1, first.products, first.next);
+    if (stream.stoppedAt !== null) return;
+
+    // planificăm toate paginile din totalul raportat de prima pagină
+    let lastPlanned = 1;
+    if (first.next && first.total > 0 && first.products.length > 0) {
+      lastPlanned = Math.min(maxPages, Math.ceil(first.total / first.products.length));
+    }
+
+    let cursor = 2;
+    async function worker() {
+      while (failed === null && stream.stoppedAt === null && cursor <= lastPlanned) {
+        const pi = cursor++;
+        const b = await fetchPageRetry(pi);
         if (b.status !== 200) {
-          return { status: b.status, error: b.error || "", products: all };
+          if (!skip(pi, b)) return;
+        } else {
+          accept(pi, b.products, b.next);
         }
-    
-        all = all.concat(b.products);
-    
-        if (!b.next) break;
-    
-        pageIndex += 1;
-        if (pageIndex > 200) break;
-    
-        // mic delay anti-rate-limit
-        await new Promise(r => setTimeout(r, 200));
       }
-    
-      return { status: 200, error: "", products: all };
     }
+
+    if (lastPlanned > 1) {
+      const slots = Math.min(concurrency, lastPlanned - 1);
+      await Promise.all(Array.from({ length: slots }, () => worker()));
+    }
+
+    // totalul poate fi subestimat: continuăm secvențial cât timp API-ul mai are "next"
+    let pageIndex = lastPlanned;
+    while (failed === null && stream.stoppedAt === null && nextFlags.get(pageIndex) && pageIndex < maxPages) {
+      pageIndex += 1;
+      const b = await fetchPageRetry(pageIndex);
+      if (b.status !== 200) {
+        // fără pagina asta nu știm dacă mai urmează ceva: coada secvențială se oprește
+        skip(pageIndex, b);
+        break;
+      }
+      accept(pageIndex, b.products, b.next);
+    }
+  }
+
+  (async () => {
+    try {
+      await run();
+    } catch (e) {
+      failed = failed || { pi: emitCursor, status: -1, error: String(e) };
+    }
+    if (failed !== null) {
+      stream.status = failed.status;
+      stream.error = failed.error;
+    }
+    stream.done = true;
+    wakeUp();
+  })();
+
+  return stream;
+}
+"""
+
+
+async def start_listing_fetch(page, listing_url: str, stop_above=None, has_session=False):
+    """
+    Pornește job-ul JS în pagină, fără să-l aștepte.
+    Paginile se iau cu iter_listing_pages(); între timp pagina
+    descarcă singură, deci mai multe pagini pot lucra în paralel.
+    `stop_above`: plafonul de preț (price_ceiling), None = toate paginile.
+    `has_session`: contextul vine din storage_state -> fără navigare pe listing.
     """
+    params_base = extract_query_params(listing_url)
 
+    if has_session:
+        await open_session_page(page)
+    else:
+        with span("navigation"):
+            await page.goto(listing_url, timeout=120000, wait_until="domcontentloaded")
+        await accept_cookies(page)
+
+    await page.evaluate(
+        "(args) => { window.__tyListing = (" + LISTING_FETCH_JS + ")(args); }",
+        {
+            "apiBase": API_BASE,
+            "baseParams": params_base,
+            "extraParams": API_EXTRA_PARAMS,
+            "concurrency": PAGE_FETCH_CONCURRENCY,
+            "maxPages": MAX_API_PAGES,
+            "projection": PROJECTION,
+            "stopAbove": stop_above,
+            "retries": PAGE_RETRIES,
+            "retryBaseMs": int(RETRY_BASE_S * 1000),
+            "retryCapMs": int(RETRY_CAP_S * 1000),
+            "maxMissing": MAX_MISSING_PAGES,
+        },
+    )
+
+
+async def iter_listing_pages(page, listing_url: str, source: str = "FAST API", stats=None):
+    """
+    Generator async peste paginile job-ului pornit cu start_listing_fetch(), în ordine,
+    fiecare deja proiectată și redusă. Paginile pierdute după retry-uri vin ca pagini goale.
+    Ridică ListingFetchError dacă listingul eșuează (pagina 1 sau prea multe pagini pierdute;
+    paginile bune dinainte au fost deja livrate).
+    `stats` (dict, opțional) primește aceleași chei ca ApiClient.iter_listing.
+    """
+    stats = stats if stats is not None else {}
+    while True:
+        chunk = await page.evaluate("() => window.__tyListing.drain()")
+        record_page_log(chunk.get("log"))
+        for batch in chunk.get("pages") or []:
+            yield batch
+
+        stats["raw_count"] = chunk.get("rawCount", 0)
+        stats["stopped_at"] = chunk.get("stoppedAt")
+        stats["pages_ok"] = chunk.get("pagesOk", 0)
+        stats["missing_pages"] = chunk.get("missingPages") or []
+        stats["retries"] = chunk.get("retries", 0)
+
+        if chunk.get("done"):
+            status = chunk.get("status", 200)
+            if status != 200:
+                print(f"[{source} ERROR] status={status} url={listing_url}")
+                print(f"[{source} ERROR] snippet={chunk.get('error','')}")
+                raise ListingFetchError(status, chunk.get("error", ""))
+            print(f"[{source}] {listing_url} → {chunk.get('rawCount', 0)} products")
+            if chunk.get("stoppedAt"):
+                print(f"[{source}] price ceiling reached at page {chunk['stoppedAt']}, paging stopped")
+            report_missing_pages(source, listing_url, stats)
+            return
 
-    result = page.evaluate(js, {"apiBase": API_BASE, "baseParams": params_base})
-    status = result.get("status", 200)
-    if status != 200:
-        print(f"[FAST API ERROR] status={status} url={listing_url}")
-        print(f"[FAST API ERROR] snippet={result.get('error','')}")
-        raise RuntimeError(f"API blocked/failed (status={status})")
 
-    products = result.get("products", [])
+def record_page_log(log):
+    """
+    Încercările raportate de job-ul JS (latență, bytes, status, decodare) -> aceleași
+    span-uri ca la ApiClient: api_page și json_decode.
+    """
+    for e in log or ():
+        status = e.get("status")
+        observe("api_page", (e.get("ms") or 0) / 1000, status=status, nbytes=e.get("bytes") or 0, error=status != 200)
+        if e.get("decodeMs") is not None:
+            observe("json_decode", e["decodeMs"] / 1000)
 
-    print(f"[FAST API] {listing_url} → {len(products)} products")
-    return products
 
+def report_missing_pages(source, listing_url, stats):
+    if stats.get("missing_pages"):
+        print(
+            f"[{source}] {listing_url} → PARTIAL: pages {stats['missing_pages']} lost after retries "
+            f"(coverage {listing_coverage(stats):.0%}, {stats.get('retries', 0)} retries)"
+        )
 
-# ============================================================
-#  SINGLE CATEGORY
-# ============================================================
 
-def main_single(products_file, listing_url, label, price_threshold, progress=None, page=None):
+def baseline_path(products_file: str) -> str:
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    path = os.path.join(script_dir, products_file)
+    return os.path.join(script_dir, products_file)
 
-    with open(path, "r", encoding="utf-8") as f:
-        old_products = json.load(f)
 
-    old_products_list = [p for p in old_products if get_model_id(p)]
-    total = len(old_products_list)
+def price_ceiling(old_products, price_threshold):
+    """
+    Cel mai mare preț de listing (fără cod) care mai poate conta: un hit cere
+    preț redus <= price_threshold, iar o scădere cere preț redus < prețul din baseline.
+    Peste max(prag, maxim baseline) / (1 - cod) nu mai poate apărea nici una.
+    None dacă pruning-ul e oprit sau baseline-ul nu are prețuri.
+    """
+    if not PRICE_CEILING_PRUNING:
+        return None
+    prices = [pr for pr in (get_effective_price(p) for p in old_products) if pr is not None]
+    if not prices:
+        return None
+    limit = max(price_threshold, max(prices)) / (1 - WELCOME_DISCOUNT_PERCENT / 100)
+    return round(limit * PRICE_CEILING_SLACK, 2)
+
+
+def planned_listing(label, listing_url, ceiling):
+    """
+    (url, verificare_scadentă) din trendyol_planner; listingul original dacă pushdown-ul e oprit.
+    """
+    if not PRICE_PUSHDOWN:
+        return listing_url, False
+    return plan_listing(f"compare:{label}", listing_url, ceiling)
+
+
+def page_min_price(products):
+    prices = [pr for pr in (get_effective_price(p) for p in products) if pr is not None]
+    return min(prices) if prices else None
+
+
+def stop_above(ceiling):
+    """
+    Predicat pentru ApiClient.iter_listing(stop_when=...): pagina e peste plafon.
+    """
+    if ceiling is None:
+        return None
+
+    def stop_when(products):
+        m = page_min_price(products)
+        return m is not None and m > ceiling
+
+    return stop_when
 
-    task_id = None
-    if progress:
-        task_id = progress.add_task(f"{label}", total=total)
 
-    start = time.perf_counter()
+def reduce_cheapest_per_model(products: list) -> list:
+    """
+    Echivalentul Python al reducerii din LISTING_FETCH_JS: cea mai ieftină
+    variantă per model, proiectată pe câmpurile folosite la diff.
+    """
+    best = {}
+    for p in products:
+        model_id = get_model_id(p)
+        if not model_id:
+            continue
+        price = get_effective_price(p)
+        if price is None:
+            continue
+        current = best.get(model_id)
+        if (not current) or (price < current["price"]):
+            best[model_id] = {"product": p, "price": price}
+    return [project_product(e["product"]) for e in best.values()]
 
-    new_products = fetch_new_products_via_page_fetch(page, listing_url)
 
-    # model_id -> cea mai ieftină variantă din listingul NOU
-    new_best_by_model = {}
+# ============================================================
+#  SINGLE CATEGORY
+# ============================================================
 
-    for p in new_products:
+def merge_page_into_best(new_best_by_model: dict, batch: list) -> list:
+    """
+    Actualizează model_id -> cea mai ieftină variantă cu o pagină nouă.
+    Întoarce model_id-urile care s-au schimbat (apărute acum sau mai ieftine).
+    """
+    changed = []
+    for p in batch:
         model_id = get_model_id(p)
         if not model_id:
             continue
@@ -569,17 +1008,125 @@ def main_single(products_file, listing_url, label, price_threshold, progress=Non
         current = new_best_by_model.get(model_id)
         if (not current) or (price < current["price"]):
             new_best_by_model[model_id] = {"product": p, "price": price}
+            changed.append(model_id)
+    return changed
 
-    hits = []
-    results = []
-    missing_products = []
 
-    for idx, old_p in enumerate(old_products_list, start=1):
-        if progress and task_id is not None:
-            progress.update(task_id, completed=idx)
+def diff_entry(model_id, old_p, display_name, url, new_entry, price_threshold):
+    """
+    Compară o intrare din baseline cu cea mai ieftină variantă din listingul nou.
+    None dacă lipsește prețul vechi.
+    """
+    new_p = new_entry["product"]
+
+    # imagine din NEW product (și normalizată)
+    image_url = extract_image_url(new_p)
+
+    old_price = get_effective_price(old_p)
+    new_price_raw = new_entry["price"]
+
+    # aplicăm cod bun venit (-30%)
+    new_price = round(new_price_raw * (1 - WELCOME_DISCOUNT_PERCENT / 100), 2)
+
+    if old_price is None or new_price is None:
+        return None
+
+    drop = old_price - new_price
+    drop_percent = (drop / old_price) * 100 if drop > 0 else 0.0
+
+    if new_price < old_price:
+        status = "hit" if (drop_percent >= MIN_DROP_PERCENT and new_price <= price_threshold) else "drop"
+    elif new_price > old_price:
+        status = "increase"
+    else:
+        status = "no_change"
+
+    old_size = normalize_size(old_p.get("variantValue"))
+    new_size = normalize_size(new_p.get("variantValue"))
+
+    # brand preferabil din new_p, fallback old_p/url
+    brand = extract_brand(new_p, url) or extract_brand(old_p, url)
+
+    entry = {
+        "model_id": model_id,
+        "brand": brand,
+        "name": display_name,
+        "url": url,
+        "image": image_url,
+        "old_price": old_price,
+        "new_price": new_price,
+        "drop_amount": round(drop, 2),
+        "drop_percent": round(drop_percent, 2),
+        "status": status,
+        "old_prices_per_size": {},
+        "new_prices_per_size": {},
+    }
+
+    # OLD size url
+    if old_size in TRACKED_SIZES and old_price is not None:
+        size_param_old = old_p.get("variantId") or old_p.get("variantValue") or old_size
+        entry["old_prices_per_size"][old_size] = {
+            "price": old_price,
+            "url": build_size_url(url, size_param_old),
+        }
+
+    # NEW size url
+    if new_size in TRACKED_SIZES and new_price is not None:
+        size_param_new = new_p.get("variantId") or new_p.get("variantValue") or new_size
+        entry["new_prices_per_size"][new_size] = {
+            "price": new_price,
+            "url": build_size_url(url, size_param_new),
+        }
+
+    return entry
+
+
+def attach_history(hits, label, now):
+    """
+    Adaugă la fiecare hit minimul și mediana din ultimele HISTORY_DAYS zile
+    (un singur lookup pe cheia primară pentru toată pagina), cu același cod de bun venit.
+    """
+    stats = open_store(STATE_DIR).price_stats(label, (h["model_id"] for h in hits), HISTORY_DAYS, now)
+    factor = 1 - WELCOME_DISCOUNT_PERCENT / 100
+    for h in hits:
+        st = stats.get(str(h["model_id"]))
+        if st:
+            h["history"] = {
+                "days": HISTORY_DAYS,
+                "lowest": round(st["lowest"] * factor, 2),
+                "median": round(st["median"] * factor, 2),
+                "samples": st["samples"],
+            }
+    return hits
+
+
+def record_history(state):
+    """
+    Istoric append-only: cel mai mic preț de listing per model din rularea asta.
+    """
+    rows = [
+        (model_id, normalize_size(e["product"].get("variantValue")), e["price"])
+        for model_id, e in state["new_best_by_model"].items()
+    ]
+    return open_store(STATE_DIR).record_prices(state["label"], state["run_ts"], rows)
+
 
-        model_id = get_model_id(old_p)
+def prepare_category(products_file, label, price_threshold, progress=None, old_products=None):
+    """
+    Starea diff-ului unei categorii: baseline indexat pe model_id
+    (intrările se rezolvă când apare modelul în listing) + cea mai ieftină
+    variantă nouă per model. `old_products`: baseline deja încărcat (opțional).
+    """
+    # sidecar compilat (doar câmpurile folosite la diff), refăcut când se schimbă JSON-ul
+    if old_products is None:
+        old_products = load_baseline(baseline_path(products_file))
+
+    old_products_list = [p for p in old_products if get_model_id(p)]
+    total = len(old_products_list)
 
+    # model_id -> intrările din baseline (idx, produs, nume, url)
+    old_by_model = defaultdict(list)
+    for idx, old_p in enumerate(old_products_list):
         display_name = old_p.get("name", "(no name)")
         name_lc = display_name.lower()
 
@@ -592,99 +1139,238 @@ def main_single(products_file, listing_url, label, price_threshold, progress=Non
             url = "https://www.trendyol.com" + url
 
         url = clean_product_url(url)
+        old_by_model[get_model_id(old_p)].append((idx, old_p, display_name, url))
 
-        new_entry = new_best_by_model.get(model_id)
-        if not new_entry:
-            missing_products.append({"key": model_id, "name": display_name, "url": url})
-            continue
+    task_id = None
+    if progress:
+        task_id = progress.add_task(f"{label}", total=total)
 
-        new_p = new_entry["product"]
+    writer = None
+    previous = {}
+    if OUTPUT_FORMAT == "ndjson":
+        writer = NdjsonWriter(f"price_changes_{label}.ndjson")
+        if OUTPUT_DELTA:
+            previous = open_store(STATE_DIR).load_diff_state(label)
 
-        # imagine din NEW product (și normalizată)
-        image_url = extract_image_url(new_p)
+    return {
+        "label": label,
+        "price_threshold": price_threshold,
+        "total": total,
+        "old_by_model": old_by_model,
+        "new_best_by_model": {},
+        "entries": {},  # idx din baseline -> entry
+        "progress": progress,
+        "task_id": task_id,
+        "start": time.perf_counter(),
+        "run_ts": int(time.time()),
+        "coverage": 1.0,
+        "writer": writer,
+        "previous": previous,
+        "emitted": set(),
+    }
 
-        old_price = get_effective_price(old_p)
-        new_price_raw = new_entry["price"]
 
-        # aplicăm cod bun venit (-30%)
-        new_price = round(new_price_raw * (1 - WELCOME_DISCOUNT_PERCENT / 100), 2)
+def diff_key(model_id, url) -> str:
+    return f"{model_id}|{url}"
 
-        if old_price is None or new_price is None:
-            continue
 
-        drop = old_price - new_price
-        drop_percent = (drop / old_price) * 100 if drop > 0 else 0.0
+def emit_entry(state, entry):
+    """
+    Scrie intrarea în NDJSON imediat ce e produsă; în modul delta doar dacă
+    statusul sau prețul diferă de rularea anterioară. O intrare rescrisă mai târziu
+    (model găsit mai ieftin pe o pagină următoare) o înlocuiește pe cea de dinainte,
+    deci odată scrisă, cheia e scrisă și la actualizări.
+    """
+    key = diff_key(entry["model_id"], entry["url"])
+    if OUTPUT_DELTA and key not in state["emitted"] and state["previous"].get(key) == (entry["status"], entry["new_price"]):
+        return
+    if TEST_HITS_MODE and state["writer"].count >= TEST_HITS_COUNT:
+        return
+    state["emitted"].add(key)
+    state["writer"].write(entry)
 
-        if new_price < old_price:
-            status = "hit" if (drop_percent >= MIN_DROP_PERCENT and new_price <= price_threshold) else "drop"
-        elif new_price > old_price:
-            status = "increase"
-        else:
-            status = "no_change"
-
-        old_size = normalize_size(old_p.get("variantValue"))
-        new_size = normalize_size(new_p.get("variantValue"))
-
-        # brand preferabil din new_p, fallback old_p/url
-        brand = extract_brand(new_p, url) or extract_brand(old_p, url)
-
-        entry = {
-            "model_id": model_id,
-            "brand": brand,
-            "name": display_name,
-            "url": url,
-            "image": image_url,
-            "old_price": old_price,
-            "new_price": new_price,
-            "drop_amount": round(drop, 2),
-            "drop_percent": round(drop_percent, 2),
-            "status": status,
-            "old_prices_per_size": {},
-            "new_prices_per_size": {},
-        }
 
-        # OLD size url
-        if old_size in TRACKED_SIZES and old_price is not None:
-            size_param_old = old_p.get("variantId") or old_p.get("variantValue") or old_size
-            entry["old_prices_per_size"][old_size] = {
-                "price": old_price,
-                "url": build_size_url(url, size_param_old),
-            }
+def abort_category(state):
+    if state.get("writer"):
+        state["writer"].abort()
 
-        # NEW size url
-        if new_size in TRACKED_SIZES and new_price is not None:
-            size_param_new = new_p.get("variantId") or new_p.get("variantValue") or new_size
-            entry["new_prices_per_size"][new_size] = {
-                "price": new_price,
-                "url": build_size_url(url, size_param_new),
-            }
 
-        results.append(entry)
-        if status == "hit":
-            hits.append(entry)
+def apply_page(state, batch):
+    """
+    Unește o pagină în new_best_by_model și rezolvă pe loc intrările din baseline
+    ale modelelor schimbate. Întoarce hit-urile apărute în pagina asta.
+    """
+    new_best_by_model = state["new_best_by_model"]
+    batch_hits = []
+    produced = []
+
+    with span("diff"):
+        for model_id in merge_page_into_best(new_best_by_model, batch):
+            for idx, old_p, display_name, url in state["old_by_model"].get(model_id, ()):
+                entry = diff_entry(model_id, old_p, display_name, url, new_best_by_model[model_id], state["price_threshold"])
+                if entry is None:
+                    continue
+                state["entries"][idx] = entry
+                produced.append(entry)
+                if entry["status"] == "hit":
+                    batch_hits.append(entry)
 
-        if TEST_HITS_MODE and len(results) >= TEST_HITS_COUNT:
-            break
+    if batch_hits:
+        attach_history(batch_hits, state["label"], state["run_ts"])
 
-    duration = time.perf_counter() - start
+    if state["writer"]:
+        for entry in produced:
+            emit_entry(state, entry)
+        state["writer"].flush()
 
-    with open(f"price_changes_{label}.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    if state["progress"] and state["task_id"] is not None:
+        state["progress"].update(state["task_id"], completed=len(state["entries"]))
 
-    with open(f"missing_{label}.json", "w", encoding="utf-8") as f:
-        json.dump(missing_products, f, indent=2, ensure_ascii=False)
+    return batch_hits
 
-    hits = apply_cooldown_filter(hits, label)
-    send_email(hits, label, price_threshold)
 
-    return {
+def write_ndjson_outputs(state, missing_products, partial=False):
+    """
+    Închide fluxul price_changes (rename atomic), scrie missing_{label}.ndjson
+    și salvează starea pentru delta-ul rulării următoare.
+    La un listing parțial missing-ul nu se rescrie, iar cheile nevăzute își păstrează starea veche.
+    """
+    label = state["label"]
+    state["writer"].commit()
+
+    previous = state["previous"]
+    current = {diff_key(e["model_id"], e["url"]): (e["status"], e["new_price"]) for e in state["entries"].values()}
+
+    if partial:
+        if OUTPUT_DELTA:
+            open_store(STATE_DIR).save_diff_state(label, {**previous, **current}, previous)
+        return
+
+    missing_writer = NdjsonWriter(f"missing_{label}.ndjson")
+    try:
+        for m in missing_products:
+            key = diff_key(m["key"], m["url"])
+            current[key] = ("missing", None)
+            if OUTPUT_DELTA and previous.get(key) == ("missing", None):
+                continue
+            missing_writer.write(m)
+    except BaseException:
+        missing_writer.abort()
+        raise
+    missing_writer.commit()
+
+    if OUTPUT_DELTA:
+        open_store(STATE_DIR).save_diff_state(label, current, previous)
+
+
+def finish_category(state, hits):
+    label = state["label"]
+    entries = state["entries"]
+
+    results = [entries[idx] for idx in sorted(entries)]
+    if TEST_HITS_MODE:
+        results = results[:TEST_HITS_COUNT]
+
+    # cu pagini pierdute, un model nevăzut poate fi pe o pagină lipsă: nu-l raportăm missing
+    partial = state["coverage"] < 1.0
+
+    missing_products = []
+    for model_id, olds in state["old_by_model"].items():
+        if partial or model_id in state["new_best_by_model"]:
+            continue
+        for idx, old_p, display_name, url in olds:
+            missing_products.append((idx, {"key": model_id, "name": display_name, "url": url}))
+    missing_products = [m for _, m in sorted(missing_products, key=lambda x: x[0])]
+
+    if state["progress"] and state["task_id"] is not None:
+        state["progress"].update(state["task_id"], completed=state["total"])
+
+    # listinguri complete sau parțiale (peste MIN_COVERAGE); la eșec nu se scrie istoric
+    record_history(state)
+
+    duration = time.perf_counter() - state["start"]
+
+    if state["writer"]:
+        write_ndjson_outputs(state, missing_products, partial)
+    else:
+        write_json_atomic(f"price_changes_{label}.json", results)
+        if not partial:
+            write_json_atomic(f"missing_{label}.json", missing_products)
+
+    summary = {
         "label": label,
         "count": len(results),
-        "old_total": total,
+        "old_total": state["total"],
         "missing": len(missing_products),
         "hits": len(hits),
         "duration": duration,
     }
+    if partial:
+        summary["partial"] = True
+        summary["coverage"] = state["coverage"]
+    return summary
+
+
+async def main_single_async(products_file, listing_url, label, price_threshold, progress=None, new_pages=None,
+                            outbox=None, old_products=None, fetch_stats=None):
+    """
+    Diff în flux pe event loop: fiecare pagină din `new_pages` (iterabil async) e unită
+    imediat în new_best_by_model, iar hit-urile ei intră în coada de email.
+    Cooldown-ul rulează inline (scrie cache-ul categoriei), iar emailurile sunt
+    pregătite în task-uri separate și livrate de `outbox`, fără să blocheze paginile următoare.
+    Hit-urile sunt strânse EMAIL_DEBOUNCE_SECONDS de la primul, apoi trimise într-un singur email;
+    ce a rămas nestrâns pleacă la sfârșitul categoriei, înainte de finish_category.
+    `fetch_stats`: dict-ul completat de sursa paginilor (pages_ok / missing_pages) -> acoperirea.
+    """
+    state = await asyncio.to_thread(prepare_category, products_file, label, price_threshold, progress, old_products)
+
+    hits = []
+    deliveries = []
+    pending = []
+    timer = None
+
+    def flush():
+        nonlocal timer
+        timer = None
+        if pending:
+            batch_hits = list(pending)
+            pending.clear()
+            deliveries.append(asyncio.create_task(send_email_async(batch_hits, label, price_threshold, outbox)))
+
+    async def flush_later():
+        await asyncio.sleep(EMAIL_DEBOUNCE_SECONDS)
+        flush()
+
+    try:
+        async for batch in new_pages:
+            batch_hits = apply_page(state, batch)
+            if not batch_hits:
+                continue
+
+            # alertă rapidă: ieftinirile mari se vând în câteva minute, dar paginile apropiate merg împreună
+            sent = apply_cooldown_filter(batch_hits, label)
+            if sent:
+                hits.extend(sent)
+                pending.extend(sent)
+                if timer is None:
+                    timer = asyncio.create_task(flush_later())
+
+        state["coverage"] = listing_coverage(fetch_stats or {})
+        if state["coverage"] < MIN_COVERAGE:
+            raise ListingFetchError(-1, f"coverage {state['coverage']:.0%} below {MIN_COVERAGE:.0%}")
+    except BaseException:
+        abort_category(state)
+        raise
+    finally:
+        # hit-urile au trecut deja de cooldown: se trimit și dacă listingul a eșuat
+        if timer is not None:
+            timer.cancel()
+        flush()
+        for r in await asyncio.gather(*deliveries, return_exceptions=True):
+            if isinstance(r, Exception):
+                print(f"⚠ Email failed for [{label}]: {r}")
+
+    return await asyncio.to_thread(finish_category, state, hits)
 
 
 # ============================================================
@@ -728,76 +1414,285 @@ CATEGORIES = {
 }
 
 
-def main():
-    console = Console()
-    print("\n================ MULTI CATEGORY START ================\n")
+def _empty_summary(label):
+    return {
+        "label": label,
+        "count": 0,
+        "old_total": 0,
+        "missing": 0,
+        "hits": 0,
+        "duration": 0,
+    }
 
-    summary = []
-    global_start = time.perf_counter()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--window-size=1280,720",
-                "--window-position=-2000,-2000",
-            ],
-        )
-        context = browser.new_context(
-            locale="ro-RO",
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+def _failed_summary(label):
+    return {**_empty_summary(label), "failed": True}
+
+
+def _skipped_summary(label):
+    return {**_empty_summary(label), "skipped": True}
+
+
+async def _run_direct_category(client, label, cfg, progress, outbox=None):
+    """
+    Întoarce (label, rezultat); rezultat None = blocat (403/429) -> fallback browser.
+    """
+    print(f"\n====== CATEGORY: {label} ======\n")
+    started_at = time.perf_counter()
+
+    price_threshold = cfg.get("price_threshold", PRICE_THRESHOLD_DEFAULT)
+
+    try:
+        # baseline-ul dă plafonul de preț înainte de prima cerere
+        old_products = await asyncio.to_thread(load_baseline, baseline_path(cfg["file"]))
+
+        ceiling = price_ceiling(old_products, price_threshold)
+
+        # prc închis în query; verificarea față de listingul nelimitat rulează doar când e scadentă
+        listing, verify_due = planned_listing(label, cfg["listing"], ceiling)
+        if verify_due and listing != cfg["listing"]:
+            ok = await asyncio.to_thread(
+                verify_with_client, client, f"compare:{label}", cfg["listing"], listing, ceiling, get_effective_price
+            )
+            if ok is False:
+                listing = cfg["listing"]
+
+        # probă ieftină: doar pagina 1; fără schimbări nu mai facem fetch-ul și diff-ul complet.
+        # Altfel răspunsul ei e pagina 1 a listingului (paginarea continuă de la pagina 2)
+        fingerprint = None
+        probe = None
+        if SKIP_UNCHANGED:
+            probe = await asyncio.to_thread(client.get_page, listing, 1)
+            if probe.get("ok"):
+                fingerprint = listing_fingerprint(listing, probe.get("data"), get_effective_price)
+                if await asyncio.to_thread(should_skip, f"compare:{label}", fingerprint):
+                    print(f"[DIRECT API] page 1 unchanged → [{label}] skipped")
+                    return label, _skipped_summary(label)
+
+        # reducerea per pagină se face în workerii clientului, cea între pagini în apply_page
+        stats = {}
+        new_pages = aiter_in_thread(client.iter_listing(
+            listing,
+            concurrency=PAGE_FETCH_CONCURRENCY,
+            max_pages=MAX_API_PAGES,
+            page_transform=reduce_cheapest_per_model,
+            stats=stats,
+            stop_when=stop_above(ceiling),
+            first_page=probe,
+        ))
+
+        result = await main_single_async(
+            cfg["file"],
+            listing,
+            label,
+            price_threshold,
+            progress=progress,
+            new_pages=new_pages,
+            outbox=outbox,
+            old_products=old_products,
+            fetch_stats=stats,
         )
-        context.set_extra_http_headers({
-            "Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
-        })
-        page = context.new_page()
+        print(f"[DIRECT API] {listing} → {stats.get('raw_count', 0)} products")
+        if stats.get("stopped_at"):
+            print(f"[DIRECT API] price ceiling reached at page {stats['stopped_at']}, paging stopped")
+        report_missing_pages("DIRECT API", listing, stats)
+        # o rulare parțială nu devine referință pentru sărirea categoriei
+        if not result.get("partial"):
+            await asyncio.to_thread(remember_fingerprint, f"compare:{label}", fingerprint)
+        result["duration"] = time.perf_counter() - started_at
+        return label, result
+    except ListingFetchError as e:
+        if is_blocked(e.status):
+            print(f"[DIRECT API] status={e.status} → browser fallback for [{label}]")
+            return label, None
+        print(f"❌ CATEGORY FAILED: {label} | {e}")
+    except Exception as e:
+        print(f"❌ CATEGORY FAILED: {label} | {e}")
+    return label, _failed_summary(label)
+
+
+async def run_categories_direct(client, progress, outbox=None):
+    """
+    Rulează CATEGORIES prin clientul HTTP direct, câte CATEGORY_WORKERS odată.
+    Întoarce (rezultate per label, labeluri blocate cu 403/429 -> fallback browser).
+    """
+    sem = asyncio.Semaphore(CATEGORY_WORKERS)
+
+    async def run_one(label, cfg):
+        async with sem:
+            return await _run_direct_category(client, label, cfg, progress, outbox)
+
+    results = {}
+    blocked = []
+    runs = (scoped(run_one(label, cfg), category=label) for label, cfg in CATEGORIES.items())
+    for label, result in await asyncio.gather(*runs):
+        if result is None:
+            blocked.append(label)
+        else:
+            results[label] = result
+    return results, blocked
+
+
+async def run_categories_pool(context, progress, labels=None, outbox=None, has_session=False):
+    """
+    Rulează CATEGORIES pe un pool de CATEGORY_WORKERS pagini din același browser.
+    Fiecare categorie ia o pagină liberă, iar fetch-ul, diff-ul și emailurile
+    tuturor categoriilor se suprapun pe același event loop.
+    Cu `has_session` paginile nu mai navighează (vezi start_listing_fetch).
+    """
+    selected = [(label, cfg) for label, cfg in CATEGORIES.items() if labels is None or label in labels]
+    if not selected:
+        return {}
 
-        for label, cfg in CATEGORIES.items():
+    free_pages = asyncio.Queue()
+    for _ in range(max(1, min(CATEGORY_WORKERS, len(selected)))):
+        free_pages.put_nowait(await context.new_page())
+
+    async def run_one(label, cfg):
+        page = await free_pages.get()
+        try:
             print(f"\n====== CATEGORY: {label} ======\n")
+            started_at = time.perf_counter()
+            price_threshold = cfg.get("price_threshold", PRICE_THRESHOLD_DEFAULT)
+            old_products = await asyncio.to_thread(load_baseline, baseline_path(cfg["file"]))
+            ceiling = price_ceiling(old_products, price_threshold)
+            # fallback-ul din browser folosește planul, dar verificarea rămâne pe clientul direct
+            listing, _ = planned_listing(label, cfg["listing"], ceiling)
+            await start_listing_fetch(page, listing, ceiling, has_session)
+            stats = {}
+            result = await main_single_async(
+                cfg["file"],
+                listing,
+                label,
+                price_threshold,
+                progress=progress,
+                new_pages=iter_listing_pages(page, listing, stats=stats),
+                outbox=outbox,
+                old_products=old_products,
+                fetch_stats=stats,
+            )
+            result["duration"] = time.perf_counter() - started_at
+            return label, result
+        except Exception as e:
+            print(f"❌ CATEGORY FAILED: {label} | {e}")
+            return label, _failed_summary(label)
+        finally:
+            free_pages.put_nowait(page)
+
+    return dict(await asyncio.gather(*(scoped(run_one(label, cfg), category=label) for label, cfg in selected)))
+
+
+async def _launch_browser(p):
+    return await p.chromium.launch(
+        headless=True,
+        args=[
+            "--window-size=1280,720",
+            "--window-position=-2000,-2000",
+        ],
+    )
 
-            with Progress(
-                TextColumn("[bold blue]{task.description}[/]"),
-                BarColumn(),
-                TextColumn("{task.completed}/{task.total}"),
-                TimeElapsedColumn(),
-                TimeRemainingColumn(),
-                expand=True,
-            ) as progress:
-                try:
-                    result = main_single(
-                        cfg["file"],
-                        cfg["listing"],
-                        label,
-                        cfg.get("price_threshold", PRICE_THRESHOLD_DEFAULT),
-                        progress=progress,
-                        page=page,
-                    )
-                    summary.append(result)
-                except Exception as e:
-                    print(f"❌ CATEGORY FAILED: {label} | {e}")
-                    summary.append({
-                        "label": label,
-                        "count": 0,
-                        "old_total": 0,
-                        "missing": 0,
-                        "hits": 0,
-                        "duration": 0,
-                    })
-                    continue
 
+async def main_async(browser=None):
+    """
+    `browser`: Chromium deja pornit (daemon / runner comun); None = se lansează unul la nevoie.
+    Întoarce totalurile rulării (pentru sumarul comun din trendyol_run).
+    """
+    console = Console()
+    print("\n================ MULTI CATEGORY START ================\n")
 
+    global_start = time.perf_counter()
 
-        browser.close()
+    results = {}
+    browser_labels = list(CATEGORIES)
+
+    # istoricul de prețuri (în cache-ul din Actions) nu crește nelimitat; fereastra din email rămâne acoperită
+    retention = max(HISTORY_RETENTION_DAYS, HISTORY_DAYS)
+    pruned = await asyncio.to_thread(open_store(STATE_DIR).prune_history, int(time.time()), retention)
+    if pruned:
+        print(f"🗃 Pruned {pruned} price history row(s) older than {retention} days")
+
+    # emailurile pleacă pe o singură conexiune SMTP, în fundal; netrimisele rămân în state/outbox
+    outbox = await asyncio.to_thread(open_outbox)
+
+    cancelled = False
+    try:
+        with Progress(
+            TextColumn("[bold blue]{task.description}[/]"),
+            BarColumn(),
+            TextColumn("{task.completed}/{task.total}"),
+            TimeElapsedColumn(),
+            TimeRemainingColumn(),
+            expand=True,
+        ) as progress:
+            if DIRECT_API_MODE:
+                cookies = load_cookies()
+                if not cookies:
+                    # warm-up scurt doar când nu avem sesiune salvată în state/
+                    async with browser_session(async_playwright, _launch_browser, browser) as b:
+                        cookies = await warm_up_cookies(b, accept_cookies)
+
+                with ApiClient(cookies, pool_size=PAGE_FETCH_CONCURRENCY) as client:
+                    results, browser_labels = await run_categories_direct(client, progress, outbox)
+
+            if browser_labels:
+                async with browser_session(async_playwright, _launch_browser, browser) as b:
+                    session = load_storage_state()
+                    context = await b.new_context(
+                        locale="ro-RO",
+                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+                        storage_state=session,
+                    )
+                    await context.set_extra_http_headers({
+                        "Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
+                    })
+                    routes = await install_blocking(context, RoutePolicy(HOME_URL)) if BLOCK_RESOURCES else None
+                    # fetch()-urile din pagini trec prin același limiter ca ApiClient
+                    await expose_limiter(context)
+
+                    pooled = await run_categories_pool(context, progress, browser_labels, outbox, session is not None)
+
+                    # sesiunea salvată n-a mers: o aruncăm și reluăm eșecurile cu navigare completă
+                    failed = [label for label, r in pooled.items() if r.get("failed")]
+                    if session is not None and failed:
+                        print(f"[SESSION] stored session failed for {failed} → retrying with navigation")
+                        discard_storage_state()
+                        pooled.update(await run_categories_pool(context, progress, failed, outbox))
+                    results.update(pooled)
+
+                    # sesiune proaspătă (storage_state + cookies) pentru rularea următoare
+                    if any(not r.get("failed") for r in pooled.values()):
+                        await save_storage_state(context)
+                    await context.close()
+                    if routes is not None:
+                        print(f"[ROUTES] {routes.summary()}")
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        # worker-ul SMTP nu supraviețuiește rulării (în daemon următoarea pornește altul pe același spool)
+        if outbox is not None:
+            if cancelled:
+                # anulată (JOB_TIMEOUT): se oprește după mesajul curent, restul rămâne în spool
+                await asyncio.to_thread(outbox.close, OUTBOX_ABORT_TIMEOUT, False)
+            else:
+                # succes sau eroare: emailurile deja puse în coadă pleacă
+                await asyncio.to_thread(outbox.close)
+
+    summary = [results[label] for label in CATEGORIES if label in results]
 
     print("\n================ SUMMARY ================\n")
 
     for r in summary:
+        if r.get("skipped"):
+            print(f"- {r['label']}: unchanged since last full run, skipped")
+            continue
         print(
             f"- {r['label']}: "
             f"{r['count']}/{r['old_total']} products, "
             f"{r['hits']} hits, "
             f"{r['missing']} missing, "
             f"time: {format_duration(r['duration'])}"
+            + (f" (PARTIAL, {r['coverage']:.0%} of pages)" if r.get("partial") else "")
         )
 
     total_checked = sum(r["count"] for r in summary)
@@ -811,9 +1706,28 @@ def main():
     print(f"TOTAL HITS:             {total_hits}")
     print(f"TOTAL MISSING:          {total_missing}")
     print(f"TOTAL TIME:             {format_duration(total_time)}")
+    print(f"API RATE:               {shared_limiter().summary()}")
+    if outbox is not None:
+        print(f"EMAILS SENT:            {outbox.sent} (failed, kept in outbox: {outbox.failed})")
     print("-----------------------------------------------")
     print("\n================ FINISHED ================\n")
 
+    return {
+        "checked": total_checked,
+        "hits": total_hits,
+        "missing": total_missing,
+        "failed": [r["label"] for r in summary if r.get("failed")],
+        "partial": [r["label"] for r in summary if r.get("partial")],
+        "skipped": [r["label"] for r in summary if r.get("skipped")],
+    }
+
+
+def main():
+    with scope(job="compare"):
+        asyncio.run(main_async())
+    report, prom = metrics().export()
+    print(f"[METRICS] {report} | {prom}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modulele sunt plate, în rădăcina repo-ului
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
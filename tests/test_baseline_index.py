@@ -0,0 +1,65 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import trendyol_baseline_index as baseline_index
+from trendyol_baseline_index import load_baseline
+
+PRODUCTS = [
+    {"id": 1, "name": "Boot", "url": "/boot-p-1", "price": {"discountedPrice": 99.5, "current": 120.0}, "extra": "x"},
+    {"id": 2, "name": "Shoe", "images": ["a.jpg", "b.jpg"]},
+]
+
+
+@pytest.fixture
+def baseline(monkeypatch, tmp_path):
+    monkeypatch.setattr(baseline_index, "MEMORY_CACHE", False)
+    path = str(tmp_path / "boots.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(PRODUCTS, f)
+    return path, str(tmp_path / "idx" / "boots.json.idx")
+
+
+def test_index_round_trips_the_projected_products(baseline):
+    path, index = baseline
+
+    built = load_baseline(path, index)
+    assert built == [baseline_index.project_product(p) for p in PRODUCTS]
+    assert "extra" not in built[0]
+    assert built[1]["images"] == ["a.jpg"]
+
+    assert baseline_index._read_records(index) == built
+    assert load_baseline(path, index) == built
+
+
+def test_touched_file_with_same_content_reuses_the_index(baseline, monkeypatch):
+    path, index = baseline
+    built = load_baseline(path, index)
+    os.utime(path, ns=(0, 0))
+
+    monkeypatch.setattr(baseline_index, "build_index", lambda *a, **kw: pytest.fail("index rebuilt"))
+    assert load_baseline(path, index) == built
+    assert baseline_index._read_header(index)["source_mtime_ns"] == 0
+
+
+def test_changed_baseline_rebuilds_the_index(baseline):
+    path, index = baseline
+    load_baseline(path, index)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(PRODUCTS[:1], f)
+
+    assert [p["id"] for p in load_baseline(path, index)] == [1]
+
+
+@pytest.mark.parametrize("content", [b"", b"not an index", pickle.dumps({"version": baseline_index.INDEX_VERSION})])
+def test_unreadable_index_is_rebuilt_from_json(baseline, content):
+    path, index = baseline
+    os.makedirs(os.path.dirname(index))
+    with open(index, "wb") as f:
+        f.write(content)
+
+    assert [p["id"] for p in load_baseline(path, index)] == [1, 2]
+    assert baseline_index._read_header(index)["version"] == baseline_index.INDEX_VERSION
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from email.message import EmailMessage
+
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("rich")
+
+import compare_trendyol_api as compare
+import trendyol_cassette
+import trendyol_http
+import trendyol_images
+import trendyol_outbox
+import trendyol_run
+
+from trendyol_metrics import metrics
+from trendyol_ratelimit import shared_limiter
+from trendyol_store import open_store
+
+
+def snapshot(root: str) -> dict:
+    out = {}
+    for dirpath, _, names in os.walk(root):
+        for n in names:
+            path = os.path.join(dirpath, n)
+            st = os.stat(path)
+            out[path] = (st.st_size, st.st_mtime_ns)
+    return out
+
+
+def test_replay_leaves_state_untouched(monkeypatch, tmp_path):
+    seen = {}
+
+    async def fake_main_async(names=None, browser_wrapper=None):
+        # tot ce scrie o rulare reală: store, sesiune, metrici, outbox, output-uri în cwd
+        seen["cwd"] = os.getcwd()
+        seen["state_dir"] = compare.STATE_DIR
+        seen["cache_dir"] = trendyol_images.CACHE_DIR
+        open_store().set_fingerprint("compare:replay", "fp", 1)
+        trendyol_http.save_cookies([{"name": "session", "value": "replay"}])
+        trendyol_outbox.enqueue(EmailMessage(), "replay")
+        shared_limiter().save()
+        metrics().export()
+        with open("price_changes_replay.ndjson", "w", encoding="utf-8") as f:
+            f.write("{}\n")
+        return [{"job": "compare", "ok": True}]
+
+    monkeypatch.setattr(trendyol_run, "main_async", fake_main_async)
+    real_state = trendyol_cassette.STATE_DIR
+    before = snapshot(real_state)
+    cwd = os.getcwd()
+
+    runs = asyncio.run(trendyol_cassette.replay_async(str(tmp_path / "cassette")))
+
+    assert runs == [{"job": "compare", "ok": True}]
+    assert snapshot(real_state) == before
+    assert os.getcwd() == cwd
+    assert compare.STATE_DIR == real_state
+    assert not os.path.exists(seen["cwd"])
+    assert seen["state_dir"].startswith(seen["cwd"])
+    assert seen["cache_dir"].startswith(seen["state_dir"])
+
+
+def test_record_leaves_state_untouched_and_runs_full_listings(monkeypatch, tmp_path):
+    seen = {}
+
+    async def fake_main_async(names=None, browser_wrapper=None):
+        seen["cwd"] = os.getcwd()
+        seen["skip_unchanged"] = compare.SKIP_UNCHANGED
+        seen["record_env"] = os.environ.get(trendyol_cassette.RECORD_ENV)
+        # un hit înregistrat nu pune cooldown în trendyol.db real
+        open_store().mark_sent("boots", [("42", 1, 99.0)])
+        metrics().export()
+        return [{"job": "compare", "ok": True}]
+
+    monkeypatch.setattr(trendyol_run, "main_async", fake_main_async)
+    real_state = trendyol_cassette.STATE_DIR
+    before = snapshot(real_state)
+
+    runs = asyncio.run(trendyol_cassette.record_async(str(tmp_path / "cassette")))
+
+    assert runs == [{"job": "compare", "ok": True}]
+    assert snapshot(real_state) == before
+    assert seen["skip_unchanged"] is False
+    assert compare.SKIP_UNCHANGED is True
+    assert seen["record_env"] == str(tmp_path / "cassette")
+    assert trendyol_cassette.RECORD_ENV not in os.environ
+    assert not os.path.exists(seen["cwd"])
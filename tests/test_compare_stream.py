@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("rich")
+
+import compare_trendyol_api as compare
+
+
+@pytest.fixture
+def emails(monkeypatch):
+    sent = []
+
+    async def fake_send(hits, label, price_threshold, outbox=None):
+        sent.append([h["model_id"] for h in hits])
+
+    monkeypatch.setattr(compare, "EMAIL_DEBOUNCE_SECONDS", 0.05)
+    monkeypatch.setattr(compare, "send_email_async", fake_send)
+    monkeypatch.setattr(compare, "prepare_category", lambda *a, **kw: {})
+    # fiecare "pagină" e direct lista de hit-uri
+    monkeypatch.setattr(compare, "apply_page", lambda state, batch: list(batch))
+    monkeypatch.setattr(compare, "apply_cooldown_filter", lambda hits, label: hits)
+    monkeypatch.setattr(compare, "finish_category", lambda state, hits: {"hits": len(hits)})
+    return sent
+
+
+async def pages(batches, delay=0.0):
+    for batch in batches:
+        if delay:
+            await asyncio.sleep(delay)
+        yield [{"model_id": m} for m in batch]
+
+
+def run(batches, delay=0.0):
+    return asyncio.run(compare.main_single_async("f.json", "url", "boots", 100, new_pages=pages(batches, delay)))
+
+
+def test_hits_from_close_pages_share_one_email(emails):
+    result = run([[1, 2], [], [3], [4, 5]])
+
+    assert result == {"hits": 5}
+    assert emails == [[1, 2, 3, 4, 5]]
+
+
+def test_hits_after_the_debounce_window_get_a_new_email(emails):
+    result = run([[1], [2]], delay=0.1)
+
+    assert result == {"hits": 2}
+    assert emails == [[1], [2]]
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("certifi")
+
+from trendyol_http import ApiClient
+from trendyol_ratelimit import AdaptiveLimiter
+
+PAGES = {pi: [{"id": pi * 10 + i, "price": pi * 10 + i} for i in range(3)] for pi in (1, 2, 3)}
+
+
+def page_response(pi):
+    data = {"products": PAGES[pi], "totalCount": 9, "_links": {"next": "x"} if pi < 3 else {}}
+    return {"ok": True, "status": 200, "data": data, "error": ""}
+
+
+@pytest.fixture
+def client():
+    c = ApiClient(limiter=AdaptiveLimiter())
+    c.requested = []
+
+    def get_page(listing_url, pi):
+        c.requested.append(pi)
+        return page_response(pi)
+
+    c.get_page = get_page
+    return c
+
+
+def test_iter_listing_reuses_the_probe_as_page_one(client):
+    pages = list(client.iter_listing("listing", concurrency=2, first_page=page_response(1)))
+
+    assert pages == [PAGES[1], PAGES[2], PAGES[3]]
+    assert sorted(client.requested) == [2, 3]
+
+
+def test_iter_listing_refetches_a_failed_probe(client):
+    probe = {"ok": False, "status": 500, "data": None, "error": "boom"}
+
+    pages = list(client.iter_listing("listing", concurrency=2, first_page=probe))
+
+    assert pages == [PAGES[1], PAGES[2], PAGES[3]]
+    assert sorted(client.requested) == [1, 2, 3]
+
+
+def test_iter_listing_stops_after_the_first_page_over_the_ceiling(client):
+    stats = {}
+    stop_when = lambda products: min(p["price"] for p in products) > 15
+
+    pages = list(client.iter_listing("listing", concurrency=1, stats=stats, stop_when=stop_when))
+
+    assert pages == [PAGES[1], PAGES[2]]
+    assert stats["stopped_at"] == 2
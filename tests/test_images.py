@@ -0,0 +1,123 @@
+import email.message
+import json
+import os
+
+from urllib.error import HTTPError
+
+import pytest
+
+import trendyol_images
+from trendyol_images import cache_key, fetch_image, prune_cache
+
+URL = "https://cdn.dsmcdn.com/ty1/product/boot.jpg"
+JPEG = b"\xff\xd8jpeg-bytes"
+
+
+class FakeResponse:
+    def __init__(self, data, headers):
+        self.data = data
+        self.headers = email.message.Message()
+        for k, v in headers.items():
+            self.headers[k] = v
+
+    def read(self):
+        return self.data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def cdn(monkeypatch):
+    requests = []
+    responses = []
+
+    def urlopen(req, timeout=None):
+        requests.append(dict(req.header_items()))
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(trendyol_images, "urlopen", urlopen)
+    return requests, responses
+
+
+def ok(data=JPEG, etag='"v1"'):
+    return FakeResponse(data, {"Content-Type": "image/jpeg", "ETag": etag})
+
+
+def expire(cache_dir, url=URL):
+    meta_path = os.path.join(cache_dir, cache_key(url) + ".json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["fetched_at"] -= trendyol_images.FRESH_SECONDS + 1
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def test_fresh_entry_is_served_without_a_request(cdn, tmp_path):
+    requests, responses = cdn
+    responses.append(ok())
+
+    assert fetch_image(URL, str(tmp_path)) == (JPEG, "image/jpeg")
+    # același URL, altă formă: aceeași cheie
+    assert fetch_image("//CDN.dsmcdn.com/ty1/product/boot.jpg#x", str(tmp_path)) == (JPEG, "image/jpeg")
+    assert len(requests) == 1
+
+
+def test_stale_entry_is_revalidated_with_its_etag(cdn, tmp_path):
+    requests, responses = cdn
+    responses.append(ok())
+    fetch_image(URL, str(tmp_path))
+    expire(str(tmp_path))
+
+    responses.append(HTTPError(URL, 304, "Not Modified", {}, None))
+    assert fetch_image(URL, str(tmp_path)) == (JPEG, "image/jpeg")
+    assert requests[1]["If-none-match"] == '"v1"'
+
+    # 304 reîmprospătează intrarea: următorul apel nu mai face cerere
+    assert fetch_image(URL, str(tmp_path)) == (JPEG, "image/jpeg")
+    assert len(requests) == 2
+
+
+def test_changed_image_replaces_the_cached_copy(cdn, tmp_path):
+    requests, responses = cdn
+    responses.append(ok())
+    fetch_image(URL, str(tmp_path))
+    expire(str(tmp_path))
+
+    responses.append(ok(b"\xff\xd8new", etag='"v2"'))
+    assert fetch_image(URL, str(tmp_path)) == (b"\xff\xd8new", "image/jpeg")
+    assert fetch_image(URL, str(tmp_path)) == (b"\xff\xd8new", "image/jpeg")
+    assert len(requests) == 2
+
+
+def test_network_error_falls_back_to_the_stale_copy(cdn, tmp_path):
+    requests, responses = cdn
+    responses.append(ok())
+    fetch_image(URL, str(tmp_path))
+    expire(str(tmp_path))
+
+    responses.append(OSError("timed out"))
+    assert fetch_image(URL, str(tmp_path)) == (JPEG, "image/jpeg")
+
+    responses.append(OSError("timed out"))
+    assert fetch_image(URL + "?other", str(tmp_path)) == (None, None)
+
+
+def test_prune_evicts_least_recently_used_entries(tmp_path):
+    cache_dir = str(tmp_path)
+    for i, key in enumerate(("old", "mid", "new")):
+        for ext in (".bin", ".json"):
+            path = os.path.join(cache_dir, key + ext)
+            with open(path, "wb") as f:
+                f.write(b"x" * 100 if ext == ".bin" else b"{}")
+            os.utime(path, (1000 + i, 1000 + i))
+
+    assert prune_cache(cache_dir, max_bytes=150) == 2
+    assert sorted(os.listdir(cache_dir)) == ["new.bin", "new.json"]
+    assert prune_cache(cache_dir, max_bytes=150) == 0
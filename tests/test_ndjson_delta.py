@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("rich")
+
+import compare_trendyol_api as compare
+from trendyol_store import close_store
+
+LABEL = "boots"
+
+
+def product(model_id, price):
+    return {"id": model_id, "name": f"Boot {model_id}", "url": f"/boot-p-{model_id}", "price": {"discountedPrice": price}}
+
+
+BASELINE = [product(1, 200.0), product(2, 200.0), product(3, 200.0)]
+
+
+@pytest.fixture
+def workdir(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(compare, "STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(compare, "OUTPUT_FORMAT", "ndjson")
+    monkeypatch.setattr(compare, "OUTPUT_DELTA", True)
+    yield tmp_path
+    close_store(str(tmp_path / "state"))
+
+
+def run(pages):
+    state = compare.prepare_category("boots.json", LABEL, 100, old_products=BASELINE)
+    for batch in pages:
+        compare.apply_page(state, batch)
+    compare.finish_category(state, [])
+
+
+def read(workdir, name):
+    with open(workdir / f"{name}_{LABEL}.ndjson", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_second_run_emits_only_what_changed(workdir):
+    listing = [product(1, 200 / 0.7), product(2, 150.0)]
+
+    run([listing])
+    assert sorted(e["model_id"] for e in read(workdir, "price_changes")) == [1, 2]
+    assert [m["key"] for m in read(workdir, "missing")] == [3]
+
+    run([listing])
+    assert read(workdir, "price_changes") == []
+    assert read(workdir, "missing") == []
+
+    run([[product(1, 150.0)], [product(2, 150.0)]])
+    assert [e["model_id"] for e in read(workdir, "price_changes")] == [1]
+    assert read(workdir, "missing") == []
+
+
+def test_a_model_rewritten_by_a_later_page_keeps_its_final_entry(workdir):
+    run([[product(1, 200 / 0.7), product(2, 150.0)]])
+
+    # prima pagină repetă starea veche, a doua găsește modelul 1 mai ieftin
+    run([[product(1, 200 / 0.7)], [product(1, 150.0)]])
+
+    entries = read(workdir, "price_changes")
+    assert [e["model_id"] for e in entries] == [1]
+    assert entries[0]["status"] == "drop"
+
+
+def test_partial_listing_keeps_missing_state_for_unseen_models(workdir):
+    run([[product(1, 200 / 0.7), product(2, 150.0)]])
+
+    state = compare.prepare_category("boots.json", LABEL, 100, old_products=BASELINE)
+    compare.apply_page(state, [product(1, 200 / 0.7)])
+    state["coverage"] = 0.5
+    compare.finish_category(state, [])
+
+    # missing_ rămâne cel din rularea completă, iar modelul 2 nevăzut nu apare ca schimbat data viitoare
+    assert [m["key"] for m in read(workdir, "missing")] == [3]
+    run([[product(1, 200 / 0.7), product(2, 150.0)]])
+    assert read(workdir, "price_changes") == []
@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import functools
+import os
+import time
+
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("rich")
+
+import compare_trendyol_api as compare
+import trendyol_outbox
+
+
+HIT = {
+    "brand": "Puma",
+    "name": "Puma Smash",
+    "new_price": 99.0,
+    "old_price": 180.0,
+    "drop_amount": 81.0,
+    "drop_percent": 45.0,
+    "url": "https://www.trendyol.com/ro/puma/smash-p-1",
+    "image": None,
+}
+
+
+@pytest.fixture
+def smtp(monkeypatch, tmp_path):
+    sent = []
+    monkeypatch.setattr(compare, "EMAIL_ENABLED", True)
+    monkeypatch.setattr(compare, "EMAIL_PASSWORD", "secret")
+    monkeypatch.setattr(compare, "Outbox", functools.partial(trendyol_outbox.Outbox, outbox_dir=str(tmp_path)))
+    monkeypatch.setattr(trendyol_outbox.SmtpSession, "send", lambda self, data: sent.append(data))
+    monkeypatch.setattr(trendyol_outbox.SmtpSession, "close", lambda self: None)
+    return sent, tmp_path
+
+
+def test_send_email_without_outbox_delivers_and_drains(smtp):
+    sent, spool = smtp
+
+    compare.send_email([HIT], "sneakers", 100, outbox=None)
+
+    assert len(sent) == 1
+    assert b"Puma Smash" in sent[0]
+    assert trendyol_outbox.pending(str(spool)) == []
+
+
+def test_outbox_start_is_idempotent(smtp):
+    sent, spool = smtp
+
+    with compare.open_outbox() as outbox:
+        outbox.start()
+        outbox.submit(compare.build_email([HIT], "sneakers", 100), "sneakers")
+
+    assert len(sent) == 1
+    assert trendyol_outbox.pending(str(spool)) == []
+
+
+def test_two_outboxes_on_one_spool_send_each_mail_once(smtp, monkeypatch):
+    sent, spool = smtp
+    # trimitere lentă: ambii workeri ajung la același mesaj cât primul încă îl trimite
+    monkeypatch.setattr(trendyol_outbox.SmtpSession, "send", lambda self, data: (time.sleep(0.02), sent.append(data)))
+    for i in range(5):
+        trendyol_outbox.enqueue(compare.build_email([HIT], "sneakers", 100), f"mail{i}", str(spool))
+
+    # ca după un JOB_TIMEOUT: worker-ul vechi și cel nou iau același spool
+    first = compare.open_outbox()
+    second = compare.open_outbox()
+    first.close()
+    second.close()
+
+    assert len(sent) == 5
+    assert trendyol_outbox.pending(str(spool)) == []
+
+
+def test_close_without_drain_keeps_the_rest_in_spool(smtp):
+    sent, spool = smtp
+    for i in range(3):
+        trendyol_outbox.enqueue(compare.build_email([HIT], "sneakers", 100), f"mail{i}", str(spool))
+
+    outbox = trendyol_outbox.Outbox("smtp", 587, "u", "p", outbox_dir=str(spool))
+    outbox._abort = True
+    outbox.start()
+    outbox.close(drain=False)
+
+    assert sent == []
+    assert len(trendyol_outbox.pending(str(spool))) == 3
+
+
+def test_stale_claims_are_released(tmp_path):
+    path = trendyol_outbox.enqueue(compare.build_email([HIT], "sneakers", 100), "mail", str(tmp_path))
+    claimed = path[:-len(".eml")] + ".sending"
+    os.rename(path, claimed)
+    os.utime(claimed, (0, 0))
+
+    assert trendyol_outbox.release_stale_claims(str(tmp_path)) == 1
+    assert trendyol_outbox.pending(str(tmp_path)) == [path]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.closed = []
+
+    def close(self, timeout=None, drain=True):
+        self.closed.append(drain)
+
+
+@pytest.fixture
+def failing_run(monkeypatch, tmp_path):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(compare, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(compare, "open_outbox", lambda: outbox)
+    monkeypatch.setattr(compare, "Progress", lambda *a, **kw: contextlib.nullcontext())
+    for column in ("TextColumn", "BarColumn", "TimeElapsedColumn", "TimeRemainingColumn"):
+        monkeypatch.setattr(compare, column, lambda *a, **kw: None)
+    monkeypatch.setattr(compare, "DIRECT_API_MODE", True)
+    return outbox
+
+
+def test_main_async_closes_the_outbox_on_errors(failing_run, monkeypatch):
+    def boom():
+        raise RuntimeError("store error")
+
+    monkeypatch.setattr(compare, "load_cookies", boom)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(compare.main_async())
+
+    assert failing_run.closed == [True]
+
+
+def test_main_async_aborts_the_outbox_on_cancel(failing_run, monkeypatch):
+    async def hang(*a, **kw):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(compare, "load_cookies", lambda: [{"name": "c", "value": "v"}])
+    monkeypatch.setattr(compare, "run_categories_direct", hang)
+
+    async def run():
+        await asyncio.wait_for(compare.main_async(), timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+    assert failing_run.closed == [False]
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from trendyol_planner import plan_listing, remember_fingerprint, should_skip, verify_with_client, with_price_range
+from trendyol_store import close_store, open_store
+
+PAGE_SIZE = 4
+HIGH = 100.0
+
+
+class FakeClient:
+    """
+    Două listinguri sortate crescător, paginate câte PAGE_SIZE; `bounded` e ce întoarce API-ul pentru prc.
+    """
+
+    def __init__(self, unbounded, bounded):
+        self.listings = {"all": unbounded, "capped": bounded}
+
+    def get_page(self, url, pi):
+        products = self.listings[url]
+        page = products[(pi - 1) * PAGE_SIZE:pi * PAGE_SIZE]
+        return {"ok": True, "status": 200, "data": {"products": page, "totalCount": len(products)}}
+
+
+def product(i, price):
+    return {"id": i, "price": price}
+
+
+def price_of(p):
+    return p["price"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    yield open_store(str(tmp_path))
+    close_store(str(tmp_path))
+
+
+# 10 produse sub plafon (pe 3 pagini), apoi restul peste
+CATALOG = [product(i, 10.0 * (i + 1)) for i in range(10)] + [product(100 + i, 150.0 + i) for i in range(6)]
+
+
+def test_honoured_pushdown_passes(store):
+    client = FakeClient(CATALOG, [p for p in CATALOG if p["price"] <= HIGH])
+
+    assert verify_with_client(client, "k", "all", "capped", HIGH, price_of, store) is True
+    assert store.get_plan("k")[1]
+
+
+def test_pushdown_dropping_items_near_the_ceiling_fails(store):
+    # pagina 1 e identică în ambele variante; lipsesc doar produsele de lângă plafon
+    capped = [p for p in CATALOG if p["price"] <= 60.0]
+    client = FakeClient(CATALOG, capped)
+
+    assert verify_with_client(client, "k", "all", "capped", HIGH, price_of, store) is False
+    assert not store.get_plan("k")[1]
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://x/sr?wc=1&sst=PRICE_BY_ASC", "https://x/sr?wc=1&sst=PRICE_BY_ASC&prc=0-100"),
+    ("https://x/sr?prc=30-*&wc=1", "https://x/sr?prc=30-100&wc=1"),
+    ("https://x/sr?prc=30-80&wc=1", "https://x/sr?prc=30-80&wc=1"),
+    ("https://x/sr?prc=30-250", "https://x/sr?prc=30-100"),
+])
+def test_with_price_range_closes_the_upper_bound(url, expected):
+    assert with_price_range(url, 99.2) == expected
+
+
+def test_plan_falls_back_to_the_original_listing_after_a_failed_check(store):
+    url = "https://x/sr?wc=1"
+
+    assert plan_listing("k", url, None, store) == (url, False)
+    assert plan_listing("k", url, HIGH, store) == ("https://x/sr?wc=1&prc=0-100", True)
+
+    store.set_plan("k", int(time.time()), False)
+    assert plan_listing("k", url, HIGH, store) == (url, False)
+
+    store.set_plan("k", int(time.time()), True)
+    assert plan_listing("k", url, HIGH, store) == ("https://x/sr?wc=1&prc=0-100", False)
+
+
+def test_unchanged_first_page_is_skipped_until_the_forced_refresh(store):
+    assert should_skip("k", "fp", store, force_every=3) is False
+
+    remember_fingerprint("k", "fp", store)
+    assert should_skip("k", "other", store, force_every=3) is False
+    assert should_skip("k", "fp", store, force_every=3) is True
+    assert should_skip("k", "fp", store, force_every=3) is True
+    # a treia rulare cu aceeași pagină 1 e completă
+    assert should_skip("k", "fp", store, force_every=3) is False
+
+    remember_fingerprint("k", "fp", store)
+    assert store.get_fingerprint("k") == ("fp", 0)
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("rich")
+
+import compare_trendyol_api as compare
+
+
+def product(price):
+    return {"id": price, "price": {"discountedPrice": price}}
+
+
+def test_ceiling_covers_the_threshold_and_the_dearest_baseline_price(monkeypatch):
+    monkeypatch.setattr(compare, "WELCOME_DISCOUNT_PERCENT", 30.0)
+    monkeypatch.setattr(compare, "PRICE_CEILING_SLACK", 1.10)
+
+    # scăderea de la 350 cere un preț redus < 350, adică listing < 500
+    assert compare.price_ceiling([product(100.0), product(350.0), {"id": 3}], 200) == 550.0
+    # pragul domină când baseline-ul e ieftin
+    assert compare.price_ceiling([product(100.0)], 280) == 440.0
+
+
+def test_no_ceiling_without_prices_or_when_disabled(monkeypatch):
+    assert compare.price_ceiling([{"id": 1}], 200) is None
+    assert compare.price_ceiling([], 200) is None
+
+    monkeypatch.setattr(compare, "PRICE_CEILING_PRUNING", False)
+    assert compare.price_ceiling([product(100.0)], 200) is None
+
+
+def test_stop_above_only_when_the_whole_page_is_over_the_ceiling():
+    stop = compare.stop_above(500.0)
+
+    assert stop([product(490.0), product(510.0)]) is False
+    assert stop([product(500.0)]) is False
+    assert stop([product(501.0), product(900.0)]) is True
+    # o pagină fără prețuri nu oprește paginarea
+    assert stop([{"id": 1}]) is False
+    assert compare.stop_above(None) is None
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+import trendyol_ratelimit
+from trendyol_ratelimit import AdaptiveLimiter
+
+
+def test_clean_responses_increase_the_rate_up_to_the_cap():
+    limiter = AdaptiveLimiter(rate=1.0, max_rate=1.2)
+
+    limiter.feedback(200)
+    assert limiter.rate == 1.0 + trendyol_ratelimit.INCREASE_STEP
+
+    for _ in range(20):
+        limiter.feedback(200)
+    assert limiter.rate == 1.2
+
+
+def test_throttling_halves_the_rate_once_per_hold_window():
+    limiter = AdaptiveLimiter(rate=8.0, min_rate=1.0)
+
+    # cererile deja în zbor primesc tot 429: o singură tăiere
+    for status in (429, 429, 403, -1):
+        limiter.feedback(status)
+
+    assert limiter.rate == 4.0
+    assert limiter.throttled == 1
+
+
+def test_throttling_never_goes_below_the_floor(monkeypatch):
+    limiter = AdaptiveLimiter(rate=2.0, min_rate=1.5)
+    monkeypatch.setattr(trendyol_ratelimit, "DECREASE_HOLD_S", 0.0)
+
+    for _ in range(5):
+        limiter.feedback(429)
+
+    assert limiter.rate == 1.5
+
+
+def test_other_errors_leave_the_rate_alone():
+    limiter = AdaptiveLimiter(rate=3.0)
+
+    for status in (404, 500, 503):
+        limiter.feedback(status)
+
+    assert limiter.rate == 3.0
+    assert limiter.throttled == 0
+
+
+def test_burst_is_free_and_then_requests_wait():
+    limiter = AdaptiveLimiter(rate=10.0, burst=2)
+
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() > 0.0
+
+
+def test_learned_rate_round_trips_and_expires(tmp_path):
+    path = os.path.join(str(tmp_path), "state", trendyol_ratelimit.RATE_FILE)
+    AdaptiveLimiter(rate=12.0, path=path).save()
+
+    assert AdaptiveLimiter.load(path).rate == 12.0
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"rate": 12.0, "updated": time.time() - trendyol_ratelimit.RATE_MAX_AGE - 1}, f)
+    assert AdaptiveLimiter.load(path).rate == trendyol_ratelimit.INITIAL_RATE
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from trendyol_routes import ESTIMATED_BYTES, RoutePolicy, RouteStats, install_blocking
+
+
+@pytest.mark.parametrize("url, resource_type, reason", [
+    ("https://www.trendyol.com/ro/sr?wc=1", "document", None),
+    ("https://apigw.trendyol.com/discovery/search", "fetch", None),
+    ("https://cdn.dsmcdn.com/ty1/boot.jpg", "image", "image"),
+    ("https://cdn.dsmcdn.com/fonts/a.woff2", "font", "font"),
+    ("https://www.google-analytics.com/collect", "script", "tracker"),
+    ("https://sub.doubleclick.net/ad", "xhr", "tracker"),
+    # bannerul de cookies trebuie să apară, chiar dacă e script de pe alt host
+    ("https://cdn.cookielaw.org/consent/otBannerSdk.js", "script", None),
+    ("data:image/png;base64,AAAA", "image", None),
+])
+def test_trendyol_policy(url, resource_type, reason):
+    assert RoutePolicy("https://www.trendyol.com/ro").block_reason(url, resource_type) == reason
+
+
+def test_allowlist_is_per_site():
+    url = "https://cdn.cookielaw.org/logo.png"
+
+    assert RoutePolicy("https://www.trendyol.com/ro").block_reason(url, "image") is None
+    assert RoutePolicy("https://www.evoucher.ro/").block_reason(url, "image") == "image"
+
+
+def test_host_suffix_must_match_a_whole_label():
+    policy = RoutePolicy(block_types=(), block_hosts=("clarity.ms",), allow_hosts=())
+
+    assert policy.block_reason("https://www.clarity.ms/tag.js", "script") == "tracker"
+    assert policy.block_reason("https://notclarity.ms/tag.js", "script") is None
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = FakeRequest(url, resource_type)
+        self.outcome = None
+
+    async def fallback(self):
+        self.outcome = "fallback"
+
+    async def abort(self, error_code=None):
+        self.outcome = error_code
+
+
+class FakeContext:
+    async def route(self, pattern, handler):
+        self.handler = handler
+
+
+def test_install_blocking_aborts_and_counts():
+    context = FakeContext()
+    routes = [
+        FakeRoute("https://www.trendyol.com/ro", "document"),
+        FakeRoute("https://cdn.dsmcdn.com/a.jpg", "image"),
+        FakeRoute("https://connect.facebook.net/sdk.js", "script"),
+    ]
+
+    async def run():
+        stats = await install_blocking(context, RoutePolicy("https://www.trendyol.com"))
+        for route in routes:
+            await context.handler(route)
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert [r.outcome for r in routes] == ["fallback", "blockedbyclient", "blockedbyclient"]
+    assert (stats.allowed, stats.blocked) == (1, 2)
+    assert stats.bytes_saved == ESTIMATED_BYTES["image"] + ESTIMATED_BYTES["script"]
+    assert stats.summary().startswith("blocked 2/3 requests")
+
+
+def test_empty_stats_summary():
+    assert RouteStats().summary() == "blocked 0/0 requests, ~0.0 MB saved (est.)"
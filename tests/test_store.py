@@ -0,0 +1,46 @@
+import pytest
+
+from trendyol_store import close_store, open_store
+
+DAY = 24 * 3600
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def store(tmp_path):
+    yield open_store(str(tmp_path))
+    close_store(str(tmp_path))
+
+
+def test_prune_history_drops_rows_outside_the_retention_window(store):
+    store.record_prices("boots", NOW - 100 * DAY, [("old", "42", 200.0)])
+    store.record_prices("boots", NOW - 10 * DAY, [("old", "42", 150.0), ("new", "43", 90.0)])
+
+    assert store.prune_history(NOW, days=90) == 1
+    assert store.prune_history(NOW, days=90) == 0
+
+    stats = store.price_stats("boots", ["old", "new"], 30, NOW)
+    assert stats["old"] == {"lowest": 150.0, "median": 150.0, "samples": 1}
+    assert stats["new"]["samples"] == 1
+
+
+def test_median_is_weighted_by_how_long_each_price_held(store):
+    # 100 lei o săptămână (un rând pe zi, heartbeat), apoi prețul oscilează din oră în oră
+    for day in range(7, 0, -1):
+        store.record_prices("boots", NOW - day * DAY, [("m", "42", 100.0)])
+    for hour in range(1, 13):
+        store.record_prices("boots", NOW - DAY + hour * 3600, [("m", "42", 150.0 + 10 * (hour % 2))])
+
+    stats = store.price_stats("boots", ["m"], 30, NOW)["m"]
+
+    # mai multe rânduri peste 150, dar 100 a fost în vigoare mult mai mult timp
+    assert stats == {"lowest": 100.0, "median": 100.0, "samples": 19}
+
+
+def test_gaps_without_heartbeat_do_not_extend_the_last_price(store):
+    store.record_prices("boots", NOW - 20 * DAY, [("m", "42", 80.0)])
+    # modelul lipsește din listing 17 zile, apoi revine la 120
+    for day in range(3, 0, -1):
+        store.record_prices("boots", NOW - day * DAY, [("m", "42", 120.0)])
+
+    assert store.price_stats("boots", ["m"], 30, NOW)["m"]["median"] == 120.0
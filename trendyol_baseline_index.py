@@ -0,0 +1,163 @@
+import hashlib
+import json
+import marshal
+import os
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+INDEX_DIR = os.path.join(STATE_DIR, "baseline_index")
+
+# crește versiunea când se schimbă PROJECTION sau formatul, ca indexurile vechi să fie refăcute
+INDEX_VERSION = 3
+
+# sidecar-ul vine din cache-ul din Actions: marshal (doar date, fără cod executat la citire),
+# iar orice fișier corupt / de alt tip e tratat ca lipsă și reconstruit din JSON
+_BAD_INDEX = (EOFError, ValueError, TypeError, OSError)
+
+# baseline-urile rămân și în memorie (procese lungi: daemon), reîncărcate când fișierul se schimbă
+MEMORY_CACHE = True
+_memory = {}
+
+# doar câmpurile citite de diff (get_model_id, get_effective_price, extract_brand, mărimi, imagine)
+# None = valoarea copiată ca atare, tuple = sub-chei păstrate, "first" = doar primul element din listă
+# (aceeași specificație e trimisă și job-ului JS din compare_trendyol_api)
+PROJECTION = {
+    "contentId": None,
+    "id": None,
+    "groupId": None,
+    "name": None,
+    "url": None,
+    "brand": None,
+    "brandName": None,
+    "variantId": None,
+    "variantValue": None,
+    "imageUrl": None,
+    "image": None,
+    "thumbnailUrl": None,
+    "images": "first",
+    "imageUrls": "first",
+    "recommendedRetailPrice": ("discountedPromotionPriceNumerized", "sellingPriceNumerized"),
+    "price": ("discountedPrice", "current"),
+    "singlePrice": ("salePriceWihoutCurrency", "salePrice"),
+    "binaryPrice": ("salePriceWihoutCurrency", "salePrice"),
+}
+
+# ================= PROJECTION =================
+
+def project_product(p: dict) -> dict:
+    """
+    Reduce un produs din API / baseline la câmpurile din PROJECTION.
+    Cheile lipsă sunt omise, deci helperii de preț funcționează la fel pe rezultat.
+    """
+    out = {}
+    for key, sub in PROJECTION.items():
+        v = p.get(key)
+        if v is None:
+            continue
+        if sub is None:
+            out[key] = v
+        elif sub == "first":
+            if isinstance(v, list) and v:
+                out[key] = v[:1]
+        elif isinstance(v, dict):
+            nested = {k: v[k] for k in sub if v.get(k) is not None}
+            if nested:
+                out[key] = nested
+    return out
+
+# ================= INDEX =================
+
+def index_path_for(baseline_path: str, index_dir: str = None) -> str:
+    name = os.path.basename(baseline_path)
+    return os.path.join(index_dir or INDEX_DIR, name + ".idx")
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _write_index(index_path: str, header: dict, records: list) -> None:
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp = index_path + ".tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump(header, f)
+        marshal.dump(records, f)
+    os.replace(tmp, index_path)
+
+def _read_header(index_path: str):
+    try:
+        with open(index_path, "rb") as f:
+            header = marshal.load(f)
+    except _BAD_INDEX:
+        return None
+    return header if isinstance(header, dict) else None
+
+def _read_records(index_path: str):
+    with open(index_path, "rb") as f:
+        marshal.load(f)  # header
+        records = marshal.load(f)
+    if not isinstance(records, list):
+        raise ValueError("baseline index: records is not a list")
+    return records
+
+def build_index(baseline_path: str, index_path: str = None) -> list:
+    """
+    Parsează o singură dată JSON-ul complet și scrie sidecar-ul cu produsele proiectate.
+    """
+    index_path = index_path or index_path_for(baseline_path)
+    st = os.stat(baseline_path)
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    records = [project_product(p) for p in data if isinstance(p, dict)] if isinstance(data, list) else []
+
+    header = {
+        "version": INDEX_VERSION,
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "source_sha1": _file_sha1(baseline_path),
+        "count": len(records),
+    }
+    _write_index(index_path, header, records)
+    return records
+
+def load_baseline(baseline_path: str, index_path: str = None) -> list:
+    """
+    Produsele din baseline, proiectate. Folosește sidecar-ul dacă e valid:
+    - același mtime + size -> citit direct
+    - mtime schimbat dar același sha1 (ex: checkout nou) -> citit, header actualizat
+    - altfel -> reconstruit din JSON
+    Cu MEMORY_CACHE, un fișier neschimbat (mtime + size) nu mai e citit deloc.
+    Lista întoarsă e comună între apeluri: se citește, nu se modifică.
+    """
+    st = os.stat(baseline_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _memory.get(baseline_path)
+    if MEMORY_CACHE and cached and cached[0] == stamp:
+        return cached[1]
+
+    records = _load_indexed(baseline_path, index_path or index_path_for(baseline_path), st)
+    if MEMORY_CACHE:
+        _memory[baseline_path] = (stamp, records)
+    return records
+
+def _load_indexed(baseline_path: str, index_path: str, st) -> list:
+    header = _read_header(index_path)
+
+    if header and header.get("version") == INDEX_VERSION and header.get("source_size") == st.st_size:
+        try:
+            if header.get("source_mtime_ns") == st.st_mtime_ns:
+                return _read_records(index_path)
+
+            if header.get("source_sha1") == _file_sha1(baseline_path):
+                records = _read_records(index_path)
+                _write_index(index_path, {**header, "source_mtime_ns": st.st_mtime_ns}, records)
+                return records
+        except _BAD_INDEX:
+            pass
+
+    return build_index(baseline_path, index_path)
@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import compare_trendyol_api as compare
+import trendyol_baseline_index as baseline_index
+
+from trendyol_baseline_index import load_baseline, project_product
+
+# ================= CONFIG =================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# catalogul real din care se multiplică cele sintetice
+SOURCE_CATALOG = os.path.join(BASE_DIR, "products_ro_boots.json")
+
+SCALES = (1, 10, 100)
+REPEAT = 3
+SEED = 1
+
+# rezultatele se adaugă câte o linie JSON per rulare (commit + mașină + timpi per fază)
+RESULTS_FILE = os.path.join(BASE_DIR, "state", "bench_results.ndjson")
+
+# forma listingului sintetic: câteva mărimi per model, sortat crescător, pagini ca ale API-ului
+VARIANTS_PER_MODEL = 3
+PAGE_SIZE = 24
+SIZES = ("41", "41.5", "42", "42.5", "43", "43.5", "44", "44.5", "45", "46")
+
+# ponderi: modele dispărute din listing, modele noi (fără baseline), modele ieftinite puternic (hit)
+MISSING_SHARE = 0.05
+NEW_MODEL_SHARE = 0.05
+HIT_SHARE = 0.08
+
+# o miniatură inline tipică (bytes), ca emailul să fie asamblat cu atașamente
+THUMBNAIL_BYTES = 6_000
+
+LABEL = "bench"
+
+# ordinea din raport
+PHASES = (
+    "baseline_load",      # JSON complet -> sidecar proiectat (prima rulare după o modificare)
+    "baseline_warm",      # sidecar valid, citit direct
+    "baseline_index",     # prepare_category: model_id -> intrările din baseline
+    "new_best",           # merge_page_into_best pe toate paginile
+    "diff",               # diff_entry pentru fiecare model văzut în listing
+    "history",            # attach_history pe hit-uri (SQLite)
+    "cooldown",           # apply_cooldown_filter pe hit-uri (SQLite)
+    "output",             # NDJSON price_changes + finish_category (istoric, missing, rename atomic)
+    "email",              # build_email + serializare MIME, cu miniaturi deja descărcate
+)
+
+# ================= SYNTHETIC DATA =================
+
+def _price_text(value: float) -> str:
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",").replace(" ", ".")
+
+def _with_price(p: dict, value: float) -> dict:
+    """
+    Copie a produsului cu toate câmpurile de preț aliniate la `value` (prețul cu promoție),
+    în formatul API-ului: numeric, text cu virgulă și "Lei", preț de listă cu 25% peste.
+    """
+    value = round(value, 2)
+    selling = round(value * 1.25, 2)
+    out = dict(p)
+
+    price = dict(p.get("price") or {})
+    price.update({
+        "current": selling,
+        "currentText": _price_text(selling),
+        "discountedPrice": value,
+        "discountedPriceText": _price_text(value),
+    })
+    out["price"] = price
+
+    if isinstance(p.get("recommendedRetailPrice"), dict):
+        out["recommendedRetailPrice"] = {
+            **p["recommendedRetailPrice"],
+            "sellingPrice": f"{_price_text(selling)} Lei",
+            "sellingPriceWithoutCurrency": _price_text(selling),
+            "sellingPriceNumerized": selling,
+            "discountedPromotionPrice": f"{_price_text(value)} Lei",
+            "discountedPromotionPriceWithoutCurrency": _price_text(value),
+            "discountedPromotionPriceNumerized": value,
+        }
+    for key in ("singlePrice", "binaryPrice"):
+        if isinstance(p.get(key), dict):
+            out[key] = {
+                **p[key],
+                "salePrice": f"{_price_text(value)} Lei",
+                "salePriceWihoutCurrency": _price_text(value),
+                "strikethroughPrice": _price_text(selling),
+            }
+    return out
+
+def _clone(p: dict, copy_no: int, model_id: int) -> dict:
+    old_id = compare.get_model_id(p)
+    url = p.get("url", "")
+    if old_id is not None:
+        url = url.replace(str(old_id), str(model_id))
+    return {
+        **p,
+        "id": model_id,
+        "contentId": model_id,
+        "groupId": model_id,
+        "name": f"{p.get('name', '')} #{copy_no}",
+        "url": url,
+    }
+
+def synth_catalog(source: list, scale: int, rng: random.Random):
+    """
+    (baseline, listing) pentru `scale` x catalogul sursă:
+    baseline = câte un produs per model cu preț variat; listing = VARIANTS_PER_MODEL mărimi
+    per model, cu MISSING_SHARE modele dispărute, NEW_MODEL_SHARE modele noi și HIT_SHARE ieftiniri mari.
+    """
+    templates = [p for p in source if isinstance(p, dict) and compare.get_model_id(p)]
+    baseline, listing = [], []
+    next_id = 10 ** 10
+    hit_ceiling = compare.PRICE_THRESHOLD_BOOTS / (1 - compare.WELCOME_DISCOUNT_PERCENT / 100)
+
+    for copy_no in range(scale):
+        for tpl in templates:
+            next_id += 1
+            base_price = compare.get_effective_price(tpl) or 300.0
+            old_price = base_price * rng.uniform(0.85, 1.15)
+            product = _clone(tpl, copy_no, next_id)
+
+            r = rng.random()
+            if r >= NEW_MODEL_SHARE:
+                baseline.append(_with_price(product, old_price))
+            if NEW_MODEL_SHARE <= r < NEW_MODEL_SHARE + MISSING_SHARE:
+                continue
+
+            # un hit trebuie să treacă și de plafonul categoriei după codul de bun venit
+            hit = rng.random() < HIT_SHARE
+            hit_price = min(old_price * 0.5, rng.uniform(0.6, 0.95) * hit_ceiling)
+            for v, size in enumerate(rng.sample(SIZES, VARIANTS_PER_MODEL)):
+                price = hit_price if hit and v == 0 else old_price * rng.uniform(0.9, 1.2)
+                variant = _with_price(product, price)
+                variant["variantValue"] = size
+                variant["variantId"] = f"{next_id}-{size}"
+                listing.append(variant)
+
+    listing.sort(key=lambda p: p["price"]["current"])
+    return baseline, listing
+
+def to_pages(listing: list) -> list:
+    # paginile ajung la diff deja proiectate (page_transform în client / proiecția din JS)
+    projected = [project_product(p) for p in listing]
+    return [projected[i:i + PAGE_SIZE] for i in range(0, len(projected), PAGE_SIZE)]
+
+# ================= PHASES =================
+
+def run_phases(workdir: str, products_file: str, pages: list) -> dict:
+    """
+    O rulare a diff-ului din main_single_async, pe faze, într-un director de lucru izolat
+    (state/ și fișierele de output sunt în `workdir`). Întoarce secunde per fază + contoare.
+    """
+    timings = {}
+
+    def timed(name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        timings[name] = time.perf_counter() - t0
+        return out
+
+    index_path = os.path.join(workdir, "baseline.idx")
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    timed("baseline_load", load_baseline, products_file, index_path)
+    old_products = timed("baseline_warm", load_baseline, products_file, index_path)
+
+    threshold = compare.PRICE_THRESHOLD_BOOTS
+    state = timed("baseline_index", compare.prepare_category, products_file, LABEL, threshold, None, old_products)
+
+    def build_new_best():
+        for batch in pages:
+            compare.merge_page_into_best(state["new_best_by_model"], batch)
+    timed("new_best", build_new_best)
+
+    def diff_all():
+        # aceeași buclă ca în apply_page, pe tot listingul odată
+        hits = []
+        for model_id, new_entry in state["new_best_by_model"].items():
+            for idx, old_p, display_name, url in state["old_by_model"].get(model_id, ()):
+                entry = compare.diff_entry(model_id, old_p, display_name, url, new_entry, threshold)
+                if entry is None:
+                    continue
+                state["entries"][idx] = entry
+                if entry["status"] == "hit":
+                    hits.append(entry)
+        return hits
+    hits = timed("diff", diff_all)
+
+    timed("history", compare.attach_history, hits, LABEL, state["run_ts"])
+    sent = timed("cooldown", compare.apply_cooldown_filter, hits, LABEL)
+
+    def write_outputs():
+        if state["writer"]:
+            for entry in state["entries"].values():
+                compare.emit_entry(state, entry)
+        return compare.finish_category(state, sent)
+    summary = timed("output", write_outputs)
+
+    images = {h["image"]: (b"\xff" * THUMBNAIL_BYTES, "image/jpeg") for h in sent if h.get("image")}
+    timed("email", lambda: compare.build_email(sent, LABEL, threshold, images=images).as_bytes())
+
+    return {
+        "timings": timings,
+        "entries": summary["count"],
+        "missing": summary["missing"],
+        "hits": len(hits),
+    }
+
+class _Isolated:
+    """
+    Rulările nu ating state/ și output-urile reale: cwd, STATE_DIR și cache-ul de baseline
+    sunt mutate într-un director temporar pe durata benchmark-ului.
+    """
+
+    def __enter__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="trendyol_bench_")
+        self._saved = (os.getcwd(), compare.STATE_DIR, compare.EMAIL_ENABLED, baseline_index.MEMORY_CACHE)
+        os.chdir(self._tmp.name)
+        compare.STATE_DIR = os.path.join(self._tmp.name, "state")
+        compare.EMAIL_ENABLED = False
+        baseline_index.MEMORY_CACHE = False
+        return self._tmp.name
+
+    def __exit__(self, *exc):
+        cwd, compare.STATE_DIR, compare.EMAIL_ENABLED, baseline_index.MEMORY_CACHE = self._saved
+        os.chdir(cwd)
+        self._tmp.cleanup()
+
+def bench_scale(source: list, scale: int, repeat: int = REPEAT, seed: int = SEED) -> dict:
+    baseline, listing = synth_catalog(source, scale, random.Random(seed))
+    pages = to_pages(listing)
+
+    with _Isolated() as workdir:
+        products_file = os.path.join(workdir, f"products_bench_{scale}x.json")
+        with open(products_file, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False)
+
+        runs = []
+        for i in range(repeat):
+            # fiecare repetare pornește de la state/ gol (cooldown/istoric/delta ca la prima rulare)
+            run_dir = os.path.join(workdir, f"run{i}")
+            os.makedirs(run_dir)
+            os.chdir(run_dir)
+            compare.STATE_DIR = os.path.join(run_dir, "state")
+            runs.append(run_phases(run_dir, products_file, pages))
+
+    timings = {name: min(r["timings"][name] for r in runs) for name in PHASES}
+    medians = {name: statistics.median(r["timings"][name] for r in runs) for name in PHASES}
+    n = max(1, len(listing))
+    return {
+        "scale": scale,
+        "baseline_products": len(baseline),
+        "listing_products": len(listing),
+        "pages": len(pages),
+        "entries": runs[0]["entries"],
+        "missing": runs[0]["missing"],
+        "hits": runs[0]["hits"],
+        "seconds": {k: round(v, 6) for k, v in timings.items()},
+        "median_seconds": {k: round(v, 6) for k, v in medians.items()},
+        "us_per_listing_product": {k: round(v / n * 1e6, 3) for k, v in timings.items()},
+        "total_seconds": round(sum(timings.values()), 6),
+    }
+
+# ================= REPORT =================
+
+def _git_revision() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return rev + ("-dirty" if rev and dirty else "")
+
+def load_previous(path: str = RESULTS_FILE):
+    """
+    Ultima rulare din fișierul de rezultate (pentru comparația cu rularea curentă), sau None.
+    """
+    last = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        last = json.loads(line)
+                    except ValueError:
+                        pass
+    except OSError:
+        return None
+    return last
+
+def append_result(record: dict, path: str = RESULTS_FILE) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8", newline="\n") as f:
+        f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+def print_report(record: dict, previous=None) -> None:
+    prev_by_scale = {r["scale"]: r for r in (previous or {}).get("results", [])}
+    for r in record["results"]:
+        print(f"\n=== {r['scale']}x: {r['baseline_products']} baseline / {r['listing_products']} listing products, "
+              f"{r['hits']} hits, total {r['total_seconds'] * 1000:.1f} ms ===")
+        prev = prev_by_scale.get(r["scale"])
+        for name in PHASES:
+            sec = r["seconds"][name]
+            line = f"  {name:<15} {sec * 1000:>10.2f} ms  {r['us_per_listing_product'][name]:>9.2f} µs/product"
+            if prev and prev["seconds"].get(name):
+                line += f"  ({sec / prev['seconds'][name]:.2f}x vs {previous.get('revision') or 'previous'})"
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic benchmark for the compare diff/notify stages")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    with open(SOURCE_CATALOG, "r", encoding="utf-8") as f:
+        source = json.load(f)
+
+    results = []
+    for scale in args.scales:
+        print(f"[BENCH] {scale}x ...")
+        results.append(bench_scale(source, scale, args.repeat, args.seed))
+
+    record = {
+        "ts": int(time.time()),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "source": os.path.basename(SOURCE_CATALOG),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }
+    previous = load_previous(args.out)
+    print_report(record, previous)
+    append_result(record, args.out)
+    print(f"\n[BENCH] results appended to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl, urlencode, quote
+
+# ================= CONFIG =================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.path.join(BASE_DIR, "state")
+CASSETTE_DIR = os.path.join(STATE_DIR, "cassettes", "default")
+
+# setat de `record`: ApiClient (trendyol_http) salvează fiecare răspuns 200 în caseta din variabilă
+RECORD_ENV = "TRENDYOL_RECORD"
+
+# setat de `replay`: ApiClient se conectează aici în loc de API_BASE (http://127.0.0.1:port)
+API_BASE_ENV = "TRENDYOL_API_BASE"
+
+# orice cale care se termină așa e API-ul de căutare (API_BASE din trendyol_http / compare)
+API_PATH_SUFFIX = "/api/search/products"
+
+# parametri care nu identifică listingul (pagina e cheia separată)
+KEY_IGNORED_PARAMS = {"pi"}
+
+# documente HTML salvate la înregistrare (pagina de vouchere pentru codes checker)
+RECORD_DOC_HOSTS = ("evoucher.ro",)
+
+# paginile trendyol.com nu se înregistrează: la replay primesc un document minim cu butonul de consimțământ
+STUB_DOC_HOSTS = ("trendyol.com",)
+STUB_HTML = (
+    "<!doctype html><html><head><meta charset='utf-8'></head><body>"
+    "<button id='onetrust-accept-btn-handler' onclick='this.remove()'>Accept</button>"
+    "</body></html>"
+)
+
+# răspunsul pentru o pagină care nu e în casetă (ca după ultima pagină a unui listing)
+EMPTY_PAGE = {"products": [], "_links": {}}
+
+MOCK_HOST = "127.0.0.1"
+DOC_PATH = "/__doc__"
+
+# la record și replay: module -> CONFIG suprascris (fiecare rulare e completă, fără skip pe fingerprint;
+# altfel o înregistrare cu pagina 1 neschimbată ar salva doar proba, fără restul paginilor)
+CASSETTE_OVERRIDES = {
+    "compare_trendyol_api": {"SKIP_UNCHANGED": False},
+    "trendyol_top_search": {"SKIP_UNCHANGED": False},
+}
+
+# la record și replay state/ și cwd sunt mutate într-un director temporar:
+# module -> atribut -> cale relativă la state/ temporar
+CASSETTE_STATE_PATHS = {
+    "compare_trendyol_api": {"STATE_DIR": ""},
+    "trendyol_top_search": {"STATE_DIR": ""},
+    "trendyol_http": {"STATE_DIR": ""},
+    "trendyol_store": {"STATE_DIR": ""},
+    "trendyol_ratelimit": {"STATE_DIR": ""},
+    "trendyol_metrics": {"STATE_DIR": ""},
+    "trendyol_images": {"STATE_DIR": "", "CACHE_DIR": "image_cache"},
+    "trendyol_baseline_index": {"STATE_DIR": "", "INDEX_DIR": "baseline_index"},
+    "trendyol_outbox": {"STATE_DIR": "", "OUTBOX_DIR": "outbox"},
+}
+
+# ================= CASSETTE =================
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+def is_api_url(url: str) -> bool:
+    return urlparse(url).path.endswith(API_PATH_SUFFIX)
+
+def listing_key(query: str):
+    """
+    (cheie, pi) pentru query-ul unei cereri către API: cheia e sha1 peste parametrii
+    sortați fără `pi`, deci fetch-ul din pagină și clientul direct ajung la aceeași intrare.
+    """
+    params = parse_qsl(query, keep_blank_values=True)
+    pi = next((v for k, v in params if k == "pi"), "1") or "1"
+    canonical = urlencode(sorted((k, v) for k, v in params if k not in KEY_IGNORED_PARAMS))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16], pi, canonical
+
+class Cassette:
+    """
+    Director cu răspunsurile înregistrate:
+      api/<cheie>/<pi>.json   corpul brut al răspunsului 200
+      docs/<sha1(url)>.html   documentele din RECORD_DOC_HOSTS
+      index.json              cheie -> query canonic, url -> fișier (pentru inspectare)
+    Scrierile sunt thread-safe (ApiClient scrie din workeri).
+    """
+
+    def __init__(self, root: str = CASSETTE_DIR):
+        self.root = root
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(os.path.join(self.root, "index.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        return {"listings": dict(data.get("listings") or {}), "docs": dict(data.get("docs") or {})}
+
+    def _write(self, rel: str, body: bytes) -> None:
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def _read(self, rel: str):
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save_index(self) -> None:
+        self._write("index.json", json.dumps(self._index, ensure_ascii=False, indent=1).encode("utf-8"))
+
+    def record_api(self, url: str, body: bytes) -> None:
+        key, pi, canonical = listing_key(urlparse(url).query)
+        with self._lock:
+            self._write(os.path.join("api", key, f"{pi}.json"), body)
+            self.recorded += 1
+            if self._index["listings"].get(key) != canonical:
+                self._index["listings"][key] = canonical
+                self._save_index()
+
+    def api_page(self, query: str):
+        key, pi, _ = listing_key(query)
+        return self._read(os.path.join("api", key, f"{pi}.json"))
+
+    def record_doc(self, url: str, body: bytes) -> None:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16] + ".html"
+        with self._lock:
+            self._write(os.path.join("docs", name), body)
+            self.recorded += 1
+            if self._index["docs"].get(url) != name:
+                self._index["docs"][url] = name
+                self._save_index()
+
+    def doc(self, url: str):
+        name = self._index["docs"].get(url)
+        return self._read(os.path.join("docs", name)) if name else None
+
+    def summary(self) -> str:
+        pages = 0
+        for key in self._index["listings"]:
+            try:
+                pages += len(os.listdir(os.path.join(self.root, "api", key)))
+            except OSError:
+                pass
+        return f"{len(self._index['listings'])} listing(s), {pages} page(s), {len(self._index['docs'])} document(s)"
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+def recorder_from_env():
+    """
+    Caseta din TRENDYOL_RECORD (una per director în proces), sau None în afara modului record.
+    """
+    root = os.getenv(RECORD_ENV)
+    if not root:
+        return None
+    with _recorders_lock:
+        if root not in _recorders:
+            _recorders[root] = Cassette(root)
+        return _recorders[root]
+
+# ================= MOCK SERVER =================
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", extra=None, cut: bool = False):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        origin = self.headers.get("origin")
+        if origin:
+            # fetch-ul din pagină e cross-origin, cu credentials
+            self.send_header("access-control-allow-origin", origin)
+            self.send_header("access-control-allow-credentials", "true")
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if cut:
+            # răspuns trunchiat: content-length complet, conexiunea se închide la jumătate
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self._send(204, b"", extra={
+            "access-control-allow-methods": "GET, OPTIONS",
+            "access-control-allow-headers": self.headers.get("access-control-request-headers", "*"),
+            "access-control-allow-private-network": "true",
+        })
+
+    def do_GET(self):
+        mock = self.server.mock
+        parsed = urlparse(self.path)
+        mock.delay()
+
+        if parsed.path == DOC_PATH:
+            url = dict(parse_qsl(parsed.query)).get("url", "")
+            body = mock.cassette.doc(url)
+            if body is None:
+                self._send(404, b"not in cassette", "text/plain")
+            else:
+                self._send(200, body, "text/html; charset=utf-8")
+            return
+
+        if not parsed.path.endswith(API_PATH_SUFFIX):
+            self._send(404, b"not found", "text/plain")
+            return
+
+        fault = mock.next_fault()
+        if fault == "429":
+            self._send(429, b'{"error":"too many requests"}', extra={"retry-after": "1"})
+            return
+
+        body = mock.cassette.api_page(parsed.query)
+        if body is None:
+            mock.count("missing")
+            body = json.dumps(EMPTY_PAGE).encode("utf-8")
+        self._send(200, body, cut=fault == "truncate")
+
+class MockSearchServer:
+    """
+    Înlocuitor local pentru API-ul de căutare, servit din casetă (ThreadingHTTPServer pe un thread propriu).
+    Erorile injectate sunt reproductibile cu același `seed`:
+      latency_ms (+ jitter_ms aleator) la fiecare cerere, rate_429 = probabilitatea unui 429,
+      truncate = probabilitatea unui corp tăiat la jumătate (conexiune închisă).
+    """
+
+    def __init__(self, cassette: Cassette, latency_ms: float = 0, jitter_ms: float = 0, rate_429: float = 0.0,
+                 truncate: float = 0.0, seed=None, host: str = MOCK_HOST, port: int = 0):
+        self.cassette = cassette
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.truncate = truncate
+        self.counters = {"requests": 0, "throttled": 0, "truncated": 0, "missing": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _MockHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def api_url(self, url: str) -> str:
+        parsed = urlparse(url)
+        return self.base_url + parsed.path + ("?" + parsed.query if parsed.query else "")
+
+    def doc_url(self, url: str) -> str:
+        return f"{self.base_url}{DOC_PATH}?url={quote(url, safe='')}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-search-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def delay(self) -> None:
+        with self._lock:
+            ms = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def next_fault(self):
+        with self._lock:
+            self.counters["requests"] += 1
+            r = self._rng.random()
+            if r < self.rate_429:
+                self.counters["throttled"] += 1
+                return "429"
+            if r < self.rate_429 + self.truncate:
+                self.counters["truncated"] += 1
+                return "truncate"
+            return None
+
+    def summary(self) -> str:
+        c = self.counters
+        return (f"{c['requests']} API requests, {c['throttled']} injected 429, "
+                f"{c['truncated']} truncated, {c['missing']} not in cassette")
+
+# ================= BROWSER =================
+
+async def install_recorder(context, cassette: Cassette) -> None:
+    """
+    Pe un BrowserContext (playwright.async_api): răspunsurile API din fetch-urile paginii și
+    documentele din RECORD_DOC_HOSTS sunt descărcate prin route.fetch(), salvate și livrate neschimbate.
+    """
+    async def handle(route):
+        request = route.request
+        host = (urlparse(request.url).hostname or "").lower()
+        is_doc = request.resource_type == "document" and _host_matches(host, RECORD_DOC_HOSTS)
+        if not is_api_url(request.url) and not is_doc:
+            await route.fallback()
+            return
+        resp = await route.fetch()
+        body = await resp.body()
+        if resp.status == 200:
+            if is_doc:
+                cassette.record_doc(request.url, body)
+            else:
+                cassette.record_api(request.url, body)
+        await route.fulfill(response=resp, body=body)
+
+    await context.route("**/*", handle)
+
+async def install_replay(context, server: MockSearchServer) -> None:
+    """
+    Contextul nu mai iese în rețea: API-ul merge la serverul local, documentele înregistrate
+    vin tot de acolo, paginile trendyol.com primesc STUB_HTML, restul e abandonat.
+    """
+    async def handle(route):
+        request = route.request
+        url = request.url
+        host = (urlparse(url).hostname or "").lower()
+        try:
+            if is_api_url(url):
+                await route.fulfill(response=await route.fetch(url=server.api_url(url)))
+            elif request.resource_type == "document" and _host_matches(host, STUB_DOC_HOSTS):
+                await route.fulfill(status=200, content_type="text/html", body=STUB_HTML)
+            elif request.resource_type == "document":
+                await route.fulfill(response=await route.fetch(url=server.doc_url(url)))
+            else:
+                await route.abort("internetdisconnected")
+        except Exception:
+            # răspuns trunchiat / server oprit: fetch-ul din pagină vede o eroare de rețea (status -1)
+            await route.abort("failed")
+
+    await context.route("**/*", handle)
+
+class CassetteBrowser:
+    """
+    Browserul comun, cu `install(context)` aplicat pe fiecare context nou;
+    checker-ele îl primesc ca pe un Browser obișnuit (main_async(browser=...)).
+    """
+
+    def __init__(self, browser, install):
+        self._browser = browser
+        self._install = install
+
+    async def new_context(self, **kwargs):
+        context = await self._browser.new_context(**kwargs)
+        await self._install(context)
+        return context
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+# ================= RUN =================
+
+def _isolate_run() -> None:
+    # rulările record/replay nu trimit emailuri (variabila e citită la importul checker-elor)
+    os.environ.pop("GMAIL_APP_PASSWORD", None)
+
+class IsolatedState:
+    """
+    Record/replay nu ating state/ și output-urile reale (cooldown-urile din trendyol.db ar
+    suprima alertele reale): cwd, căile din CASSETTE_STATE_PATHS și CASSETTE_OVERRIDES
+    sunt schimbate pe durata rulării și refăcute la ieșire.
+    Bazele top_search sunt copiate în state/ temporar (altfel categoriile ar fi BASE MISSING).
+    Cu `keep`, directorul temporar rămâne pe disc (run_report.json, trendyol.db, output-uri).
+    """
+
+    def __init__(self, keep: bool = False, mode: str = "replay"):
+        self.keep = keep
+        self.mode = mode
+        self.root = None
+        self.state_dir = None
+
+    def __enter__(self):
+        from trendyol_ratelimit import AdaptiveLimiter, set_shared_limiter
+
+        self.root = tempfile.mkdtemp(prefix=f"trendyol_{self.mode}_")
+        self.state_dir = os.path.join(self.root, "state")
+        os.makedirs(self.state_dir)
+
+        self._saved = []
+        for table in (CASSETTE_STATE_PATHS, CASSETTE_OVERRIDES):
+            for module_name, attrs in table.items():
+                module = importlib.import_module(module_name)
+                for attr, value in attrs.items():
+                    if table is CASSETTE_STATE_PATHS:
+                        value = os.path.join(self.state_dir, value) if value else self.state_dir
+                    self._saved.append((module, attr, getattr(module, attr)))
+                    setattr(module, attr, value)
+
+        for cfg in importlib.import_module("trendyol_top_search").CATEGORIES.values():
+            src = os.path.join(STATE_DIR, cfg["base_file"])
+            if os.path.exists(src):
+                shutil.copy2(src, self.state_dir)
+
+        # rata învățată aici (server local / sesiune de înregistrare) nu se salvează în state/
+        set_shared_limiter(AdaptiveLimiter())
+        self._cwd = os.getcwd()
+        os.chdir(self.root)
+        return self
+
+    def __exit__(self, *exc):
+        from trendyol_ratelimit import set_shared_limiter
+        from trendyol_store import close_store
+
+        os.chdir(self._cwd)
+        close_store(self.state_dir)
+        set_shared_limiter(None)
+        for module, attr, value in reversed(self._saved):
+            setattr(module, attr, value)
+        if self.keep:
+            print(f"[CASSETTE] {self.mode} state kept in {self.root}")
+        else:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+async def record_async(root: str, names=None, keep_state: bool = False) -> list:
+    import trendyol_run
+
+    # caseta e scrisă și după chdir-ul din IsolatedState
+    root = os.path.abspath(root)
+    cassette = Cassette(root)
+    _isolate_run()
+
+    async def install(context):
+        await install_recorder(context, cassette)
+
+    os.environ[RECORD_ENV] = root
+    try:
+        with IsolatedState(keep_state, "record"):
+            runs = await trendyol_run.main_async(names, browser_wrapper=lambda b: CassetteBrowser(b, install))
+    finally:
+        os.environ.pop(RECORD_ENV, None)
+    print(f"[CASSETTE] recorded into {root}: {cassette.summary()}")
+    return runs
+
+async def replay_async(root: str, names=None, keep_state: bool = False, **faults) -> list:
+    import trendyol_run
+
+    # caseta e citită și după chdir-ul din IsolatedState
+    cassette = Cassette(os.path.abspath(root))
+    _isolate_run()
+
+    with IsolatedState(keep_state), MockSearchServer(cassette, **faults) as server:
+        os.environ[API_BASE_ENV] = server.base_url
+        print(f"[CASSETTE] replaying {root} ({cassette.summary()}) on {server.base_url}")
+
+        async def install(context):
+            await install_replay(context, server)
+
+        try:
+            runs = await trendyol_run.main_async(names, browser_wrapper=lambda b: CassetteBrowser(b, install))
+        finally:
+            os.environ.pop(API_BASE_ENV, None)
+        print(f"[CASSETTE] mock API: {server.summary()}")
+    return runs
+
+def serve(root: str, **faults) -> None:
+    cassette = Cassette(root)
+    with MockSearchServer(cassette, **faults) as server:
+        print(f"[CASSETTE] serving {root} ({cassette.summary()}) on {server.base_url}")
+        print(f"  {API_BASE_ENV}={server.base_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        print(f"[CASSETTE] mock API: {server.summary()}")
+
+def _fault_args(parser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--truncate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+def main():
+    # python trendyol_cassette.py record [--dir D] [--keep-state] [compare] [top_search] [codes]
+    # python trendyol_cassette.py replay [--dir D] [--keep-state] [--latency-ms 80 --rate-429 0.05 --truncate 0.02 --seed 1] [checkers...]
+    # python trendyol_cassette.py serve  [--dir D] [--port 8765] [erori injectate]
+    parser = argparse.ArgumentParser(description="Record/replay Trendyol API responses")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    rec = sub.add_parser("record")
+    rec.add_argument("--dir", default=CASSETTE_DIR)
+    rec.add_argument("--keep-state", action="store_true")
+    rec.add_argument("checkers", nargs="*")
+
+    rep = sub.add_parser("replay")
+    rep.add_argument("--dir", default=CASSETTE_DIR)
+    rep.add_argument("--keep-state", action="store_true")
+    _fault_args(rep)
+    rep.add_argument("checkers", nargs="*")
+
+    srv = sub.add_parser("serve")
+    srv.add_argument("--dir", default=CASSETTE_DIR)
+    srv.add_argument("--port", type=int, default=8765)
+    _fault_args(srv)
+
+    args = parser.parse_args()
+    faults = {k: getattr(args, k, None) for k in ("latency_ms", "jitter_ms", "rate_429", "truncate", "seed")}
+
+    if args.mode == "serve":
+        serve(args.dir, port=args.port, **faults)
+        return
+    if args.mode == "record":
+        runs = asyncio.run(record_async(args.dir, args.checkers, args.keep_state))
+    else:
+        runs = asyncio.run(replay_async(args.dir, args.checkers, args.keep_state, **faults))
+    sys.exit(0 if all(r["ok"] for r in runs) else 1)
+
+if __name__ == "__main__":
+    main()
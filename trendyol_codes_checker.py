@@ -1,10 +1,15 @@
+import asyncio
 import os
 import re
 import ssl
 import smtplib
 import certifi
 from email.message import EmailMessage
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+from trendyol_http import browser_session
+from trendyol_metrics import metrics, scope, span
+from trendyol_routes import RoutePolicy, install_blocking
 
 URL = "https://www.evoucher.ro/magazin/trendyol/"
 
@@ -22,10 +27,11 @@ EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD", "")
 THRESHOLD = 40            # dacă vrei alertă doar peste 40
 HEADLESS = True          # pune True după ce confirmi că merge
 ALWAYS_SEND = True        # dacă True -> trimite și când nu găsește nimic
+BLOCK_RESOURCES = True    # fără imagini/fonturi/trackere: procentele sunt text
 
 PERCENT_RE = re.compile(r"(\d{1,3})\s*%")
 
-def accept_cookies(page):
+async def accept_cookies(page):
     candidates = [
         "button:has-text('Accept')",
         "button:has-text('Accept all')",
@@ -34,12 +40,15 @@ def accept_cookies(page):
         "button:has-text('Accept toate')",
         "button:has-text('OK')",
     ]
-    for sel in candidates:
-        try:
-            page.locator(sel).first.click(timeout=1500)
-            return
-        except Exception:
-            pass
+    with span("cookies") as sp:
+        for sel in candidates:
+            try:
+                await page.locator(sel).first.click(timeout=1500)
+                sp["status"] = "accepted"
+                return
+            except Exception:
+                pass
+        sp["status"] = "absent"
 
 def extract_percents_from_text(text: str):
     percents = set()
@@ -52,7 +61,7 @@ def extract_percents_from_text(text: str):
 import re
 PERCENT_RE = re.compile(r"(\d{1,3})\s*%")
 
-def get_percents(page):
+async def get_percents(page):
     percents = set()
 
     # 1) exact din div-urile care conțin procentul din card (cum ai în poză)
@@ -66,8 +75,8 @@ def get_percents(page):
     for sel in selectors:
         try:
             nodes = page.locator(sel)
-            for i in range(nodes.count()):
-                txt = (nodes.nth(i).inner_text() or "").strip()
+            for i in range(await nodes.count()):
+                txt = (await nodes.nth(i).inner_text() or "").strip()
                 m = PERCENT_RE.search(txt)
                 if m:
                     p = int(m.group(1))
@@ -80,7 +89,7 @@ def get_percents(page):
     # (nu în tot body)
     if not percents:
         try:
-            cards_text = page.evaluate("""
+            cards_text = await page.evaluate("""
                 () => Array.from(document.querySelectorAll(".hr_grid_img, .deal_string, a[href*='/cupon-trendyol/']"))
                   .map(el => (el.innerText || el.textContent || "").trim())
                   .join("\\n")
@@ -127,7 +136,7 @@ def send_email(percents, above_threshold):
     msg.set_content(text)
 
     ctx = ssl.create_default_context(cafile=certifi.where())
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+    with span("smtp"), smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
         server.starttls(context=ctx)
         server.login(EMAIL_USER, EMAIL_PASSWORD)
         server.send_message(msg)
@@ -135,34 +144,54 @@ def send_email(percents, above_threshold):
     print("📧 Email sent:", subject)
 
 
-def main():
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=HEADLESS)
-        context = browser.new_context()
-        page = context.new_page()
+async def check_percents(browser):
+    context = await browser.new_context()
+    routes = await install_blocking(context, RoutePolicy(URL)) if BLOCK_RESOURCES else None
+    try:
+        page = await context.new_page()
 
-        page.goto(URL, wait_until="domcontentloaded", timeout=60000)
-        accept_cookies(page)
+        with span("navigation"):
+            await page.goto(URL, wait_until="domcontentloaded", timeout=60000)
+        await accept_cookies(page)
 
         # scroll ca să declanșeze lazy loading (dacă există)
         try:
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            page.wait_for_timeout(800)
-            page.evaluate("window.scrollTo(0, 0)")
-            page.wait_for_timeout(300)
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            await page.wait_for_timeout(800)
+            await page.evaluate("window.scrollTo(0, 0)")
+            await page.wait_for_timeout(300)
         except Exception:
             pass
 
-        percents = get_percents(page)
-        above = [x for x in percents if x > THRESHOLD]
+        return await get_percents(page)
+    finally:
+        await context.close()
+        if routes is not None:
+            print(f"[ROUTES] {routes.summary()}")
 
-        print("Found percents:", percents)
-        print(f"Above {THRESHOLD}%:", above)
+async def _launch_browser(p):
+    return await p.chromium.launch(headless=HEADLESS)
 
-        browser.close()
+async def main_async(browser=None):
+    # browser primit = Chromium comun (daemon / runner), rămâne deschis
+    async with browser_session(async_playwright, _launch_browser, browser) as b:
+        percents = await check_percents(b)
+
+    above = [x for x in percents if x > THRESHOLD]
+
+    print("Found percents:", percents)
+    print(f"Above {THRESHOLD}%:", above)
 
     if percents or ALWAYS_SEND:
-        send_email(percents, above)
+        await asyncio.to_thread(send_email, percents, above)
+
+    return {"percents": percents, "above": above}
+
+def main():
+    with scope(job="codes"):
+        asyncio.run(main_async())
+    report, prom = metrics().export()
+    print(f"[METRICS] {report} | {prom}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,244 @@
+import asyncio
+import importlib
+import json
+import os
+import signal
+import time
+
+from playwright.async_api import async_playwright
+
+from trendyol_metrics import metrics, scope
+from trendyol_ratelimit import shared_limiter
+from trendyol_run import BROWSER_ARGS, CHECKERS, describe_result
+
+# ================= CONFIG =================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# opțional: suprascrie intervalele / dezactivează job-uri, recitit la fiecare modificare
+# {"jobs": {"compare": {"interval_minutes": 10}, "codes": {"enabled": false}}}
+CONFIG_FILE = os.path.join(BASE_DIR, "daemon.json")
+
+# job -> modulul cu main_async(browser=...) și intervalul implicit (același program ca cron-ul din .github/workflows/run.yml)
+DEFAULT_JOBS = {
+    "compare": {"module": CHECKERS["compare"], "interval_minutes": 20, "enabled": True},
+    "top_search": {"module": CHECKERS["top_search"], "interval_minutes": 15, "enabled": True},
+    "codes": {"module": CHECKERS["codes"], "interval_minutes": 20, "enabled": True},
+}
+
+# cât de des se verifică daemon.json pe disc (secunde)
+WATCH_EVERY = 5
+
+# o rulare blocată nu ține job-ul pe loc la infinit
+JOB_TIMEOUT = 20 * 60
+
+# ================= JOBS =================
+
+class Job:
+    """
+    Un script rulat periodic în același proces. Modulul e reîncărcat (importlib.reload)
+    înainte de rulare dacă fișierul .py s-a schimbat, deci CONFIG-ul scriptului se preia fără restart.
+    """
+
+    def __init__(self, name: str, module: str, interval_minutes: float, enabled: bool = True):
+        self.name = name
+        self.module_name = module
+        self.interval = interval_minutes * 60
+        self.enabled = enabled
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_duration = None
+        self._module = None
+        self._mtime = None
+
+    def module(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.module_name)
+            self._mtime = _mtime(self._module.__file__)
+            return self._module
+
+        mtime = _mtime(self._module.__file__)
+        if mtime != self._mtime:
+            print(f"[DAEMON] {self.module_name}.py changed → reloading")
+            self._module = importlib.reload(self._module)
+            self._mtime = mtime
+        return self._module
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def load_config(path: str = CONFIG_FILE) -> dict:
+    """
+    DEFAULT_JOBS suprascris cu daemon.json; un fișier lipsă sau invalid lasă valorile implicite.
+    """
+    jobs = {name: dict(cfg) for name, cfg in DEFAULT_JOBS.items()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return jobs
+    except (OSError, ValueError) as e:
+        print(f"⚠ [DAEMON] {path} unreadable, keeping defaults: {e}")
+        return jobs
+
+    for name, override in ((data or {}).get("jobs") or {}).items():
+        if name in jobs and isinstance(override, dict):
+            jobs[name].update(override)
+    return jobs
+
+# ================= DAEMON =================
+
+class Daemon:
+    """
+    Un Chromium ținut pornit și partajat de toate job-urile; fiecare job are
+    bucla lui (nu se suprapune cu el însuși), job-urile diferite pot rula simultan.
+    """
+
+    def __init__(self, config_path: str = CONFIG_FILE):
+        self.config_path = config_path
+        self.jobs = {}
+        self.browser = None
+        self._pw = None
+        self._browser_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._config_mtime = None
+        self.apply_config()
+
+    def apply_config(self) -> None:
+        self._config_mtime = _mtime(self.config_path)
+        for name, cfg in load_config(self.config_path).items():
+            job = self.jobs.get(name)
+            if job is None:
+                self.jobs[name] = Job(name, cfg["module"], float(cfg["interval_minutes"]), bool(cfg.get("enabled", True)))
+                continue
+            job.interval = float(cfg["interval_minutes"]) * 60
+            job.enabled = bool(cfg.get("enabled", True))
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{j.name}={'every %gm' % (j.interval / 60) if j.enabled else 'off'}" for j in self.jobs.values()
+        )
+
+    async def get_browser(self):
+        """
+        Browserul comun; repornit dacă a căzut între rulări.
+        """
+        async with self._browser_lock:
+            if self.browser is None or not self.browser.is_connected():
+                if self.browser is not None:
+                    print("⚠ [DAEMON] browser disconnected → relaunching")
+                self.browser = await self._pw.chromium.launch(headless=True, args=BROWSER_ARGS)
+            return self.browser
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._changed.set()
+
+    async def _sleep(self, seconds: float) -> None:
+        # se trezește mai devreme la stop sau la o modificare de config (intervalul se recalculează)
+        try:
+            await asyncio.wait_for(self._wait_wakeup(), timeout=max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _wait_wakeup(self) -> None:
+        stop = asyncio.ensure_future(self._stop.wait())
+        changed = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait({stop, changed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+            changed.cancel()
+
+    async def run_job(self, job: Job) -> None:
+        started = time.perf_counter()
+        result = None
+        try:
+            module = job.module()
+            browser = await self.get_browser()
+            print(f"\n[DAEMON] ▶ {job.name} (run #{job.runs + 1})")
+            with scope(job=job.name):
+                result = await asyncio.wait_for(module.main_async(browser=browser), timeout=JOB_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            print(f"❌ [DAEMON] {job.name} failed: {type(e).__name__}: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.perf_counter() - started
+            # rata învățată se păstrează și dacă procesul e oprit brusc
+            shared_limiter().save()
+            # metricile sunt cumulate de la pornirea daemon-ului (contoare pentru Prometheus)
+            metrics().export()
+        details = describe_result(result)
+        print(f"[DAEMON] ■ {job.name} done in {job.last_duration:.1f}s" + (f" | {details}" if details else ""))
+
+    async def job_loop(self, job: Job) -> None:
+        while not self._stop.is_set():
+            if not job.enabled:
+                await self._sleep(WATCH_EVERY)
+                continue
+
+            # ritm fix față de ultima pornire; după o rulare mai lungă decât intervalul, următoarea pleacă imediat.
+            # Trezit de o modificare de config, recalculează cu intervalul nou.
+            if job.last_started is not None:
+                wait = job.last_started + job.interval - time.monotonic()
+                if wait > 0:
+                    await self._sleep(wait)
+                    continue
+
+            job.last_started = time.monotonic()
+            await self.run_job(job)
+
+    async def watch_config(self) -> None:
+        while not self._stop.is_set():
+            await self._sleep(WATCH_EVERY)
+            mtime = _mtime(self.config_path)
+            if mtime != self._config_mtime:
+                self.apply_config()
+                print(f"[DAEMON] {os.path.basename(self.config_path)} reloaded: {self.describe()}")
+                # trezește buclele care dorm; evenimentul e rearmat imediat
+                self._changed.set()
+                self._changed.clear()
+
+    async def run(self) -> None:
+        async with async_playwright() as pw:
+            self._pw = pw
+            await self.get_browser()
+            print(f"[DAEMON] started: {self.describe()}")
+            tasks = [asyncio.create_task(self.job_loop(job)) for job in self.jobs.values()]
+            tasks.append(asyncio.create_task(self.watch_config()))
+            try:
+                await self._stop.wait()
+            finally:
+                # job-urile în curs își termină rularea (emailurile din outbox pleacă)
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self.browser is not None and self.browser.is_connected():
+                    await self.browser.close()
+        print("[DAEMON] stopped")
+
+async def main_async():
+    daemon = Daemon()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, daemon.stop)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C ajunge ca KeyboardInterrupt
+            pass
+    await daemon.run()
+
+def main():
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
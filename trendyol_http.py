@@ -0,0 +1,576 @@
+import asyncio
+import gzip
+import http.client
+import json
+import os
+import queue
+import random
+import ssl
+import time
+import zlib
+import certifi
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from trendyol_cassette import API_BASE_ENV, recorder_from_env
+from trendyol_metrics import bind_context, observe, span
+from trendyol_ratelimit import shared_limiter
+from trendyol_routes import RoutePolicy, install_blocking
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+COOKIES_FILE = "trendyol_cookies.json"
+
+# storage_state Playwright (cookies cu consimțământul dat + localStorage), refolosit între rulări
+STORAGE_STATE_FILE = "trendyol_storage_state.json"
+STORAGE_STATE_MAX_AGE = 12 * 3600
+
+HOME_URL = "https://www.trendyol.com/ro"
+
+# navigările din browser nu descarcă imagini/media/fonturi și trackere (vezi trendyol_routes)
+BLOCK_RESOURCES = True
+
+# document gol servit local pe originea trendyol.com: fetch-urile din pagină
+# primesc cookie-urile contextului fără nicio navigare reală
+SESSION_STUB_URL = "https://www.trendyol.com/ro/__session__"
+
+# bannerul OneTrust + variantele de text (has-text e case-insensitive și pe subșir)
+COOKIE_BUTTONS = "#onetrust-accept-btn-handler, button:has-text('Accept')"
+
+UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/121.0.0.0 Safari/537.36"
+)
+
+API_BASE = "https://apigw.trendyol.com/discovery-sfint-search-service/api/search/products"
+API_EXTRA_PARAMS = {
+    "culture": "ro-RO",
+    "storefrontId": "29",
+    "channelId": "1",
+    "pathModel": "sr",
+    "countryCode": "RO",
+    "language": "ro",
+}
+
+# aceleași headere ca fetch()-ul din pagină
+API_HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "accept-language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7",
+    "x-country-code": "RO",
+}
+
+# la aceste statusuri renunțăm la clientul direct și trecem pe fetch-ul din browser
+BLOCKED_STATUSES = {403, 429}
+
+# retry doar pentru pagina eșuată: backoff exponențial cu jitter, plafonat
+PAGE_RETRIES = 3
+RETRY_BASE_S = 0.5
+RETRY_CAP_S = 8.0
+
+# câte pagini pot lipsi după retry-uri înainte ca listingul să fie considerat eșuat
+MAX_MISSING_PAGES = 8
+
+# ================= HELPERS =================
+
+class ListingFetchError(RuntimeError):
+    def __init__(self, status, error: str = ""):
+        super().__init__(f"API blocked/failed (status={status})")
+        self.status = status
+        self.error = error
+
+def build_api_url(listing_url: str, pi: int) -> str:
+    qs = dict(parse_qsl(urlparse(listing_url).query))
+    qs.update(API_EXTRA_PARAMS)
+    qs["pi"] = str(pi)
+    return API_BASE + "?" + urlencode(qs, doseq=True)
+
+def is_blocked(status) -> bool:
+    return status in BLOCKED_STATUSES
+
+def is_retryable(status) -> bool:
+    """
+    Erori trecătoare (rețea, timeout, 5xx). 403/429 nu: pe clientul direct înseamnă fallback pe browser.
+    """
+    return status == -1 or status == 408 or (status or 0) >= 500
+
+def retry_delay(attempt: int, base: float = RETRY_BASE_S, cap: float = RETRY_CAP_S) -> float:
+    """
+    Secunde de așteptat înainte de retry-ul `attempt` (0, 1, ...): jumătate fix, jumătate aleator,
+    ca workerii care au eșuat odată să nu revină toți în aceeași clipă.
+    """
+    d = min(cap, base * (2 ** attempt))
+    return d / 2 + random.uniform(0, d / 2)
+
+def listing_coverage(stats: dict) -> float:
+    """
+    Fracțiunea de pagini primite din cele încercate (1.0 = listing complet).
+    """
+    ok = stats.get("pages_ok", 0)
+    missing = len(stats.get("missing_pages") or [])
+    return ok / (ok + missing) if ok + missing else 1.0
+
+def _cookies_path(state_dir: str) -> str:
+    return os.path.join(state_dir or STATE_DIR, COOKIES_FILE)
+
+def load_cookies(state_dir: str = None) -> list:
+    """
+    Cookie-urile salvate după warm-up (format Playwright context.cookies()).
+    Cele expirate sunt ignorate.
+    """
+    try:
+        with open(_cookies_path(state_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception:
+        return []
+
+    now = time.time()
+    cookies = []
+    for c in data if isinstance(data, list) else []:
+        if not isinstance(c, dict) or not c.get("name"):
+            continue
+        exp = c.get("expires", -1)
+        if exp not in (None, -1) and float(exp) < now:
+            continue
+        cookies.append(c)
+    return cookies
+
+def save_cookies(cookies: list, state_dir: str = None) -> None:
+    state_dir = state_dir or STATE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    path = _cookies_path(state_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cookies, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def cookie_header(cookies: list, host: str) -> str:
+    parts = []
+    for c in cookies:
+        domain = (c.get("domain") or "").lstrip(".")
+        if domain and not (host == domain or host.endswith("." + domain)):
+            continue
+        parts.append(f"{c['name']}={c.get('value', '')}")
+    return "; ".join(parts)
+
+async def accept_cookies(page, timeout: int = 4000) -> bool:
+    """
+    Așteaptă bannerul de cookies (apariția lui, nu un sleep fix), apasă
+    și așteaptă să dispară. False dacă nu apare în `timeout` ms.
+    """
+    button = page.locator(COOKIE_BUTTONS).first
+    with span("cookies") as sp:
+        try:
+            await button.wait_for(state="visible", timeout=timeout)
+            await button.click(timeout=timeout)
+            await button.wait_for(state="hidden", timeout=timeout)
+            sp["status"] = "accepted"
+            return True
+        except Exception:
+            sp["status"] = "absent"
+            return False
+
+def _storage_state_path(state_dir: str) -> str:
+    return os.path.join(state_dir or STATE_DIR, STORAGE_STATE_FILE)
+
+def load_storage_state(state_dir: str = None):
+    """
+    Calea storage_state-ului salvat dacă sesiunea e încă validă
+    (mai nou de STORAGE_STATE_MAX_AGE și cu cel puțin un cookie neexpirat), altfel None.
+    """
+    path = _storage_state_path(state_dir)
+    try:
+        if time.time() - os.path.getmtime(path) > STORAGE_STATE_MAX_AGE:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    cookies = data.get("cookies") if isinstance(data, dict) else None
+    now = time.time()
+    for c in cookies or []:
+        if not isinstance(c, dict):
+            continue
+        exp = c.get("expires", -1)
+        if exp in (None, -1) or float(exp) >= now:
+            return path
+    return None
+
+async def save_storage_state(context, state_dir: str = None) -> None:
+    """
+    storage_state-ul contextului în state/ (atomic) + cookie-urile pentru clientul direct.
+    """
+    data = await context.storage_state()
+    state_dir = state_dir or STATE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    path = _storage_state_path(state_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    save_cookies(data.get("cookies") or [], state_dir)
+
+def discard_storage_state(state_dir: str = None) -> None:
+    try:
+        os.remove(_storage_state_path(state_dir))
+    except OSError:
+        pass
+
+async def open_session_page(page) -> None:
+    """
+    Pune pagina pe originea trendyol.com fără rețea: SESSION_STUB_URL e servit din route.
+    Folosit când contextul are deja sesiunea (storage_state), în locul navigării.
+    """
+    await page.route(SESSION_STUB_URL, lambda route: route.fulfill(
+        status=200, content_type="text/html", body="<!doctype html><title></title>",
+    ))
+    with span("navigation"):
+        await page.goto(SESSION_STUB_URL, wait_until="commit")
+
+async def warm_up_cookies(browser, accept_cookies=accept_cookies, state_dir: str = None) -> list:
+    """
+    Warm-up scurt: o singură navigare pe homepage, accept cookies,
+    apoi salvăm sesiunea (storage_state + cookies) în state/.
+    `browser` e din playwright.async_api, `accept_cookies` o corutină (page).
+    """
+    session = load_storage_state(state_dir)
+    context = await browser.new_context(user_agent=UA, locale="ro-RO", storage_state=session)
+    try:
+        if session is None:
+            routes = await install_blocking(context, RoutePolicy(HOME_URL)) if BLOCK_RESOURCES else None
+            page = await context.new_page()
+            with span("navigation"):
+                await page.goto(HOME_URL, timeout=120000, wait_until="domcontentloaded")
+            await accept_cookies(page)
+            if routes is not None:
+                print(f"[ROUTES] warm-up: {routes.summary()}")
+        await save_storage_state(context, state_dir)
+        cookies = await context.cookies()
+    finally:
+        await context.close()
+
+    return cookies
+
+@asynccontextmanager
+async def browser_session(async_playwright, launch, browser=None):
+    """
+    Browserul primit din afară (daemon, runner comun) -> folosit și lăsat deschis;
+    altfel unul nou, lansat cu `launch(p)` și închis la ieșire.
+    `async_playwright` e cel din playwright.async_api (importat de script).
+    """
+    if browser is not None:
+        yield browser
+        return
+    async with async_playwright() as p:
+        own = await launch(p)
+        try:
+            yield own
+        finally:
+            await own.close()
+
+async def aiter_in_thread(gen):
+    """
+    Consumă un generator blocant (ex: ApiClient.iter_listing) dintr-un thread,
+    ca să nu blocheze event loop-ul. Generatorul e închis și la ieșire prematură.
+    """
+    done = object()
+    try:
+        while True:
+            item = await asyncio.to_thread(next, gen, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        await asyncio.to_thread(gen.close)
+
+def _decode_body(raw: bytes, encoding: str) -> bytes:
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    if encoding == "deflate":
+        return zlib.decompress(raw)
+    return raw
+
+def _extract_total(data: dict) -> int:
+    meta = data.get("_meta") or {}
+    for v in (data.get("totalCount"), data.get("total"), data.get("productCount"), meta.get("totalCount")):
+        try:
+            if v is not None:
+                return int(v)
+        except (TypeError, ValueError):
+            pass
+    return 0
+
+# ================= CLIENT =================
+
+class ApiClient:
+    """
+    Client keep-alive pentru API_BASE, fără browser.
+    Ține un pool de conexiuni HTTPS reutilizate între pagini și categorii.
+    Ritmul cererilor vine din `limiter` (implicit cel comun din trendyol_ratelimit).
+    Cu TRENDYOL_API_BASE setat (replay, vezi trendyol_cassette) cererile merg la serverul local;
+    `recorder` (implicit caseta din TRENDYOL_RECORD) primește fiecare răspuns 200.
+    """
+
+    def __init__(self, cookies=None, pool_size: int = 6, timeout: float = 20, limiter=None, recorder=None):
+        self.cookies = list(cookies or [])
+        self.limiter = limiter if limiter is not None else shared_limiter()
+        self.recorder = recorder if recorder is not None else recorder_from_env()
+        self.timeout = timeout
+        base = urlparse(os.getenv(API_BASE_ENV) or API_BASE)
+        self.host = base.netloc
+        self._plain_http = base.scheme == "http"
+        self._ctx = ssl.create_default_context(cafile=certifi.where())
+        self._pool = queue.LifoQueue()
+        self._pool_size = pool_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            if self._plain_http:
+                return http.client.HTTPConnection(self.host, timeout=self.timeout)
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self._ctx)
+
+    def _release(self, conn):
+        if self._pool.qsize() < self._pool_size:
+            self._pool.put(conn)
+        else:
+            conn.close()
+
+    def _headers(self) -> dict:
+        headers = {
+            **API_HEADERS,
+            "user-agent": UA,
+            "accept-encoding": "gzip, deflate",
+            "origin": "https://www.trendyol.com",
+            "referer": "https://www.trendyol.com/",
+            "connection": "keep-alive",
+        }
+        ck = cookie_header(self.cookies, self.host)
+        if ck:
+            headers["cookie"] = ck
+        return headers
+
+    def get_json(self, url: str) -> dict:
+        """
+        Același contract ca fetch()-ul din pagină:
+        {ok, status, data, error}; status=-1 pentru erori de rețea.
+        """
+        self.limiter.acquire()
+        res = self._get_json(url)
+        self.limiter.feedback(res["status"])
+        return res
+
+    def _get_json(self, url: str) -> dict:
+        parsed = urlparse(url)
+        path = parsed.path + ("?" + parsed.query if parsed.query else "")
+
+        # o conexiune keep-alive poate fi închisă de server între cereri -> un retry pe una nouă
+        for attempt in range(2):
+            started = time.perf_counter()
+            conn = self._acquire()
+            try:
+                conn.request("GET", path, headers=self._headers())
+                resp = conn.getresponse()
+                raw = resp.read()
+                status = resp.status
+                encoding = resp.getheader("content-encoding", "")
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                observe("api_page", time.perf_counter() - started, status=-1, error=True)
+                return {"ok": False, "status": -1, "data": None, "error": str(e)}
+
+            self._release(conn)
+            observe("api_page", time.perf_counter() - started, status=status, nbytes=len(raw), error=status != 200)
+            body = _decode_body(raw, encoding)
+
+            if status != 200:
+                txt = body.decode("utf-8", errors="replace")
+                return {"ok": False, "status": status, "data": None, "error": txt[:300]}
+
+            try:
+                with span("json_decode"):
+                    data = json.loads(body)
+            except ValueError as e:
+                # corp trunchiat: tratat ca eroare de rețea, deci pagina primește retry
+                return {"ok": False, "status": -1, "data": None, "error": f"invalid JSON: {e}"}
+            if self.recorder is not None:
+                self.recorder.record_api(url, body)
+            return {"ok": True, "status": 200, "data": data, "error": ""}
+
+        return {"ok": False, "status": -1, "data": None, "error": "unreachable"}
+
+    def get_page(self, listing_url: str, pi: int) -> dict:
+        return self.get_json(build_api_url(listing_url, pi))
+
+    def _fetch_batch(self, listing_url: str, pi: int, page_transform=None, stop_when=None,
+                     retries: int = PAGE_RETRIES) -> dict:
+        for attempt in range(retries + 1):
+            res = self.get_page(listing_url, pi)
+            if res["status"] == 200 or attempt == retries or not is_retryable(res["status"]):
+                break
+            time.sleep(retry_delay(attempt))
+        return self._batch(res, pi, attempt + 1, page_transform, stop_when)
+
+    @staticmethod
+    def _batch(res: dict, pi: int, attempts: int, page_transform=None, stop_when=None) -> dict:
+        data = res.get("data") if isinstance(res.get("data"), dict) else {}
+        products = data.get("products") or []
+        out = {
+            "pi": pi,
+            "attempts": attempts,
+            "stop": bool(stop_when and products and stop_when(products)),
+            "status": res["status"],
+            "error": res.get("error", ""),
+            "raw_count": len(products),
+            "products": page_transform(products) if page_transform else products,
+            "next": bool((data.get("_links") or {}).get("next")),
+            "total": _extract_total(data),
+        }
+        return out
+
+    def iter_listing(self, listing_url: str, concurrency: int = 6, max_pages: int = 200,
+                     page_transform=None, stats=None, stop_when=None, max_missing: int = MAX_MISSING_PAGES,
+                     first_page: dict = None):
+        """
+        Echivalentul Python al job-ului JS din compare_trendyol_api:
+        pagina 1 dă totalul, restul paginilor merg pe o fereastră de `concurrency`
+        cereri simultane și sunt livrate în ordine, pe măsură ce sosesc; ritmul e dat de limiter.
+        `page_transform` se aplică fiecărei pagini în worker (ex: proiecție).
+        `stop_when(produse_brute)` -> True oprește paginarea după pagina respectivă
+        (ex: plafon de preț pe listinguri sortate); paginile deja în zbor sunt abandonate.
+        Fiecare pagină are propriile retry-uri (PAGE_RETRIES); o pagină care tot eșuează
+        e sărită și notată în stats, restul listingului continuă.
+        Ridică ListingFetchError dacă eșuează pagina 1, la 403/429 (fallback pe browser)
+        sau după mai mult de `max_missing` pagini pierdute.
+        `stats` (dict, opțional) primește raw_count = produse brute primite,
+        stopped_at = pagina la care a oprit stop_when, pages_ok, missing_pages și retries.
+        `first_page`: răspunsul get_page(listing_url, 1) deja primit (ex: proba de fingerprint),
+        folosit în locul unei cereri noi dacă e 200.
+        """
+        stats = stats if stats is not None else {}
+        stats["raw_count"] = 0
+        stats["stopped_at"] = None
+        stats["pages_ok"] = 0
+        stats["missing_pages"] = []
+        stats["retries"] = 0
+
+        def take(b) -> bool:
+            # True = pagină bună; False = pagină pierdută, sărită (rezultat parțial)
+            stats["retries"] += b["attempts"] - 1
+            if b["status"] == 200:
+                stats["pages_ok"] += 1
+                stats["raw_count"] += b["raw_count"]
+                return True
+            if b["pi"] == 1 or is_blocked(b["status"]) or len(stats["missing_pages"]) >= max_missing:
+                raise ListingFetchError(b["status"], b["error"])
+            stats["missing_pages"].append(b["pi"])
+            return False
+
+        if first_page is not None and first_page.get("status") == 200:
+            first = self._batch(first_page, 1, 1, page_transform, stop_when)
+        else:
+            first = self._fetch_batch(listing_url, 1, page_transform, stop_when)
+        take(first)
+        yield first["products"]
+        if first["stop"]:
+            stats["stopped_at"] = 1
+            return
+
+        last_planned = 1
+        if first["next"] and first["total"] > 0 and first["raw_count"]:
+            last_planned = min(max_pages, -(-first["total"] // first["raw_count"]))
+
+        has_next = first["next"]
+        if last_planned > 1:
+            # fereastră glisantă: doar câteva pagini în coadă, ca oprirea să nu irosească cereri
+            ex = ThreadPoolExecutor(max_workers=min(concurrency, last_planned - 1))
+            pending = deque()
+            next_pi = 2
+
+            def submit_more():
+                nonlocal next_pi
+                while len(pending) < 2 * concurrency and next_pi <= last_planned:
+                    # thread-urile pool-ului nu moștenesc eticheta de categorie a metricilor
+                    fetch = bind_context(self._fetch_batch)
+                    pending.append(ex.submit(fetch, listing_url, next_pi, page_transform, stop_when))
+                    next_pi += 1
+
+            submit_more()
+            try:
+                while pending:
+                    b = pending.popleft().result()
+                    if not take(b):
+                        has_next = False
+                        submit_more()
+                        continue
+                    has_next = b["next"]
+                    yield b["products"]
+                    if b["stop"]:
+                        stats["stopped_at"] = b["pi"]
+                        return
+                    submit_more()
+            finally:
+                for fut in pending:
+                    fut.cancel()
+                ex.shutdown(wait=True)
+
+        # totalul poate fi subestimat: continuăm secvențial cât timp API-ul mai are "next"
+        page_index = last_planned
+        while has_next and page_index < max_pages:
+            page_index += 1
+            b = self._fetch_batch(listing_url, page_index, page_transform, stop_when)
+            # fără pagina asta nu știm dacă mai urmează ceva: coada secvențială se oprește
+            if not take(b):
+                break
+            has_next = b["next"]
+            yield b["products"]
+            if b["stop"]:
+                stats["stopped_at"] = page_index
+                return
+
+    def fetch_listing(self, listing_url: str, concurrency: int = 6, max_pages: int = 200,
+                      page_transform=None, stop_when=None) -> dict:
+        """
+        Varianta non-streaming: {status, error, products, rawCount, missingPages},
+        cu prefixul bun la eroare.
+        """
+        products = []
+        stats = {}
+        status, error = 200, ""
+        try:
+            for batch in self.iter_listing(listing_url, concurrency, max_pages, page_transform, stats,
+                                           stop_when):
+                products.extend(batch)
+        except ListingFetchError as e:
+            status, error = e.status, e.error
+        return {
+            "status": status,
+            "error": error,
+            "products": products,
+            "rawCount": stats.get("raw_count", 0),
+            "missingPages": stats.get("missing_pages", []),
+        }
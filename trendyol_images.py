@@ -0,0 +1,302 @@
+import hashlib
+import io
+import json
+import os
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlparse, urlunparse
+from urllib.request import Request, urlopen
+
+from trendyol_metrics import bind_context, observe
+
+# Pillow e opțional: fără el, micșorarea se face doar din URL-ul CDN (mnresize)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+CACHE_DIR = os.path.join(STATE_DIR, "image_cache")
+
+UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/121.0.0.0 Safari/537.36"
+)
+
+DOWNLOAD_TIMEOUT = 20
+DOWNLOAD_WORKERS = 8
+
+# cât timp o intrare e folosită fără nicio cerere; după asta se revalidează cu ETag/Last-Modified
+FRESH_SECONDS = 24 * 3600
+
+# limita totală a cache-ului; la depășire se șterg cele mai vechi accesate (LRU)
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+# lățimea implicită a thumbnail-urilor din email (px) și calitatea JPEG la recomprimare
+THUMB_WIDTH = 160
+THUMB_QUALITY = 78
+
+MNRESIZE_RE = re.compile(r"/mnresize/(\d+)/")
+
+# ================= KEYS =================
+
+def normalize_cdn_url(u: str) -> str:
+    """
+    Forma canonică a unui URL de imagine: https, host lowercase, fără fragment.
+    Query-ul rămâne (unele CDN-uri îl folosesc pentru resize).
+    """
+    u = (u or "").strip()
+    if u.startswith("//"):
+        u = "https:" + u
+    p = urlparse(u)
+    scheme = "https" if p.scheme in ("http", "https") else p.scheme
+    return urlunparse((scheme, p.netloc.lower(), p.path, p.params, p.query, ""))
+
+def cache_key(url: str) -> str:
+    return hashlib.sha1(normalize_cdn_url(url).encode("utf-8")).hexdigest()
+
+def resized_cdn_url(url: str, width: int) -> str:
+    """
+    Cere CDN-ului direct varianta mică: /mnresize/400/ -> /mnresize/<width>/.
+    URL-urile fără mnresize sau deja mai mici rămân neschimbate.
+    """
+    m = MNRESIZE_RE.search(url or "")
+    if not m or int(m.group(1)) <= width:
+        return url
+    return url[:m.start()] + f"/mnresize/{width}/" + url[m.end():]
+
+def _paths(key: str, cache_dir: str):
+    return os.path.join(cache_dir, key + ".bin"), os.path.join(cache_dir, key + ".json")
+
+# ================= CACHE =================
+
+def _read_meta(meta_path: str):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+            return meta if isinstance(meta, dict) else None
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.{id(data)}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _store(key: str, cache_dir: str, data: bytes, meta: dict) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    bin_path, meta_path = _paths(key, cache_dir)
+    _write_atomic(bin_path, data)
+    _write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+def _touch(path: str) -> None:
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+def fetch_image(url: str, cache_dir: str = None):
+    """
+    (bytes, content-type) pentru o imagine, din cache dacă se poate.
+    - proaspătă (< FRESH_SECONDS) -> fără rețea
+    - veche -> GET condiționat (If-None-Match / If-Modified-Since), 304 = reutilizare
+    - eroare de rețea cu o copie veche în cache -> copia veche
+    (None, None) dacă nu avem nimic.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if not url:
+        return None, None
+
+    key = cache_key(url)
+    bin_path, meta_path = _paths(key, cache_dir)
+    meta = _read_meta(meta_path)
+    cached = None
+    if meta and os.path.exists(bin_path):
+        cached = meta
+
+    now = time.time()
+    if cached and now - float(cached.get("fetched_at", 0)) < FRESH_SECONDS:
+        try:
+            with open(bin_path, "rb") as f:
+                data = f.read()
+            _touch(bin_path)
+            return data, cached.get("content_type")
+        except OSError:
+            cached = None
+
+    headers = {"User-Agent": UA}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    started = time.perf_counter()
+    try:
+        req = Request(normalize_cdn_url(url), headers=headers)
+        with urlopen(req, timeout=DOWNLOAD_TIMEOUT) as r:
+            data = r.read()
+            ctype = r.headers.get_content_type()
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+    except HTTPError as e:
+        observe("image_download", time.perf_counter() - started, status=e.code, error=e.code != 304)
+        if e.code == 304 and cached:
+            try:
+                with open(bin_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None, None
+            _store(key, cache_dir, data, {**cached, "fetched_at": now})
+            return data, cached.get("content_type")
+        return _stale(bin_path, cached)
+    except Exception:
+        observe("image_download", time.perf_counter() - started, status=-1, error=True)
+        return _stale(bin_path, cached)
+
+    observe("image_download", time.perf_counter() - started, status=200, nbytes=len(data))
+    if data and ctype and ctype.startswith("image/"):
+        _store(key, cache_dir, data, {
+            "url": normalize_cdn_url(url),
+            "content_type": ctype,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": len(data),
+            "fetched_at": now,
+        })
+    return data, ctype
+
+def _stale(bin_path: str, cached):
+    if not cached:
+        return None, None
+    try:
+        with open(bin_path, "rb") as f:
+            return f.read(), cached.get("content_type")
+    except OSError:
+        return None, None
+
+def _downscale(data: bytes, width: int):
+    """
+    Redimensionare + recomprimare JPEG cu Pillow; None dacă nu aduce nimic
+    (Pillow lipsă, imagine invalidă sau rezultat mai mare decât originalul).
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.thumbnail((width, width * 4))
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            out = io.BytesIO()
+            im.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+    except Exception:
+        return None
+    small = out.getvalue()
+    return small if len(small) < len(data) else None
+
+def fetch_thumbnail(url: str, width: int = THUMB_WIDTH, cache_dir: str = None):
+    """
+    (bytes, content-type) la lățimea de afișare din email.
+    Întâi varianta mică de la CDN (mnresize), apoi, dacă e Pillow, recomprimare locală.
+    Varianta micșorată se ține în cache lângă original, cu cheie proprie.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if not url:
+        return None, None
+
+    src = resized_cdn_url(url, width)
+    key = f"{cache_key(src)}_w{width}"
+    bin_path, meta_path = _paths(key, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta and time.time() - float(meta.get("fetched_at", 0)) < FRESH_SECONDS:
+        try:
+            with open(bin_path, "rb") as f:
+                data = f.read()
+            _touch(bin_path)
+            return data, meta.get("content_type")
+        except OSError:
+            pass
+
+    data, ctype = fetch_image(src, cache_dir)
+    if not data and src != url:
+        data, ctype = fetch_image(url, cache_dir)
+    if not data or not ctype or not ctype.startswith("image/"):
+        return data, ctype
+
+    small = _downscale(data, width)
+    if small is None:
+        # fără Pillow varianta CDN e deja în cache sub propria cheie
+        return data, ctype
+
+    _store(key, cache_dir, small, {
+        "url": normalize_cdn_url(src),
+        "width": width,
+        "content_type": "image/jpeg",
+        "size": len(small),
+        "source_size": len(data),
+        "fetched_at": time.time(),
+    })
+    return small, "image/jpeg"
+
+def prune_cache(cache_dir: str = None, max_bytes: int = MAX_CACHE_BYTES) -> int:
+    """
+    Eviction LRU după mtime-ul fișierelor .bin (atins la fiecare hit).
+    Întoarce câte intrări au fost șterse.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    try:
+        names = [n for n in os.listdir(cache_dir) if n.endswith(".bin")]
+    except FileNotFoundError:
+        return 0
+
+    entries = []
+    total = 0
+    for n in names:
+        path = os.path.join(cache_dir, n)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for p in (path, path[:-len(".bin")] + ".json"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+def fetch_images(urls, cache_dir: str = None, max_workers: int = DOWNLOAD_WORKERS, width: int = None) -> dict:
+    """
+    Descarcă (sau ia din cache) mai multe imagini în paralel.
+    Întoarce url -> (bytes, content-type); URL-urile duplicate se descarcă o dată.
+    Cu `width`, fiecare imagine vine ca thumbnail (fetch_thumbnail).
+    """
+    urls = [u for u in dict.fromkeys(urls) if u]
+    if not urls:
+        return {}
+
+    if width:
+        fetch = lambda u: fetch_thumbnail(u, width, cache_dir)
+    else:
+        fetch = lambda u: fetch_image(u, cache_dir)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as ex:
+        results = list(ex.map(bind_context(fetch), urls))
+
+    prune_cache(cache_dir)
+    return dict(zip(urls, results))
@@ -0,0 +1,224 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+
+# raportul ultimei rulări (JSON) și fișierul pentru textfile collector-ul node_exporter
+REPORT_FILE = "run_report.json"
+PROM_FILE = "trendyol_metrics.prom"
+PROM_PREFIX = "trendyol"
+
+# job-ul (checker-ul) și categoria curente, moștenite de task-urile și thread-urile pornite din ele
+_job = contextvars.ContextVar("trendyol_job", default="")
+_category = contextvars.ContextVar("trendyol_category", default="")
+
+# ================= SPANS =================
+
+class SpanStats:
+    """
+    Agregatul unui span pe (job, categorie, nume): număr, timp total/maxim, erori, bytes, statusuri.
+    """
+
+    __slots__ = ("count", "seconds", "max_seconds", "errors", "bytes", "statuses")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.errors = 0
+        self.bytes = 0
+        self.statuses = Counter()
+
+    def add(self, seconds: float, status=None, nbytes: int = 0, error: bool = False) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += nbytes or 0
+        if error:
+            self.errors += 1
+        if status is not None:
+            self.statuses[str(status)] += 1
+
+    def as_dict(self) -> dict:
+        out = {
+            "count": self.count,
+            "seconds": round(self.seconds, 4),
+            "mean_ms": round(self.seconds / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+        if self.errors:
+            out["errors"] = self.errors
+        if self.bytes:
+            out["bytes"] = self.bytes
+        if self.statuses:
+            out["statuses"] = dict(self.statuses)
+        return out
+
+class Metrics:
+    """
+    Span-urile unui proces (thread-safe): navigare, cookies, pagini API, decodare JSON, diff,
+    cooldown, imagini, SMTP. Eticheta de job/categorie vine din scope(), dacă nu e dată explicit.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, status=None, nbytes: int = 0, error: bool = False,
+                category: str = None) -> None:
+        key = (_job.get(), _category.get() if category is None else category, name)
+        with self._lock:
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = SpanStats()
+            stats.add(seconds, status, nbytes, error)
+
+    @contextmanager
+    def span(self, name: str, category: str = None):
+        """
+        with metrics.span("navigation") as sp: ...  (sp["status"] / sp["bytes"] se pot completa în bloc)
+        O excepție din bloc e numărată ca eroare și propagată.
+        """
+        info = {"status": None, "bytes": 0}
+        error = False
+        t0 = time.perf_counter()
+        try:
+            yield info
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - t0, info["status"], info["bytes"], error, category)
+
+    def report(self) -> dict:
+        jobs = {}
+        with self._lock:
+            items = sorted(self._spans.items())
+        for (job, category, name), stats in items:
+            jobs.setdefault(job or "-", {}).setdefault(category or "-", {})[name] = stats.as_dict()
+        return {
+            "started": int(self.started),
+            "duration_seconds": round(time.perf_counter() - self._t0, 3),
+            "jobs": jobs,
+        }
+
+    def prometheus(self) -> str:
+        with self._lock:
+            items = sorted((k, v.as_dict(), dict(v.statuses), v.seconds, v.max_seconds) for k, v in self._spans.items())
+
+        series = {
+            "span_seconds_total": ("counter", "Time spent in the span", []),
+            "span_count_total": ("counter", "Number of spans", []),
+            "span_max_seconds": ("gauge", "Slowest single span", []),
+            "span_errors_total": ("counter", "Spans that ended with an error", []),
+            "span_bytes_total": ("counter", "Bytes transferred inside the span", []),
+            "span_status_total": ("counter", "Spans per HTTP status", []),
+        }
+        for (job, category, name), d, statuses, seconds, max_seconds in items:
+            labels = {"job": job, "category": category, "span": name}
+            series["span_seconds_total"][2].append((labels, seconds))
+            series["span_count_total"][2].append((labels, d["count"]))
+            series["span_max_seconds"][2].append((labels, max_seconds))
+            series["span_errors_total"][2].append((labels, d.get("errors", 0)))
+            if d.get("bytes"):
+                series["span_bytes_total"][2].append((labels, d["bytes"]))
+            for status, n in sorted(statuses.items()):
+                series["span_status_total"][2].append(({**labels, "status": status}, n))
+
+        lines = []
+        for suffix, (kind, help_text, samples) in series.items():
+            if not samples:
+                continue
+            metric = f"{PROM_PREFIX}_{suffix}"
+            lines.append(f"# HELP {metric} {help_text}.")
+            lines.append(f"# TYPE {metric} {kind}")
+            for labels, value in samples:
+                lines.append(f"{metric}{{{_prom_labels(labels)}}} {_prom_value(value)}")
+
+        for suffix, help_text, value in (
+            ("run_started_timestamp_seconds", "Start of the run (unix time)", self.started),
+            ("run_duration_seconds", "Wall time of the run so far", time.perf_counter() - self._t0),
+        ):
+            metric = f"{PROM_PREFIX}_{suffix}"
+            lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} gauge", f"{metric} {_prom_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, state_dir: str = None) -> tuple:
+        """
+        Scrie atomic REPORT_FILE și PROM_FILE în state/; întoarce cele două căi.
+        """
+        state_dir = state_dir or STATE_DIR
+        os.makedirs(state_dir, exist_ok=True)
+        report_path = os.path.join(state_dir, REPORT_FILE)
+        prom_path = os.path.join(state_dir, PROM_FILE)
+        _write_atomic(report_path, json.dumps(self.report(), ensure_ascii=False, indent=1))
+        _write_atomic(prom_path, self.prometheus())
+        return report_path, prom_path
+
+def _prom_labels(labels: dict) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+
+def _prom_value(value) -> str:
+    return str(value) if isinstance(value, int) else f"{value:.6f}"
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# ================= PROCESS =================
+
+_current = Metrics()
+
+def metrics() -> Metrics:
+    return _current
+
+def span(name: str, category: str = None):
+    return _current.span(name, category)
+
+def observe(name: str, seconds: float, status=None, nbytes: int = 0, error: bool = False, category: str = None):
+    _current.observe(name, seconds, status, nbytes, error, category)
+
+@contextmanager
+def scope(job: str = None, category: str = None):
+    """
+    Eticheta job/categorie pentru span-urile din bloc (și din task-urile / thread-urile pornite din el).
+    """
+    tokens = []
+    if job is not None:
+        tokens.append((_job, _job.set(job)))
+    if category is not None:
+        tokens.append((_category, _category.set(category)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+async def scoped(coro, job: str = None, category: str = None):
+    """
+    Rulează corutina sub scope(); util în asyncio.gather, unde fiecare element e un task separat.
+    """
+    with scope(job, category):
+        return await coro
+
+def bind_context(fn):
+    """
+    `fn` legat de contextul curent (job/categorie), pentru ThreadPoolExecutor,
+    ale cărui thread-uri nu moștenesc contextvars.
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
@@ -0,0 +1,267 @@
+import os
+import queue
+import re
+import smtplib
+import ssl
+import threading
+import time
+import certifi
+
+from email import policy
+from email.parser import BytesParser
+
+from trendyol_metrics import bind_context, span
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+OUTBOX_DIR = os.path.join(STATE_DIR, "outbox")
+
+# alertele mai vechi de atât nu mai au sens: mutate în outbox/dead, nu retrimise
+MAX_AGE_SECONDS = 3 * 24 * 3600
+
+# un mesaj e revendicat (.eml -> .sending) cât timp e trimis; o revendicare mai veche de atât
+# vine de la un proces oprit în timpul trimiterii și e pusă înapoi în spool
+CLAIM_TIMEOUT_SECONDS = 15 * 60
+
+# ================= SPOOL =================
+
+def _safe_tag(tag: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", tag or "mail")[:60]
+
+def enqueue(msg, tag: str = "mail", outbox_dir: str = None) -> str:
+    """
+    Scrie mesajul în spool (atomic: .tmp -> .eml) și întoarce calea.
+    Fișierul rămâne pe disc până la trimiterea reușită.
+    """
+    outbox_dir = outbox_dir or OUTBOX_DIR
+    os.makedirs(outbox_dir, exist_ok=True)
+    name = f"{time.time_ns()}_{_safe_tag(tag)}.eml"
+    path = os.path.join(outbox_dir, name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(msg.as_bytes(policy=policy.SMTP))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+def pending(outbox_dir: str = None) -> list:
+    """
+    Mesajele rămase în spool, în ordinea în care au fost puse (numele începe cu time_ns).
+    """
+    outbox_dir = outbox_dir or OUTBOX_DIR
+    try:
+        names = sorted(n for n in os.listdir(outbox_dir) if n.endswith(".eml"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(outbox_dir, n) for n in names]
+
+def _claimed(path: str) -> str:
+    return path[:-len(".eml")] + ".sending"
+
+def release_stale_claims(outbox_dir: str = None, max_age: float = CLAIM_TIMEOUT_SECONDS) -> int:
+    """
+    Pune înapoi în spool (.sending -> .eml) revendicările abandonate; întoarce câte.
+    """
+    outbox_dir = outbox_dir or OUTBOX_DIR
+    try:
+        names = [n for n in os.listdir(outbox_dir) if n.endswith(".sending")]
+    except FileNotFoundError:
+        return 0
+    released = 0
+    for n in names:
+        claimed = os.path.join(outbox_dir, n)
+        try:
+            if time.time() - os.path.getmtime(claimed) <= max_age:
+                continue
+            os.replace(claimed, claimed[:-len(".sending")] + ".eml")
+            released += 1
+        except OSError:
+            pass
+    return released
+
+def _tag_of(path: str) -> str:
+    return os.path.basename(path)[:-len(".eml")].split("_", 1)[-1]
+
+def _age_seconds(path: str) -> float:
+    try:
+        return time.time() - int(os.path.basename(path).split("_", 1)[0]) / 1e9
+    except ValueError:
+        return 0.0
+
+def _move_dead(path: str) -> None:
+    dead_dir = os.path.join(os.path.dirname(path), "dead")
+    os.makedirs(dead_dir, exist_ok=True)
+    try:
+        os.replace(path, os.path.join(dead_dir, os.path.basename(path)))
+    except OSError:
+        pass
+
+# ================= SMTP =================
+
+class SmtpSession:
+    """
+    O singură conexiune SMTP autentificată (STARTTLS + login o dată),
+    refolosită pentru toate mesajele; reconectare la prima eroare de conexiune.
+    """
+
+    def __init__(self, server: str, port: int, user: str, password: str):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self._smtp = None
+
+    def _connect(self):
+        ctx = ssl.create_default_context(cafile=certifi.where())
+        smtp = smtplib.SMTP(self.server, self.port, timeout=60)
+        smtp.starttls(context=ctx)
+        smtp.login(self.user, self.password)
+        self._smtp = smtp
+
+    def send(self, data: bytes) -> None:
+        msg = BytesParser(policy=policy.SMTP).parsebytes(data)
+        for attempt in range(2):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+# ================= WORKER =================
+
+class Outbox:
+    """
+    Trimite mesajele din spool pe un thread de fundal, peste o singură SmtpSession.
+    La pornire reia ce a rămas netrimis din rulările anterioare.
+    Un mesaj eșuat rămâne în spool și e reîncercat la următoarea rulare.
+    Fiecare mesaj e revendicat (rename) înainte de trimitere, deci două outbox-uri
+    pe același spool (ex: worker-ul unei rulări oprite la timeout) nu trimit același mesaj.
+    """
+
+    def __init__(self, server: str, port: int, user: str, password: str, outbox_dir: str = None):
+        self.outbox_dir = outbox_dir or OUTBOX_DIR
+        self.session = SmtpSession(server, port, user, password)
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._stop = object()
+        self._disabled = False
+        self._abort = False
+        # worker-ul păstrează eticheta de job a celui care a creat outbox-ul (metrici)
+        self._thread = threading.Thread(target=bind_context(self._run), name="outbox", daemon=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        # idempotent: open_outbox() întoarce outbox-ul deja pornit, iar `with` îl pornește din nou
+        if self._thread.is_alive():
+            return self
+        release_stale_claims(self.outbox_dir)
+        leftovers = pending(self.outbox_dir)
+        if leftovers:
+            print(f"📨 Outbox: retrying {len(leftovers)} unsent email(s)")
+        for path in leftovers:
+            self._queue.put(path)
+        self._thread.start()
+        return self
+
+    def submit(self, msg, tag: str = "mail") -> str:
+        """
+        Pune mesajul în spool și îl dă worker-ului; nu așteaptă trimiterea.
+        """
+        path = enqueue(msg, tag, self.outbox_dir)
+        self._queue.put(path)
+        return path
+
+    def close(self, timeout: float = None, drain: bool = True):
+        """
+        Așteaptă golirea cozii (trimiterile în curs), apoi închide conexiunea SMTP.
+        Cu drain=False worker-ul se oprește după mesajul curent, restul rămâne în spool
+        (ex: rularea a fost anulată la timeout).
+        """
+        if self._thread.is_alive():
+            if not drain:
+                self._abort = True
+            self._queue.put(self._stop)
+            self._thread.join(timeout)
+        # un worker încă blocat în SMTP își folosește singur sesiunea până termină
+        if not self._thread.is_alive():
+            self.session.close()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is self._stop:
+                return
+            if self._abort:
+                left = len(pending(self.outbox_dir))
+                print(f"📨 Outbox: stopped early, {left} email(s) left for the next run")
+                return
+            self._deliver(path)
+
+    def _deliver(self, path: str):
+        if not os.path.exists(path):
+            return
+        if _age_seconds(path) > MAX_AGE_SECONDS:
+            _move_dead(path)
+            return
+        if self._disabled:
+            self.failed += 1
+            return
+
+        # revendicare atomică: dacă alt outbox a luat deja mesajul, rename-ul eșuează
+        claimed = _claimed(path)
+        try:
+            os.rename(path, claimed)
+            os.utime(claimed, None)
+        except OSError:
+            return
+
+        try:
+            with open(claimed, "rb") as f:
+                data = f.read()
+            with span("smtp", category=_tag_of(path)) as sp:
+                sp["bytes"] = len(data)
+                self.session.send(data)
+        except smtplib.SMTPAuthenticationError as e:
+            # login respins: restul rămâne în spool pentru rularea următoare
+            self._release(claimed, path)
+            self._disabled = True
+            self.failed += 1
+            print(f"⚠ Outbox: SMTP login failed, keeping mail for next run: {e}")
+            return
+        except Exception as e:
+            self._release(claimed, path)
+            self.failed += 1
+            print(f"⚠ Outbox: send failed for [{_tag_of(path)}], kept in spool: {e}")
+            return
+
+        os.remove(claimed)
+        self.sent += 1
+        print(f"📧 Email sent [{_tag_of(path)}]")
+
+    @staticmethod
+    def _release(claimed: str, path: str) -> None:
+        try:
+            os.replace(claimed, path)
+        except OSError:
+            pass
@@ -0,0 +1,45 @@
+import json
+import os
+
+# ================= WRITERS =================
+
+def write_json_atomic(path: str, data, indent: int = 2) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+class NdjsonWriter:
+    """
+    Scrie câte un obiect JSON pe linie, pe măsură ce sunt produse.
+    În timpul rulării fișierul e `<path>.partial` (se poate urmări cu tail),
+    iar commit() îl mută atomic peste `<path>`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.count = 0
+        self._f = open(self.partial_path, "w", encoding="utf-8", newline="\n")
+
+    def write(self, record: dict) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._f.write("\n")
+        self.count += 1
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def commit(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        try:
+            os.remove(self.partial_path)
+        except OSError:
+            pass
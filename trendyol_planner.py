@@ -0,0 +1,189 @@
+import hashlib
+import math
+import time
+
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+from trendyol_store import open_store
+
+# ================= CONFIG =================
+
+# cât de des comparăm listingul cu plafon (prc închis) cu cel nelimitat
+VERIFY_EVERY_SECONDS = 24 * 3600
+
+# câte produse din proba nelimitată pot lipsi (egalități de preț la marginea paginii)
+VERIFY_TOLERANCE = 2
+
+# după câte rulări sărite (pagina 1 neschimbată) se face oricum o rulare completă
+FULL_REFRESH_EVERY = 8
+
+# ================= PLAN =================
+
+def with_price_range(listing_url: str, high: float) -> str:
+    """
+    Rescrie `prc` într-un interval închis: păstrează limita de jos existentă
+    (ex: prc=130-*) și pune ca limită de sus `high`, rotunjit în sus.
+    O limită de sus deja mai strictă rămâne neschimbată.
+    """
+    parsed = urlparse(listing_url)
+    params = parse_qsl(parsed.query, keep_blank_values=True)
+    qs = dict(params)
+
+    low, _, cur_high = (qs.get("prc") or "").partition("-")
+    low = low if low not in ("", "*") else "0"
+    upper = int(math.ceil(high))
+    try:
+        if cur_high not in ("", "*"):
+            upper = min(upper, int(float(cur_high)))
+    except ValueError:
+        pass
+
+    prc = f"{low}-{upper}"
+    if "prc" in qs:
+        params = [(k, prc if k == "prc" else v) for k, v in params]
+    else:
+        params.append(("prc", prc))
+
+    new_parts = list(parsed)
+    new_parts[4] = urlencode(params)
+    return urlunparse(new_parts)
+
+def plan_listing(key: str, listing_url: str, high, store=None):
+    """
+    Întoarce (url_de_folosit, verificare_scadentă).
+    - fără plafon -> listingul original
+    - ultima verificare a eșuat și nu e încă timpul alteia -> listingul original
+    - altfel -> listingul cu prc închis
+    """
+    if high is None:
+        return listing_url, False
+
+    store = store or open_store()
+    plan = store.get_plan(key)
+    due = plan is None or time.time() - plan[0] >= VERIFY_EVERY_SECONDS
+
+    if plan is not None and not plan[1] and not due:
+        return listing_url, False
+    return with_price_range(listing_url, high), due
+
+# ================= VERIFY =================
+
+def _model_id(p: dict):
+    return p.get("contentId") or p.get("id") or p.get("groupId")
+
+def _listing_total(data: dict):
+    meta = data.get("_meta") or {}
+    for v in (data.get("totalCount"), data.get("total"), data.get("productCount"), meta.get("totalCount")):
+        try:
+            if v is not None:
+                return int(v)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+def _save_verdict(key: str, ok: bool, detail: str, store) -> bool:
+    (store or open_store()).set_plan(key, int(time.time()), ok, detail)
+    if not ok:
+        print(f"⚠ Price pushdown for [{key}] drops products ({detail}), using the unbounded listing")
+    return ok
+
+def verify_pushdown(key: str, unbounded: list, bounded: list, bounded_total: int, high: float, price_of,
+                    offset: int = 0, store=None) -> bool:
+    """
+    Verificare la marginea plafonului, unde un prc ignorat sau greșit se vede.
+    `bounded` e ultima pagină a listingului cu plafon (pozițiile offset..bounded_total),
+    `unbounded` paginile nelimitate de pe aceleași poziții, plus următoarea dacă sunt încă sub plafon.
+    Ambele sunt sortate crescător, deci produsele nelimitate cu preț <= high trebuie să apară
+    în ultima pagină cu plafon, iar offset + numărul lor nu poate depăși totalCount-ul cu plafon.
+    Rezultatul se salvează în store; la eșec pushdown-ul e oprit până la verificarea următoare.
+    """
+    under = []
+    for p in unbounded:
+        price = price_of(p)
+        if price is not None and price <= high and _model_id(p):
+            under.append(_model_id(p))
+
+    bounded_ids = {_model_id(p) for p in bounded}
+    lost = [pid for pid in under if pid not in bounded_ids]
+    # > 0: listingul nelimitat are mai multe produse sub plafon decât raportează cel cu plafon
+    dropped = offset + len(under) - bounded_total
+
+    ok = len(lost) <= VERIFY_TOLERANCE and dropped <= VERIFY_TOLERANCE
+    detail = (f"total={bounded_total} offset={offset} under={len(under)} bounded={len(bounded)} "
+              f"lost={len(lost)} dropped={dropped}")
+    return _save_verdict(key, ok, detail, store)
+
+def verify_with_client(client, key: str, listing_url: str, planned_url: str, high: float, price_of, store=None):
+    """
+    Proba pentru verify_pushdown prin ApiClient: pagina 1 cu plafon dă totalCount-ul și mărimea paginii,
+    apoi ultima pagină cu plafon și paginile nelimitate de pe aceleași poziții.
+    None dacă una dintre cereri eșuează (verificarea rămâne scadentă).
+    """
+    def fetch(url, pi):
+        res = client.get_page(url, pi)
+        if not res.get("ok"):
+            return None
+        return res.get("data") if isinstance(res.get("data"), dict) else {}
+
+    first = fetch(planned_url, 1)
+    if first is None:
+        return None
+    total = _listing_total(first)
+    if total is None:
+        return _save_verdict(key, False, "no totalCount in the bounded listing", store)
+
+    bounded = first.get("products") or []
+    size = len(bounded)
+    last = math.ceil(total / size) if size and total > size else 1
+    if last > 1:
+        page = fetch(planned_url, last)
+        if page is None:
+            return None
+        bounded = page.get("products") or []
+
+    unbounded = []
+    for pi in (last, last + 1):
+        page = fetch(listing_url, pi)
+        if page is None:
+            return None
+        products = page.get("products") or []
+        unbounded.extend(products)
+        # pagina trece deja de plafon: următoarea nu mai are produse sub el
+        if not products or any((price_of(p) or 0) > high for p in products):
+            break
+
+    return verify_pushdown(key, unbounded, bounded, total, high, price_of, (last - 1) * size, store)
+
+# ================= FINGERPRINT =================
+
+def listing_fingerprint(listing_url: str, data: dict, price_of) -> str:
+    """
+    sha1 peste URL-ul listingului, totalul raportat și tuplurile (id, preț) ordonate din pagina 1.
+    """
+    data = data if isinstance(data, dict) else {}
+    h = hashlib.sha1()
+    h.update(listing_url.encode("utf-8"))
+    meta = data.get("_meta") or {}
+    h.update(f"|{data.get('totalCount', meta.get('totalCount'))}".encode("utf-8"))
+    for p in data.get("products") or []:
+        h.update(f"|{_model_id(p)}:{price_of(p)}".encode("utf-8"))
+    return h.hexdigest()
+
+def should_skip(key: str, fingerprint: str, store=None, force_every: int = FULL_REFRESH_EVERY) -> bool:
+    """
+    True dacă pagina 1 e identică cu cea din ultima rulare completă și nu e
+    încă timpul unei rulări forțate; numărul de rulări sărite crește.
+    """
+    store = store or open_store()
+    prev = store.get_fingerprint(key)
+    if prev is None or prev[0] != fingerprint or prev[1] + 1 >= force_every:
+        return False
+    store.bump_skipped(key)
+    return True
+
+def remember_fingerprint(key: str, fingerprint: str, store=None) -> None:
+    """
+    Se apelează doar după o rulare completă reușită, ca o rulare eșuată să nu fie sărită data viitoare.
+    """
+    if fingerprint:
+        (store or open_store()).set_fingerprint(key, fingerprint, int(time.time()))
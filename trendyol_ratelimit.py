@@ -0,0 +1,148 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+RATE_FILE = "trendyol_rate.json"
+
+# cereri/secundă: pornire (fără stare salvată), limite și câte cereri pot pleca imediat
+INITIAL_RATE = 5.0
+MIN_RATE = 0.5
+MAX_RATE = 25.0
+BURST = 6
+
+# AIMD: +INCREASE_STEP req/s la fiecare răspuns curat, *DECREASE_FACTOR la 429/403/eroare de rețea
+INCREASE_STEP = 0.05
+DECREASE_FACTOR = 0.5
+THROTTLE_STATUSES = {403, 429, -1}
+
+# cererile aflate deja în zbor primesc aceeași eroare: o singură tăiere pe fereastră
+DECREASE_HOLD_S = 2.0
+
+# o rată învățată mai veche de atât nu mai spune nimic despre API
+RATE_MAX_AGE = 7 * 24 * 3600
+
+# ================= LIMITER =================
+
+class AdaptiveLimiter:
+    """
+    Token bucket comun pentru toate cererile către API (thread-safe, folosibil și din asyncio).
+    Rata crește aditiv cât timp răspunsurile sunt curate și scade multiplicativ la 429/403/-1.
+    """
+
+    def __init__(self, rate: float = INITIAL_RATE, min_rate: float = MIN_RATE, max_rate: float = MAX_RATE,
+                 burst: int = BURST, path: str = None):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max_rate, max(min_rate, rate))
+        self.burst = burst
+        self.path = path
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._last_cut = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        """
+        Limiter cu rata salvată în `path` (dacă e recentă), altfel cu INITIAL_RATE.
+        """
+        rate = kwargs.pop("rate", INITIAL_RATE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - float(data.get("updated", 0)) <= RATE_MAX_AGE:
+                rate = float(data["rate"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        return cls(rate=rate, path=path, **kwargs)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"rate": round(self.rate, 3), "updated": int(time.time())}, f)
+        os.replace(tmp, self.path)
+
+    def _reserve(self) -> float:
+        # rezervă un token (poate intra pe minus) și întoarce cât trebuie așteptat până la el
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            self.requests += 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def feedback(self, status) -> None:
+        """
+        Statusul răspunsului (-1 = eroare de rețea). Alte erori (404, 5xx) nu schimbă rata.
+        """
+        with self._lock:
+            if status in THROTTLE_STATUSES:
+                now = time.monotonic()
+                if now - self._last_cut < DECREASE_HOLD_S:
+                    return
+                self._last_cut = now
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                # fără rafală imediat după o tăiere
+                self._tokens = min(self._tokens, 0.0)
+                self.throttled += 1
+            elif status == 200:
+                self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+
+    def summary(self) -> str:
+        return f"{self.rate:.1f} req/s learned, {self.requests} requests, {self.throttled} throttle cut(s)"
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_limiter(state_dir: str = None) -> AdaptiveLimiter:
+    """
+    Limiter-ul comun al procesului, încărcat din state/ și salvat la ieșire.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AdaptiveLimiter.load(os.path.join(state_dir or STATE_DIR, RATE_FILE))
+            atexit.register(_shared.save)
+        return _shared
+
+def set_shared_limiter(limiter: AdaptiveLimiter) -> None:
+    """
+    Înlocuiește limiter-ul comun (ex: replay pe serverul local, cu o rată care nu se salvează).
+    None: următorul shared_limiter() îl reîncarcă din state/.
+    """
+    global _shared
+    with _shared_lock:
+        _shared = limiter
+
+async def expose_limiter(context, limiter: AdaptiveLimiter = None) -> None:
+    """
+    Face limiter-ul vizibil pentru fetch()-urile din pagini (playwright.async_api BrowserContext):
+    window.__tyAcquire() înainte de cerere, window.__tyFeedback(status) după.
+    """
+    limiter = limiter or shared_limiter()
+    await context.expose_function("__tyAcquire", limiter.acquire_async)
+    await context.expose_function("__tyFeedback", limiter.feedback)
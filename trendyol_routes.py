@@ -0,0 +1,134 @@
+from collections import Counter
+from urllib.parse import urlparse
+
+# ================= CONFIG =================
+
+# tipuri de resurse Playwright care nu ne trebuie: avem nevoie doar de consimțământ + origine pentru fetch
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# analytics / reclame terțe, blocate indiferent de tipul resursei
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "connect.facebook.net",
+    "facebook.com",
+    "analytics.tiktok.com",
+    "hotjar.com",
+    "clarity.ms",
+    "bat.bing.com",
+    "criteo.com",
+    "criteo.net",
+    "adservice.google.com",
+    "scorecardresearch.com",
+    "newrelic.com",
+    "nr-data.net",
+    "insider.com",
+    "useinsider.com",
+)
+
+# per site (host-ul paginii): hosturi lăsate să treacă chiar dacă s-ar potrivi cu regulile de mai sus
+# (bannerul de cookies OneTrust vine de pe cdn.cookielaw.org)
+SITE_ALLOWLIST = {
+    "trendyol.com": ("cdn.cookielaw.org", "geolocation.onetrust.com", "apigw.trendyol.com"),
+    "evoucher.ro": (),
+}
+
+# mărimi medii estimate pe tip (bytes), pentru raportul "economisit": cererile abandonate nu au răspuns
+ESTIMATED_BYTES = {
+    "image": 35_000,
+    "media": 400_000,
+    "font": 45_000,
+    "script": 60_000,
+    "stylesheet": 30_000,
+    "xhr": 2_000,
+    "fetch": 2_000,
+}
+DEFAULT_ESTIMATE = 5_000
+
+# ================= POLICY =================
+
+def _host_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+def _site_of(url: str):
+    host = (urlparse(url).hostname or "").lower()
+    for site in SITE_ALLOWLIST:
+        if _host_matches(host, (site,)):
+            return site
+    return host
+
+class RoutePolicy:
+    """
+    Ce se abandonează în navigările din browser: tipuri de resurse + hosturi de trackere,
+    cu excepțiile din allowlist-ul site-ului.
+    """
+
+    def __init__(self, site_url: str = "", block_types=None, block_hosts=None, allow_hosts=None):
+        self.block_types = set(BLOCKED_RESOURCE_TYPES if block_types is None else block_types)
+        self.block_hosts = tuple(TRACKER_HOSTS if block_hosts is None else block_hosts)
+        if allow_hosts is None:
+            allow_hosts = SITE_ALLOWLIST.get(_site_of(site_url), ())
+        self.allow_hosts = tuple(allow_hosts)
+
+    def block_reason(self, url: str, resource_type: str):
+        """
+        "tracker" / tipul resursei dacă cererea se abandonează, None dacă trece.
+        """
+        host = (urlparse(url).hostname or "").lower()
+        if not host or _host_matches(host, self.allow_hosts):
+            return None
+        if _host_matches(host, self.block_hosts):
+            return "tracker"
+        if resource_type in self.block_types:
+            return resource_type
+        return None
+
+class RouteStats:
+    """
+    Contoare pentru raport: cereri lăsate / abandonate și bytes economisiți (estimați pe tip).
+    Un singur obiect poate fi împărțit între mai multe contexte/pagini.
+    """
+
+    def __init__(self):
+        self.allowed = 0
+        self.blocked = 0
+        self.bytes_saved = 0
+        self.by_reason = Counter()
+
+    def add_blocked(self, reason: str, resource_type: str) -> None:
+        self.blocked += 1
+        self.by_reason[reason] += 1
+        self.bytes_saved += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATE)
+
+    def summary(self) -> str:
+        total = self.allowed + self.blocked
+        reasons = ", ".join(f"{k}={v}" for k, v in self.by_reason.most_common())
+        return (
+            f"blocked {self.blocked}/{total} requests, ~{self.bytes_saved / 1e6:.1f} MB saved (est.)"
+            + (f" [{reasons}]" if reasons else "")
+        )
+
+async def install_blocking(target, policy: RoutePolicy = None, stats: RouteStats = None) -> RouteStats:
+    """
+    Pune politica pe un BrowserContext sau Page (playwright.async_api) și întoarce contoarele.
+    Cererile permise merg mai departe cu fallback(), deci rutele mai specifice
+    (ex: pagina-stub de sesiune) rămân prioritare.
+    """
+    policy = policy or RoutePolicy()
+    stats = stats or RouteStats()
+
+    async def handle(route):
+        request = route.request
+        reason = policy.block_reason(request.url, request.resource_type)
+        if reason is None:
+            stats.allowed += 1
+            await route.fallback()
+            return
+        stats.add_blocked(reason, request.resource_type)
+        await route.abort("blockedbyclient")
+
+    await target.route("**/*", handle)
+    return stats
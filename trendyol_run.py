@@ -0,0 +1,82 @@
+import asyncio
+import importlib
+import sys
+import time
+
+from playwright.async_api import async_playwright
+
+from trendyol_metrics import metrics, scope
+
+# ================= CONFIG =================
+
+# nume scurt -> modulul cu main_async(browser=...); ordinea e și ordinea din sumar
+CHECKERS = {
+    "compare": "compare_trendyol_api",
+    "top_search": "trendyol_top_search",
+    "codes": "trendyol_codes_checker",
+}
+
+BROWSER_ARGS = ["--no-sandbox", "--disable-dev-shm-usage"]
+
+# ================= RUN =================
+
+async def launch_browser(p):
+    return await p.chromium.launch(headless=True, args=BROWSER_ARGS)
+
+def describe_result(result) -> str:
+    if not isinstance(result, dict) or not result:
+        return ""
+    return ", ".join(f"{k}={v}" for k, v in result.items() if v not in (None, [], ""))
+
+async def run_checker(name: str, browser) -> dict:
+    """
+    Rulează un checker pe browserul comun (fiecare își face propriul context).
+    O excepție nu le oprește pe celelalte: apare în sumar ca eșec.
+    """
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(CHECKERS[name])
+        with scope(job=name):
+            result = await module.main_async(browser=browser)
+        return {"job": name, "ok": True, "result": result, "duration": time.perf_counter() - started}
+    except Exception as e:
+        print(f"❌ [RUN] {name} failed: {type(e).__name__}: {e}")
+        return {"job": name, "ok": False, "error": f"{type(e).__name__}: {e}", "duration": time.perf_counter() - started}
+
+async def main_async(names=None, browser_wrapper=None) -> list:
+    """
+    Un singur Chromium pentru toate checker-ele, rulate concurent în același proces.
+    `browser_wrapper(browser)` poate înlocui browserul dat checker-elor (ex: trendyol_cassette).
+    """
+    names = list(names or CHECKERS)
+    unknown = [n for n in names if n not in CHECKERS]
+    if unknown:
+        raise SystemExit(f"Unknown checker(s): {unknown}; choose from {list(CHECKERS)}")
+
+    start = time.perf_counter()
+    async with async_playwright() as p:
+        browser = await launch_browser(p)
+        shared = browser_wrapper(browser) if browser_wrapper else browser
+        try:
+            runs = await asyncio.gather(*(run_checker(name, shared) for name in names))
+        finally:
+            await browser.close()
+
+    print("\n================ RUN SUMMARY ================\n")
+    for r in runs:
+        status = "OK" if r["ok"] else f"FAILED ({r['error']})"
+        details = describe_result(r.get("result"))
+        print(f"- {r['job']}: {status} in {r['duration']:.1f}s" + (f" | {details}" if details else ""))
+    print(f"\nTOTAL TIME: {time.perf_counter() - start:.1f}s")
+    report, prom = metrics().export()
+    print(f"METRICS: {report} | {prom}")
+    print("\n=============================================\n")
+    return runs
+
+def main():
+    # python trendyol_run.py [compare] [top_search] [codes]  (fără argumente = toate)
+    runs = asyncio.run(main_async(sys.argv[1:]))
+    sys.exit(0 if all(r["ok"] for r in runs) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+# ================= CONFIG =================
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+DB_FILE = "trendyol.db"
+
+# cache-urile JSON vechi (state/sent_cache_{label}.json), importate o singură dată
+LEGACY_SENT_CACHE_GLOB = "sent_cache_*.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    label     TEXT    NOT NULL,
+    model_id  TEXT    NOT NULL,
+    ts        INTEGER NOT NULL,
+    new_price REAL    NOT NULL,
+    PRIMARY KEY (label, model_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sent_alerts_ts ON sent_alerts (ts);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    label    TEXT    NOT NULL,
+    model_id TEXT    NOT NULL,
+    run_ts   INTEGER NOT NULL,
+    size     TEXT,
+    price    REAL    NOT NULL,
+    PRIMARY KEY (label, model_id, run_ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS diff_state (
+    label  TEXT NOT NULL,
+    key    TEXT NOT NULL,
+    status TEXT NOT NULL,
+    price  REAL,
+    PRIMARY KEY (label, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS query_plans (
+    key         TEXT    PRIMARY KEY,
+    verified_ts INTEGER NOT NULL,
+    ok          INTEGER NOT NULL,
+    detail      TEXT
+);
+
+CREATE TABLE IF NOT EXISTS listing_fingerprints (
+    key         TEXT    PRIMARY KEY,
+    fingerprint TEXT    NOT NULL,
+    skipped     INTEGER NOT NULL DEFAULT 0,
+    updated_ts  INTEGER NOT NULL
+);
+"""
+
+# istoricul e append-only, dar un model cu preț neschimbat primește un rând nou
+# doar o dată pe zi (heartbeat), altfel rularea la 15 min ar dubla tabela zilnic.
+# Tabela ține deci puncte de schimbare, nu eșantioane per rulare: mediana din price_stats
+# e ponderată cu timpul cât a fost în vigoare fiecare preț (vezi _time_weighted_median)
+HISTORY_HEARTBEAT_SECONDS = 24 * 3600
+
+# rândurile mai vechi de atât sunt șterse la începutul fiecărei rulări (prune_history);
+# trebuie să acopere fereastra afișată în email (HISTORY_DAYS din compare_trendyol_api)
+HISTORY_RETENTION_DAYS = 90
+
+# limita de parametri per query (SQLite vechi are 999)
+_CHUNK = 500
+
+# ================= STORE =================
+
+def _time_weighted_median(points, now: int) -> float:
+    """
+    Mediana prețurilor ponderată cu durata: points = [(ts, price)] crescător după ts,
+    fiecare preț e în vigoare până la rândul următor (ultimul până la `now`).
+    Un interval e plafonat la HISTORY_HEARTBEAT_SECONDS: fără heartbeat, modelul
+    a lipsit din listing și nu știm ce preț a avut.
+    """
+    weighted = []
+    for i, (ts, price) in enumerate(points):
+        end = points[i + 1][0] if i + 1 < len(points) else now
+        # greutate minimă 1s: un rând scris chiar la `now` tot contează
+        weighted.append((price, max(1, min(end - ts, HISTORY_HEARTBEAT_SECONDS))))
+
+    weighted.sort()
+    half = sum(w for _, w in weighted) / 2
+    acc = 0
+    for price, w in weighted:
+        acc += w
+        if acc >= half:
+            return price
+    return weighted[-1][0]
+
+
+class Store:
+    """
+    Starea persistentă a scripturilor într-un singur SQLite (WAL) din state/.
+    O conexiune per proces, protejată de un lock (folosită și din thread-uri).
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self.migrate_sent_caches(os.path.dirname(db_path))
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            # fără -wal rămas pe disc: cache-ul din Actions salvează un singur fișier
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+            self._conn = None
+
+    # ---------- cooldown ----------
+
+    def get_sent(self, label: str, model_ids) -> dict:
+        """
+        model_id -> (ts, new_price) pentru ultimele alerte trimise, doar pentru cheile cerute.
+        """
+        keys = list(dict.fromkeys(str(k) for k in model_ids))
+        out = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT model_id, ts, new_price FROM sent_alerts WHERE label = ? AND model_id IN ({marks})",
+                    [label, *chunk],
+                )
+                for model_id, ts, price in rows:
+                    out[model_id] = (ts, price)
+        return out
+
+    def mark_sent(self, label: str, rows) -> None:
+        """
+        Upsert doar pentru alertele trimise acum: rows = [(model_id, ts, new_price)].
+        """
+        rows = [(label, str(k), int(ts), float(price)) for k, ts, price in rows]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO sent_alerts (label, model_id, ts, new_price) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (label, model_id) DO UPDATE SET ts = excluded.ts, new_price = excluded.new_price",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+
+    def evict_sent(self, older_than: int) -> int:
+        """
+        TTL: șterge alertele mai vechi de `older_than` (epoch), pe indexul de ts.
+        """
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sent_alerts WHERE ts < ?", (int(older_than),))
+            return cur.rowcount
+
+    # ---------- diff delta ----------
+
+    def load_diff_state(self, label: str) -> dict:
+        """
+        key -> (status, price) din rularea anterioară a categoriei.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT key, status, price FROM diff_state WHERE label = ?", (label,))
+            return {key: (status, price) for key, status, price in rows}
+
+    def save_diff_state(self, label: str, current: dict, previous: dict) -> None:
+        """
+        Scrie doar diferențele față de `previous`: upsert pentru cheile schimbate,
+        delete pentru cele care nu mai apar.
+        """
+        changed = [(label, k, st, price) for k, (st, price) in current.items() if previous.get(k) != (st, price)]
+        removed = [(label, k) for k in previous if k not in current]
+        if not changed and not removed:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO diff_state (label, key, status, price) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (label, key) DO UPDATE SET status = excluded.status, price = excluded.price",
+                changed,
+            )
+            self._conn.executemany("DELETE FROM diff_state WHERE label = ? AND key = ?", removed)
+            self._conn.execute("COMMIT")
+
+    # ---------- query planner ----------
+
+    def get_plan(self, key: str):
+        """
+        (verified_ts, ok, detail) pentru ultima verificare a pushdown-ului, sau None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verified_ts, ok, detail FROM query_plans WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], bool(row[1]), row[2]) if row else None
+
+    def set_plan(self, key: str, verified_ts: int, ok: bool, detail: str = "") -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO query_plans (key, verified_ts, ok, detail) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET verified_ts = excluded.verified_ts, ok = excluded.ok, "
+                "detail = excluded.detail",
+                (key, int(verified_ts), int(bool(ok)), detail),
+            )
+
+    # ---------- listing fingerprints ----------
+
+    def get_fingerprint(self, key: str):
+        """
+        (fingerprint, rulări sărite de la ultima rulare completă), sau None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, skipped FROM listing_fingerprints WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_fingerprint(self, key: str, fingerprint: str, ts: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO listing_fingerprints (key, fingerprint, skipped, updated_ts) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, skipped = 0, "
+                "updated_ts = excluded.updated_ts",
+                (key, fingerprint, int(ts)),
+            )
+
+    def bump_skipped(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE listing_fingerprints SET skipped = skipped + 1 WHERE key = ?", (key,))
+
+    # ---------- price history ----------
+
+    def _latest_prices(self, label: str, keys: list, before: int = None) -> dict:
+        """
+        model_id -> (run_ts, price) ultimul rând (opțional strict înainte de `before`).
+        """
+        out = {}
+        cond = "" if before is None else " AND run_ts < ?"
+        for i in range(0, len(keys), _CHUNK):
+            chunk = keys[i:i + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            args = [label, *chunk] + ([] if before is None else [int(before)])
+            # SQLite: coloanele simple de lângă MAX() vin din rândul cu maximul
+            rows = self._conn.execute(
+                f"SELECT model_id, MAX(run_ts), price FROM price_history "
+                f"WHERE label = ? AND model_id IN ({marks}){cond} GROUP BY model_id",
+                args,
+            )
+            for model_id, ts, price in rows:
+                out[model_id] = (ts, price)
+        return out
+
+    def record_prices(self, label: str, run_ts: int, rows) -> int:
+        """
+        Adaugă observațiile unei rulări: rows = [(model_id, size, price)].
+        Se scrie doar când prețul s-a schimbat sau a trecut heartbeat-ul.
+        Întoarce numărul de rânduri adăugate.
+        """
+        by_model = {}
+        for model_id, size, price in rows:
+            if price is None:
+                continue
+            by_model[str(model_id)] = (size, float(price))
+        if not by_model:
+            return 0
+
+        with self._lock:
+            latest = self._latest_prices(label, list(by_model))
+            new_rows = []
+            for model_id, (size, price) in by_model.items():
+                prev = latest.get(model_id)
+                if prev and abs(prev[1] - price) < 0.01 and run_ts - prev[0] < HISTORY_HEARTBEAT_SECONDS:
+                    continue
+                new_rows.append((label, model_id, int(run_ts), size, price))
+
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO price_history (label, model_id, run_ts, size, price) VALUES (?, ?, ?, ?, ?)",
+                new_rows,
+            )
+            self._conn.execute("COMMIT")
+        return len(new_rows)
+
+    def prune_history(self, now: int, days: int = HISTORY_RETENTION_DAYS) -> int:
+        """
+        Șterge observațiile mai vechi de `days` zile; întoarce câte rânduri au fost șterse.
+        Paginile eliberate sunt refolosite de SQLite, deci fișierul nu mai crește nelimitat.
+        """
+        cutoff = int(now) - days * 24 * 3600
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM price_history WHERE run_ts < ?", (cutoff,))
+        return cur.rowcount
+
+    def price_stats(self, label: str, model_ids, days: int, now: int) -> dict:
+        """
+        model_id -> {"lowest", "median", "samples"} pe ultimele `days` zile,
+        pe cheia primară (label, model_id, run_ts). Prețul în vigoare la începutul
+        ferestrei (ultimul rând dinainte) intră și el în calcul.
+        Mediana e ponderată cu timpul (rândurile sunt puncte de schimbare + heartbeat);
+        `samples` = rândurile din fereastră.
+        """
+        keys = list(dict.fromkeys(str(k) for k in model_ids))
+        now = int(now)
+        cutoff = now - days * 24 * 3600
+        points = {}
+
+        with self._lock:
+            for model_id, (_, price) in self._latest_prices(label, keys, before=cutoff).items():
+                points.setdefault(model_id, []).append((cutoff, price))
+
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i:i + _CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT model_id, run_ts, price FROM price_history "
+                    f"WHERE label = ? AND model_id IN ({marks}) AND run_ts >= ? ORDER BY run_ts",
+                    [label, *chunk, cutoff],
+                )
+                for model_id, ts, price in rows:
+                    points.setdefault(model_id, []).append((ts, price))
+
+        return {
+            model_id: {
+                "lowest": min(price for _, price in ps),
+                "median": _time_weighted_median(ps, now),
+                "samples": len(ps),
+            }
+            for model_id, ps in points.items()
+        }
+
+    def lowest_price(self, label: str, model_id, days: int, now: int):
+        stats = self.price_stats(label, [model_id], days, now).get(str(model_id))
+        return stats["lowest"] if stats else None
+
+    def rolling_median(self, label: str, model_id, days: int, now: int):
+        stats = self.price_stats(label, [model_id], days, now).get(str(model_id))
+        return stats["median"] if stats else None
+
+    def migrate_sent_caches(self, state_dir: str) -> int:
+        """
+        Importă state/sent_cache_{label}.json în tabel și redenumește fișierul în .migrated.
+        La conflict păstrează intrarea mai nouă.
+        """
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(state_dir, LEGACY_SENT_CACHE_GLOB))):
+            label = os.path.basename(path)[len("sent_cache_"):-len(".json")]
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+
+            rows = []
+            for k, v in (data.items() if isinstance(data, dict) else ()):
+                if not isinstance(v, dict):
+                    continue
+                try:
+                    rows.append((label, str(k), int(v.get("ts", 0)), float(v.get("new_price", -1))))
+                except (TypeError, ValueError):
+                    continue
+
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO sent_alerts (label, model_id, ts, new_price) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (label, model_id) DO UPDATE SET ts = excluded.ts, new_price = excluded.new_price "
+                    "WHERE excluded.ts > sent_alerts.ts",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+
+            os.replace(path, path + ".migrated")
+            imported += len(rows)
+            print(f"🗃 Migrated {len(rows)} cooldown entries from {os.path.basename(path)}")
+        return imported
+
+# ================= SHARED INSTANCE =================
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(state_dir: str = None) -> Store:
+    """
+    Store-ul comun pentru `state_dir`, deschis la primul apel și închis la ieșire.
+    """
+    db_path = os.path.join(state_dir or STATE_DIR, DB_FILE)
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = Store(db_path)
+            _stores[db_path] = store
+            atexit.register(store.close)
+        return store
+
+def close_store(state_dir: str = None) -> None:
+    """
+    Închide store-ul comun pentru `state_dir` (ex: un state/ temporar șters imediat după).
+    """
+    db_path = os.path.join(state_dir or STATE_DIR, DB_FILE)
+    with _stores_lock:
+        store = _stores.pop(db_path, None)
+    if store is not None:
+        store.close()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import time
@@ -10,9 +11,38 @@ from email.message import EmailMessage
 from email.utils import make_msgid
 
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
-from urllib.request import Request, urlopen
 
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+from trendyol_http import (
+    ApiClient,
+    build_api_url,
+    BLOCK_RESOURCES,
+    HOME_URL,
+    PAGE_RETRIES,
+    accept_cookies,
+    browser_session,
+    is_blocked,
+    is_retryable,
+    listing_coverage,
+    load_cookies,
+    load_storage_state,
+    open_session_page,
+    retry_delay,
+    save_storage_state,
+    warm_up_cookies,
+)
+from trendyol_images import fetch_images
+from trendyol_metrics import metrics, observe, scope, scoped, span
+from trendyol_planner import (
+    listing_fingerprint,
+    plan_listing,
+    remember_fingerprint,
+    should_skip,
+    verify_with_client,
+)
+from trendyol_ratelimit import shared_limiter
+from trendyol_routes import RoutePolicy, RouteStats, install_blocking
 
 # ================= CONFIG =================
 
@@ -29,15 +59,16 @@ UA = (
     "Chrome/121.0.0.0 Safari/537.36"
 )
 
-API_BASE = "https://apigw.trendyol.com/discovery-sfint-search-service/api/search/products"
-API_EXTRA_PARAMS = {
-    "culture": "ro-RO",
-    "storefrontId": "29",
-    "channelId": "1",
-    "pathModel": "sr",
-    "countryCode": "RO",
-    "language": "ro",
-}
+# client HTTP direct (fără Chromium); browserul rămâne doar fallback pe 403/429
+DIRECT_API_MODE = True
+
+# price_max împins în query ca prc=0-<plafon> (prețul fără cod), verificat zilnic
+# față de listingul nelimitat; SLACK acoperă diferențele dintre filtrul API și get_price
+PRICE_PUSHDOWN = True
+PRICE_RANGE_SLACK = 1.15
+
+# categoria e sărită când pagina 1 are aceleași (id, preț) ca la ultima rulare completă
+SKIP_UNCHANGED = True
 
 # ================= EMAIL =================
 
@@ -49,7 +80,8 @@ EMAIL_TO = "bluegaming764@gmail.com"
 EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD", "").strip()
 
 # max imagini inline (restul vor avea doar link)
-MAX_INLINE_IMAGES = 12
+MAX_INLINE_IMAGES = 24
+INLINE_IMAGE_WIDTH = 160  # thumbnail-urile sunt micșorate la lățimea afișată
 
 # ================= CATEGORIES =================
 
@@ -126,20 +158,6 @@ def get_price(p: dict):
             return val
     return None
 
-def accept_cookies(page):
-    for sel in [
-        "//button[contains(., 'Accept')]",
-        "//button[contains(., 'Acceptați')]",
-        "//button[contains(., 'Accept toate')]",
-        "//button[contains(., 'Accept all')]",
-    ]:
-        try:
-            page.locator(sel).click(timeout=2500)
-            page.wait_for_timeout(250)
-            return
-        except Exception:
-            pass
-
 def normalize_image_url(u: str):
     if not u:
         return None
@@ -175,26 +193,11 @@ def extract_image_url(p: dict):
             return u
     return ""
 
-def download_image_bytes(url: str):
-    try:
-        req = Request(url, headers={"User-Agent": UA})
-        with urlopen(req, timeout=20) as r:
-            data = r.read()
-            ctype = r.headers.get_content_type()
-            return data, ctype
-    except Exception:
-        return None, None
-
-def build_api_url(listing_url: str, pi: int) -> str:
-    qs = dict(parse_qsl(urlparse(listing_url).query))
-    qs.update(API_EXTRA_PARAMS)
-    qs["pi"] = str(pi)
-    return API_BASE + "?" + urlencode(qs, doseq=True)
-
-def fetch_products_page(page, listing_url: str, pi: int):
+async def fetch_products_page(page, listing_url: str, pi: int):
     api_url = build_api_url(listing_url, pi)
     js = r"""
     async (u) => {
+      const started = performance.now();
       let resp;
       try {
         resp = await fetch(u, {
@@ -215,15 +218,57 @@ def fetch_products_page(page, listing_url: str, pi: int):
         return { ok:false, status:resp.status, data:null, error:(txt||"").slice(0,300) };
       }
 
+      let txt = "";
+      try { txt = await resp.text(); } catch(e) {}
+      const ms = performance.now() - started;
+      const t0 = performance.now();
       let data = null;
-      try { data = await resp.json(); } catch(e) {}
-      return { ok:true, status:200, data, error:"" };
+      try { data = JSON.parse(txt); } catch(e) {}
+      return { ok:true, status:200, data, error:"", ms, bytes:txt.length, decodeMs:performance.now() - t0 };
     }
     """
-    return page.evaluate(js, api_url)
+    # același limiter ca ApiClient: fetch-ul din pagină pornește tot din Python
+    limiter = shared_limiter()
+    await limiter.acquire_async()
+    started = time.perf_counter()
+    res = await page.evaluate(js, api_url)
+    limiter.feedback(res.get("status"))
+
+    # latența din pagină când există (fără drumul evaluate), altfel cea măsurată din Python
+    status = res.get("status")
+    seconds = res["ms"] / 1000 if res.get("ms") is not None else time.perf_counter() - started
+    observe("api_page", seconds, status=status, nbytes=res.get("bytes") or 0, error=status != 200)
+    if res.get("decodeMs") is not None:
+        observe("json_decode", res["decodeMs"] / 1000)
+    return res
+
+async def fetch_page_with_retry(page, listing_url: str, pi: int, client=None):
+    """
+    O pagină API cu retry-uri proprii (PAGE_RETRIES, backoff cu jitter), fără renavigare.
+    Pe clientul direct 403/429 nu se reîncearcă: categoria trece pe browser.
+    """
+    for attempt in range(PAGE_RETRIES + 1):
+        if client is not None:
+            res = await asyncio.to_thread(client.get_page, listing_url, pi)
+        else:
+            res = await fetch_products_page(page, listing_url, pi)
+        status = res.get("status")
+        retryable = is_retryable(status) or (client is None and is_blocked(status))
+        if res.get("ok") or attempt == PAGE_RETRIES or not retryable:
+            return res
+        await asyncio.sleep(retry_delay(attempt))
+
+# filename -> ((mtime_ns, size), chei); baza se recitește doar când fișierul se schimbă
+_base_cache = {}
 
 def load_base(filename: str) -> set:
     path = os.path.join(STATE_DIR, filename)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _base_cache.get(filename)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
@@ -234,6 +279,7 @@ def load_base(filename: str) -> set:
                 u = p.get("url", "")
                 if u:
                     keys.add(clean_url(u))
+    _base_cache[filename] = (stamp, keys)
     return keys
 
 # ========= THE ONLY send_email (NEW SIGNATURE) =========
@@ -261,7 +307,7 @@ def send_email(subject: str, text_body: str, html_body: str, inline_images: list
         )
 
     ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as s:
+    with span("smtp"), smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as s:
         s.starttls(context=ctx)
         s.login(EMAIL_USER, EMAIL_PASSWORD)
         s.send_message(msg)
@@ -270,14 +316,19 @@ def send_email(subject: str, text_body: str, html_body: str, inline_images: list
 
 # ================= CORE =================
 
-def collect_current(page, cfg):
-    page.goto("https://www.trendyol.com/ro", timeout=120000, wait_until="domcontentloaded")
-    page.wait_for_timeout(900)
-    accept_cookies(page)
+async def collect_current(page, cfg, client=None, has_session=False, first_page=None):
+    # `first_page`: răspunsul deja primit pentru pagina 1 (proba de fingerprint), fără cerere nouă
+    # cu client direct nu mai navigăm deloc; cu sesiune salvată doar pagina-stub de origine
+    if client is None and has_session:
+        await open_session_page(page)
+    elif client is None:
+        with span("navigation"):
+            await page.goto("https://www.trendyol.com/ro", timeout=120000, wait_until="domcontentloaded")
+        await accept_cookies(page)
 
-    page.goto(cfg["listing"], timeout=120000, wait_until="domcontentloaded")
-    page.wait_for_timeout(1200)
-    accept_cookies(page)
+        with span("navigation"):
+            await page.goto(cfg["listing"], timeout=120000, wait_until="domcontentloaded")
+        await accept_cookies(page)
 
     seen = set()
     results = []
@@ -289,15 +340,28 @@ def collect_current(page, cfg):
         "dup": 0,
         "price_none": 0,
         "over_max": 0,
+        "missing_pages": [],
     }
 
+    def finished():
+        # pagini pierdute după retry-uri -> rezultat parțial, nu eșec
+        return results, "partial" if stats["missing_pages"] else "ok", stats
+
     any_batch = False
     over_max_streak = 0
 
     for pi in range(1, MAX_PI + 1):
-        res = fetch_products_page(page, cfg["listing"], pi)
+        if pi == 1 and first_page is not None and first_page.get("ok"):
+            res = first_page
+        else:
+            res = await fetch_page_with_retry(page, cfg["listing"], pi, client)
         if not res.get("ok"):
-            return [], "http_error", {**stats, "http_status": res.get("status"), "error": res.get("error")}
+            blocked = client is not None and is_blocked(res.get("status"))
+            if pi == 1 or blocked:
+                status = "blocked" if blocked else "http_error"
+                return [], status, {**stats, "http_status": res.get("status"), "error": res.get("error")}
+            stats["missing_pages"].append(pi)
+            continue
 
         data = res.get("data") or {}
         batch = data.get("products", []) if isinstance(data, dict) else []
@@ -312,7 +376,7 @@ def collect_current(page, cfg):
 
         for pr in batch:
             if len(results) >= cfg["target"]:
-                return results, "ok", stats
+                return finished()
 
             pid = pr.get("contentId") or pr.get("id") or pr.get("groupId")
             if not pid:
@@ -330,7 +394,7 @@ def collect_current(page, cfg):
                 stats["over_max"] += 1
                 over_max_streak += 1
                 if over_max_streak >= 40 and len(results) > 0:
-                    return results, "ok", stats
+                    return finished()
                 continue
             else:
                 over_max_streak = 0
@@ -347,17 +411,99 @@ def collect_current(page, cfg):
             })
             stats["added"] += 1
 
-        time.sleep(0.4)
-
     if not any_batch:
         return [], "empty_api", stats
     if len(results) == 0:
         return [], "filtered_empty", stats
-    return results, "ok", stats
+    return finished()
+
+def listing_ceiling(cfg) -> float:
+    return round(cfg["price_max"] / (1 - WELCOME_CODE_PERCENT / 100) * PRICE_RANGE_SLACK, 2)
+
+async def plan_category(label, cfg, client=None):
+    """
+    cfg cu listingul rescris de trendyol_planner; verificarea rulează doar cu client direct.
+    """
+    if not PRICE_PUSHDOWN:
+        return cfg
+
+    key = f"top:{label}"
+    high = listing_ceiling(cfg)
+    listing, due = plan_listing(key, cfg["listing"], high)
+    if due and client is not None and listing != cfg["listing"]:
+        ok = await asyncio.to_thread(verify_with_client, client, key, cfg["listing"], listing, high, get_price)
+        if ok is False:
+            return cfg
+    return {**cfg, "listing": listing}
+
+async def collect_with_retries(cfg, page=None, context=None, client=None, has_session=False, first_page=None):
+    """
+    Erorile de pagină se reîncearcă în collect_current; aici se reia totul
+    (cookies curate, navigare nouă) doar când nu s-a obținut nimic.
+    """
+    current = []
+    status = "empty"
+    stats = {}
+
+    for attempt, delay in enumerate(RETRY_DELAYS):
+        if delay:
+            await asyncio.sleep(delay)
+        # sesiunea salvată se încearcă o singură dată; reîncercările pornesc de la zero
+        use_session = has_session and attempt == 0
+        if context is not None and not use_session:
+            await context.clear_cookies()
+        # proba refolosită doar la prima încercare; reîncercările cer din nou pagina 1
+        current, status, stats = await collect_current(page, cfg, client=client, has_session=use_session,
+                                                       first_page=first_page if attempt == 0 else None)
+        if status in ("ok", "partial") and len(current) >= MIN_ITEMS_OK:
+            break
+        # 403/429 pe clientul direct -> nu insistăm, trecem pe browser
+        if status == "blocked":
+            break
+
+    return current, status, stats
+
+async def _launch_browser(p):
+    return await p.chromium.launch(headless=True, args=["--no-sandbox", "--disable-dev-shm-usage"])
+
+async def collect_in_browser(browser, cfg, routes=None):
+    """
+    `routes`: RouteStats comun; dacă e dat, contextul abandonează resursele inutile (trendyol_routes).
+    """
+    session = load_storage_state()
+    context = await browser.new_context(
+        user_agent=UA,
+        locale="ro-RO",
+        timezone_id="Europe/Bucharest",
+        viewport={"width": 1366, "height": 768},
+        storage_state=session,
+    )
+    await context.set_extra_http_headers({"Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7"})
+    if routes is not None:
+        await install_blocking(context, RoutePolicy(HOME_URL), routes)
+    page = await context.new_page()
+    try:
+        collected = await collect_with_retries(cfg, page=page, context=context, has_session=session is not None)
+        # sesiune proaspătă (storage_state + cookies) pentru rularea următoare
+        if collected[1] in ("ok", "partial"):
+            await save_storage_state(context)
+        return collected
+    finally:
+        await context.close()
+
+async def download_images(urls):
+    """
+    Din cache-ul comun de imagini, în paralel; întoarce url -> (bytes, content-type).
+    """
+    return await asyncio.to_thread(fetch_images, urls, width=INLINE_IMAGE_WIDTH)
 
 # ================= MAIN =================
 
-def main():
+async def main_async(browser=None):
+    """
+    `browser`: Chromium deja pornit (daemon / runner comun); None = se lansează unul la nevoie.
+    Întoarce numărul de produse noi și categoriile blocate (pentru sumarul comun din trendyol_run).
+    """
     os.makedirs(STATE_DIR, exist_ok=True)
 
     run_ts = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -371,72 +517,107 @@ def main():
     else:
         summary_lines.append("[DEBUG] state dir missing")
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, args=["--no-sandbox", "--disable-dev-shm-usage"])
-
-        for label, cfg in CATEGORIES.items():
-            base_path = os.path.join(STATE_DIR, cfg["base_file"])
-            if not os.path.exists(base_path):
-                summary_lines.append(f"[{label}] BASE MISSING: {base_path}")
-                blocked_labels.append(label)
-                continue
-
-            try:
-                base_set = load_base(cfg["base_file"])
-            except Exception as e:
-                summary_lines.append(f"[{label}] BASE READ ERROR: {e}")
-                blocked_labels.append(label)
-                continue
+    # bazele se citesc înainte de orice fetch
+    bases = {}
+    for label, cfg in CATEGORIES.items():
+        base_path = os.path.join(STATE_DIR, cfg["base_file"])
+        if not os.path.exists(base_path):
+            summary_lines.append(f"[{label}] BASE MISSING: {base_path}")
+            blocked_labels.append(label)
+            continue
 
-            context = browser.new_context(
-                user_agent=UA,
-                locale="ro-RO",
-                timezone_id="Europe/Bucharest",
-                viewport={"width": 1366, "height": 768},
-            )
-            context.set_extra_http_headers({"Accept-Language": "ro-RO,ro;q=0.9,en-US;q=0.8,en;q=0.7"})
-            page = context.new_page()
-
-            current = []
-            status = "empty"
-            stats = {}
-
-            for delay in RETRY_DELAYS:
-                if delay:
-                    time.sleep(delay)
-                context.clear_cookies()
-                current, status, stats = collect_current(page, cfg)
-                if status == "ok" and len(current) >= MIN_ITEMS_OK:
-                    break
-
-            context.close()
-
-            if status != "ok" or len(current) < MIN_ITEMS_OK:
-                summary_lines.append(
-                    f"[{label}] {status} items={len(current)} | "
-                    f"api_pages={stats.get('api_pages')} batch={stats.get('batch_products')} "
-                    f"added={stats.get('added')} price_none={stats.get('price_none')} "
-                    f"over_max={stats.get('over_max')} dup={stats.get('dup')} "
-                    f"http={stats.get('http_status')} err={stats.get('error','')}"
-                )
-                blocked_labels.append(label)
+        try:
+            bases[label] = load_base(cfg["base_file"])
+        except Exception as e:
+            summary_lines.append(f"[{label}] BASE READ ERROR: {e}")
+            blocked_labels.append(label)
+
+    collected = {}  # label -> (current, status, stats)
+    browser_labels = list(bases)
+
+    # categoriile rulează concurent pe același event loop
+    if DIRECT_API_MODE and bases:
+        cookies = load_cookies()
+        if not cookies:
+            async with browser_session(async_playwright, _launch_browser, browser) as b:
+                cookies = await warm_up_cookies(b, accept_cookies)
+
+        browser_labels = []
+        with ApiClient(cookies) as client:
+            async def collect_direct(label):
+                cfg = await plan_category(label, CATEGORIES[label], client)
+                key = f"top:{label}"
+
+                fingerprint = None
+                probe = None
+                if SKIP_UNCHANGED:
+                    probe = await asyncio.to_thread(client.get_page, cfg["listing"], 1)
+                    if probe.get("ok"):
+                        fingerprint = listing_fingerprint(cfg["listing"], probe.get("data"), get_price)
+                        if await asyncio.to_thread(should_skip, key, fingerprint):
+                            return [], "unchanged", {}
+
+                collected_one = await collect_with_retries(cfg, client=client, first_page=probe)
+                if collected_one[1] == "ok":
+                    await asyncio.to_thread(remember_fingerprint, key, fingerprint)
+                return collected_one
+
+            direct = await asyncio.gather(*(scoped(collect_direct(label), category=label) for label in bases))
+        for label, (current, status, stats) in zip(bases, direct):
+            if status == "blocked":
+                print(f"[DIRECT API] status={stats.get('http_status')} → browser fallback for [{label}]")
+                browser_labels.append(label)
                 continue
-
-            current_set = {p["key"] for p in current}
-            new_items = [p for p in current if p["key"] not in base_set]
-            missing_vs_base = len(base_set - current_set)
-
+            collected[label] = (current, status, stats)
+
+    if browser_labels:
+        async with browser_session(async_playwright, _launch_browser, browser) as b:
+            planned = [await plan_category(label, CATEGORIES[label]) for label in browser_labels]
+            routes = RouteStats() if BLOCK_RESOURCES else None
+            in_browser = await asyncio.gather(*(
+                scoped(collect_in_browser(b, cfg, routes), category=label) for label, cfg in zip(browser_labels, planned)
+            ))
+            collected.update(zip(browser_labels, in_browser))
+            if routes is not None:
+                print(f"[ROUTES] {routes.summary()}")
+
+    print(f"[RATE] {shared_limiter().summary()}")
+
+    for label in bases:
+        base_set = bases[label]
+        current, status, stats = collected[label]
+
+        if status == "unchanged":
+            summary_lines.append(f"[{label}] page 1 unchanged since last full run, skipped")
+            continue
+
+        if status not in ("ok", "partial") or len(current) < MIN_ITEMS_OK:
             summary_lines.append(
-                f"[{label}] OK items={len(current)} new={len(new_items)} missing_vs_base={missing_vs_base} | "
-                f"api_pages={stats.get('api_pages')} batch={stats.get('batch_products')} added={stats.get('added')}"
+                f"[{label}] {status} items={len(current)} | "
+                f"api_pages={stats.get('api_pages')} batch={stats.get('batch_products')} "
+                f"added={stats.get('added')} price_none={stats.get('price_none')} "
+                f"over_max={stats.get('over_max')} dup={stats.get('dup')} "
+                f"http={stats.get('http_status')} err={stats.get('error','')}"
             )
+            blocked_labels.append(label)
+            continue
 
-            for it in new_items:
-                all_new_items.append((label, it))
+        current_set = {p["key"] for p in current}
+        new_items = [p for p in current if p["key"] not in base_set]
+        missing_vs_base = len(base_set - current_set)
 
-            time.sleep(1)
+        if status == "partial":
+            coverage = listing_coverage({"pages_ok": stats["api_pages"], "missing_pages": stats["missing_pages"]})
+            head = f"PARTIAL coverage={coverage:.0%} lost_pages={stats['missing_pages']}"
+        else:
+            head = "OK"
+        summary_lines.append(
+            f"[{label}] {head} items={len(current)} new={len(new_items)} missing_vs_base={missing_vs_base} | "
+            f"api_pages={stats.get('api_pages')} batch={stats.get('batch_products')} added={stats.get('added')}"
+        )
 
-        browser.close()
+        for it in new_items:
+            all_new_items.append((label, it))
 
     # ===== SUBJECT =====
     parts = [f"NEW {len(all_new_items)}" if all_new_items else "NO NEW"]
@@ -483,6 +664,14 @@ def main():
     cid_map = {}
     shown = 0
 
+    # primele MAX_INLINE_IMAGES imagini se descarcă în paralel, înainte de randare
+    inline_candidates = []
+    for _, it in all_new_items:
+        img_url = (it.get("image") or "").strip()
+        if img_url and img_url not in inline_candidates:
+            inline_candidates.append(img_url)
+    prefetched = await download_images(inline_candidates[:MAX_INLINE_IMAGES])
+
     if all_new_items:
         html_lines.append(f"<h3>NEW ITEMS TOTAL: {len(all_new_items)}</h3>")
         for label, it in all_new_items:
@@ -494,7 +683,7 @@ def main():
             # inline doar primele MAX_INLINE_IMAGES
             if img_url and shown < MAX_INLINE_IMAGES:
                 if img_url not in cid_map:
-                    data, ctype = download_image_bytes(img_url)
+                    data, ctype = prefetched.get(img_url) or (None, None)
                     if data and ctype and ctype.startswith("image/"):
                         maintype, subtype = ctype.split("/", 1)
                         cid = make_msgid()
@@ -509,7 +698,7 @@ def main():
                 if img_url in cid_map:
                     img_html = (
                         f"<img src='cid:{cid_map[img_url]}' "
-                        f"style='width:160px;height:auto;border-radius:10px;display:block;margin:6px 0;'>"
+                        f"style='width:{INLINE_IMAGE_WIDTH}px;height:auto;border-radius:10px;display:block;margin:6px 0;'>"
                     )
                     shown += 1
             # pentru restul, arătăm doar link către imagine (dacă există)
@@ -531,13 +720,22 @@ def main():
     else:
         html_lines.append("<h3>NO NEW ITEMS found this run.</h3>")
 
-    send_email(
+    await asyncio.to_thread(
+        send_email,
         subject=subject,
         text_body="\n".join(text_lines),
         html_body="\n".join(html_lines),
         inline_images=inline_images,
     )
 
+    return {"new": len(all_new_items), "blocked": blocked_labels}
+
+def main():
+    with scope(job="top_search"):
+        asyncio.run(main_async())
+    report, prom = metrics().export()
+    print(f"[METRICS] {report} | {prom}")
+
 if __name__ == "__main__":
     main()
 